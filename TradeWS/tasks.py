@@ -1,53 +1,123 @@
-import json
-from datetime import datetime
+import time
 
 import redis
+from django.db import DataError, IntegrityError, transaction
 from django.utils import timezone
 
 from TradeWS.celery import app
-from TradeWS.variables import REDIS_HOST, REDIS_PORT, SYMBOLS
+from TradeWS.variables import REDIS_HOST, REDIS_PORT, BAR_SOURCE, PERSIST_RAW_TRADES
+from api.bars import close_bars, drain_trades, release_bars, fail_bars
+from api.broadcast import bar_frames, publish_tick
+from api.cache import history_cache
+from api.latest import store_latest_bars
 from api.models import Trade, TickerAggregate
+from api.partitions import maintain_partitions
+from api.rollups import BASE_INTERVAL, rollup_bars
+from api.symbols import get_symbols
+
+BAD_BAR_ERRORS = (DataError, IntegrityError, ArithmeticError)  # caused by the bars themselves, e.g. a numeric overflow
 
 
 @app.task
 def aggregate_trades():
-    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-
-    for symbol in SYMBOLS:
-        trades_key = f"trades:{symbol}"
-        trades = r.lrange(trades_key, 0, -1)
-
-        if trades:
-            trade_data = [json.loads(trade) for trade in trades]
-            prices = [float(trade["price"]) for trade in trade_data]
-            quantities = [float(trade["quantity"]) for trade in trade_data]
-            trade_times = [datetime.fromtimestamp(int(trade["trade_time"]) / 1000) for trade in trade_data]
-
-            start_time = min(trade_times)
-            end_time = max(trade_times)
-            open_price = prices[0]
-            close_price = prices[-1]
-            high_price = max(prices)
-            low_price = min(prices)
-            volume = sum(quantities)
-
-            TickerAggregate.objects.create(
-                symbol=symbol.upper(),
-                start_time=start_time,
-                end_time=end_time,
-                open_price=open_price,
-                close_price=close_price,
-                high_price=high_price,
-                low_price=low_price,
-                volume=volume
-            )  # save the aggregated data to the database
-
-            avg_price = sum(prices) / len(prices)
-            Trade.objects.create(
+    now = timezone.now()
+    now_ms = int(time.time() * 1000)
+    aggregates = []
+    trades = []
+
+    if BAR_SOURCE == "trades":  # raw trades of finished buckets, records may be binary
+        source = "trades"
+        r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+        bars = drain_trades(r, get_symbols(), now_ms)
+    else:  # finished bars kept up to date by the listener or aggregate_stream
+        source = "bars"
+        r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        bars = close_bars(r, get_symbols(), now_ms)
+
+    for symbol, bar in bars:
+        aggregates.append(TickerAggregate(
+            symbol=symbol.upper(),
+            interval=BASE_INTERVAL,
+            start_time=bar["start_time"],
+            end_time=bar["end_time"],
+            open_price=bar["open_price"],
+            close_price=bar["close_price"],
+            high_price=bar["high_price"],
+            low_price=bar["low_price"],
+            volume=bar["volume"],
+            buy_volume=bar["buy_volume"],
+            vwap=bar["vwap"],
+            trade_count=bar["trade_count"],
+        ))
+        if not PERSIST_RAW_TRADES:  # otherwise the real trades are stored by persist_trades
+            trades.append(Trade(
                 symbol=symbol.upper(),
-                price=avg_price,
-                trade_time=timezone.now(),
-                quantity=volume
-            )  # save average price of trades to the database
+                price=bar["avg_price"],
+                trade_time=now,
+                quantity=bar["volume"]
+            ))  # average price of trades
+
+    if not aggregates:
+        return
+
+    try:
+        try:
+            failed = store_bars(r, bars, source, aggregates, trades)
+        except BAD_BAR_ERRORS:  # one symbol must not hold back the others: again, each symbol in its own savepoint
+            failed = store_bars(r, bars, source, aggregates, trades, per_symbol=True)
+    except Exception:
+        release_bars(r, bars, source, retry=True)  # taken again by the next tick
+        raise
+    for symbol, error in failed.items():  # retried by the next ticks, up to BAR_MAX_ATTEMPTS times
+        fail_bars(r, [(bar_symbol, bar) for bar_symbol, bar in bars if bar_symbol.upper() == symbol], source, error)
+
 
-            r.delete(trades_key)  # clear the trades from Redis
+def store_bars(r, bars, source, aggregates, trades, per_symbol=False):
+    """
+    Stores the bars of a tick and their rollups in one transaction, the bars leave Redis and are published
+    once it is committed. With `per_symbol` every symbol gets a savepoint, the symbols whose bars fail
+    are left out. Returns {symbol (upper case): error} of those.
+    """
+    failed = {}
+    with transaction.atomic():
+        if per_symbol:
+            rollups = []
+            for row in aggregates + trades:  # ids given by the insert that was rolled back
+                row.pk = None
+            for symbol in dict.fromkeys(aggregate.symbol for aggregate in aggregates):
+                try:
+                    with transaction.atomic():
+                        rollups += _store_bars(
+                            [aggregate for aggregate in aggregates if aggregate.symbol == symbol],
+                            [trade for trade in trades if trade.symbol == symbol],
+                        )
+                except BAD_BAR_ERRORS as e:
+                    failed[symbol] = e
+            bars = [(symbol, bar) for symbol, bar in bars if symbol.upper() not in failed]
+            aggregates = [aggregate for aggregate in aggregates if aggregate.symbol not in failed]
+        else:
+            rollups = _store_bars(aggregates, trades)
+        transaction.on_commit(lambda: release_bars(r, bars, source))  # the bars leave Redis once stored
+        if aggregates:  # nothing is published on rollback
+            transaction.on_commit(lambda: publish_bars(r, aggregates, rollups))
+    return failed
+
+
+def _store_bars(aggregates, trades):
+    TickerAggregate.objects.bulk_create(aggregates)
+    Trade.objects.bulk_create(trades)
+    return rollup_bars(aggregates)  # 5m, 1h, ... bars are updated from the new bars, not recomputed
+
+
+def publish_bars(r, aggregates, rollups):  # once per tick, after the bars are committed
+    history_cache.invalidate({aggregate.symbol for aggregate in aggregates})  # cached history of these symbols is stale
+    frames = bar_frames(aggregates + rollups)  # encoded once per bar, not per subscriber
+    store_latest_bars(r, frames)  # snapshots for WebSocket clients
+    closed_at_ms = max(aggregate.end_time for aggregate in aggregates).timestamp() * 1000
+    publish_tick(r, frames, closed_at_ms)  # to the subscribers of every symbol and interval
+
+
+@app.task
+def manage_partitions():  # daily: partitions ahead of time and retention, see api.partitions
+    return {table: {"created": created, "dropped": dropped}
+            for table, (created, dropped) in maintain_partitions().items()}
@@ -13,10 +13,49 @@ def get_env_variable(var_name: str):
 
 
 BINANCE_WS_URL = get_env_variable("BINANCE_WS_URL")
+BINANCE_REST_URL = os.environ.get("BINANCE_REST_URL", "https://api.binance.com")  # aggTrades for backfills
 REDIS_HOST = get_env_variable("REDIS_HOST")
 REDIS_PORT = int(get_env_variable("REDIS_PORT"))
 
 CELERY_BROKER_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/0'
 
-TIME_INTERVAL = get_env_variable("TIME_INTERVAL")  # for how long to keep trades in Redis (in seconds)
-SYMBOLS = ["btcusdt", "ethusdt"]  # list of symbols to listen to
+TIME_INTERVAL = int(get_env_variable("TIME_INTERVAL"))  # for how long to keep trades in Redis (in seconds)
+SYMBOLS = [
+    symbol.strip().lower() for symbol in os.environ.get("SYMBOLS", "btcusdt,ethusdt").split(",") if symbol.strip()
+]  # list of symbols to listen to, used when no symbols are enabled in the admin
+STREAMS_PER_CONNECTION = int(os.environ.get("STREAMS_PER_CONNECTION", 200))  # Binance allows up to 1024 streams per connection
+LISTENER_SHARDS = int(os.environ.get("LISTENER_SHARDS", 1))  # listener processes, each handles its own part of the symbols
+
+REDIS_WRITE_QUEUE_SIZE = int(os.environ.get("REDIS_WRITE_QUEUE_SIZE", 10000))  # max trades waiting to be written to Redis
+REDIS_WRITE_BATCH_SIZE = int(os.environ.get("REDIS_WRITE_BATCH_SIZE", 500))  # flush to Redis once this many trades are buffered
+REDIS_WRITE_FLUSH_MS = int(os.environ.get("REDIS_WRITE_FLUSH_MS", 5))  # or once the oldest buffered trade is this old (in ms)
+STORE_RAW_TRADES = os.environ.get("STORE_RAW_TRADES", "False").lower() in ("1", "true", "yes")  # keep raw trade lists next to the running bars
+BAR_INTERVAL = int(os.environ.get("BAR_INTERVAL", 60))  # length of an aggregated bar (in seconds), bars are aligned to the epoch
+BAR_CLOSE_GRACE_MS = int(os.environ.get("BAR_CLOSE_GRACE_MS", 2000))  # how long to wait for late trades before closing a bar (in ms)
+BAR_MAX_ATTEMPTS = int(os.environ.get("BAR_MAX_ATTEMPTS", 5))  # a closed bar that fails to be stored this many times is moved to the "bars:dead" list in Redis
+TRADE_RECORD_FORMAT = os.environ.get("TRADE_RECORD_FORMAT", "json")  # raw trades in Redis: "json" or compact "binary"
+BAR_SOURCE = os.environ.get("BAR_SOURCE", "bars")  # "bars": running bars kept by the listener, "trades": build bars from raw trades, "stream": running bars kept by aggregate_stream
+ROLLUP_INTERVALS = [
+    interval.strip() for interval in os.environ.get("ROLLUP_INTERVALS", "5m,15m,1h,1d").split(",") if interval.strip()
+]  # coarser bars built from closed BAR_INTERVAL bars, each must be a multiple of it
+HISTORY_CACHE_TTL = int(os.environ.get("HISTORY_CACHE_TTL", 300))  # how long to keep rendered history pages in Redis (in seconds), 0 - off
+LIVE_PUBLISH_HZ = float(os.environ.get("LIVE_PUBLISH_HZ", 10))  # how often the listener publishes in-progress bars, 0 - off
+LIVE_MAX_HZ = float(os.environ.get("LIVE_MAX_HZ", 10))  # max live updates per second and symbol sent to a WebSocket client, 0 - live subscriptions off
+WS_SEND_QUEUE_SIZE = int(os.environ.get("WS_SEND_QUEUE_SIZE", 256))  # max frames waiting to be sent to one WebSocket client
+WS_SEND_POLICY = os.environ.get("WS_SEND_POLICY", "conflate")  # full queue: "conflate" - replace older frames, "drop" - drop new ones
+WS_SLOW_CONSUMER_SECONDS = float(os.environ.get("WS_SLOW_CONSUMER_SECONDS", 10))  # disconnect a client whose queue stays full this long
+WS_SEND_BUFFER_BYTES = int(os.environ.get("WS_SEND_BUFFER_BYTES", 1048576))  # frames wait in the queue while Daphne buffers more than this for the client
+PARTITION_PERIOD = os.environ.get("PARTITION_PERIOD", "month")  # PostgreSQL partitions of trades and bars: "month" or "day"
+PARTITIONS_AHEAD = int(os.environ.get("PARTITIONS_AHEAD", 3))  # partitions created ahead of the current one
+TRADE_RETENTION_DAYS = int(os.environ.get("TRADE_RETENTION_DAYS", 0))  # drop trade partitions older than this, 0 - keep
+BAR_RETENTION_DAYS = int(os.environ.get("BAR_RETENTION_DAYS", 0))  # drop bar partitions older than this, 0 - keep
+PERSIST_RAW_TRADES = os.environ.get("PERSIST_RAW_TRADES", "False").lower() in ("1", "true", "yes")  # store every trade with the persist_trades command
+PERSIST_BATCH_SIZE = int(os.environ.get("PERSIST_BATCH_SIZE", 50000))  # max trades per COPY
+TRADE_STREAM_RETENTION_SECONDS = int(os.environ.get("TRADE_STREAM_RETENTION_SECONDS", 3600))  # how long entries are kept in the trade stream
+TRADE_STREAM_BATCH = int(os.environ.get("TRADE_STREAM_BATCH", 100))  # max stream entries per XREADGROUP
+TRADE_STREAM_CLAIM_IDLE_MS = int(os.environ.get("TRADE_STREAM_CLAIM_IDLE_MS", 60000))  # pending entries idle this long are taken over by another consumer
+LISTENER_BACKOFF_SECONDS = float(os.environ.get("LISTENER_BACKOFF_SECONDS", 1))  # first reconnect delay, doubles up to LISTENER_BACKOFF_MAX_SECONDS
+LISTENER_BACKOFF_MAX_SECONDS = float(os.environ.get("LISTENER_BACKOFF_MAX_SECONDS", 60))  # max reconnect delay (before jitter)
+LISTENER_PING_SECONDS = float(os.environ.get("LISTENER_PING_SECONDS", 5))  # ping interval and timeout of Binance connections, a dead one is noticed within twice that
+BACKFILL_MAX_SECONDS = int(os.environ.get("BACKFILL_MAX_SECONDS", 600))  # longer gaps are not backfilled, bars are held open at most this long
+BACKFILL_CONCURRENCY = int(os.environ.get("BACKFILL_CONCURRENCY", 4))  # aggTrades requests in flight per listener process
@@ -1,20 +1,28 @@
 from django.contrib import admin
 
-from api.models import Trade, TickerAggregate
+from api.models import Trade, TickerAggregate, TrackedSymbol
 
 
 class TradeAdmin(admin.ModelAdmin):
-    list_display = ('symbol', 'price', 'quantity', 'trade_time')
+    list_display = ('symbol', 'price', 'quantity', 'trade_time', 'trade_id')
     search_fields = ('symbol', 'trade_time')
     list_filter = ('symbol', 'trade_time')
 
 
 class TickerAggregateAdmin(admin.ModelAdmin):
-    list_display = ('symbol', 'start_time', 'end_time', 'open_price', 'close_price', 'high_price', 'low_price', 'volume')
+    list_display = ('symbol', 'interval', 'start_time', 'end_time', 'open_price', 'close_price', 'high_price', 'low_price',
+                    'volume', 'vwap', 'trade_count')
     search_fields = ('symbol', 'start_time')
-    list_filter = ('symbol', 'start_time')
+    list_filter = ('symbol', 'interval', 'start_time')
+
+
+class TrackedSymbolAdmin(admin.ModelAdmin):
+    list_display = ('name', 'is_active')
+    search_fields = ('name',)
+    list_filter = ('is_active',)
 
 
 admin.site.register(Trade, TradeAdmin)
 admin.site.register(TickerAggregate, TickerAggregateAdmin)
+admin.site.register(TrackedSymbol, TrackedSymbolAdmin)
 
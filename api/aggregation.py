@@ -0,0 +1,67 @@
+"""
+Vectorized bar aggregation over trade arrays (codecs.RECORD_DTYPE: scaled integer price/quantity,
+trade time in ms, buyer-maker flag). Used by aggregate_trades for raw trades and by backfills,
+which can aggregate many bars in one call.
+"""
+import numpy as np
+
+from api.fixedpoint import mul_scaled_array, sum_scaled
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+def aggregate_bars(trades, interval_ms, quantiles=QUANTILES):
+    """
+    Splits the trades into epoch-aligned buckets of `interval_ms` and aggregates every bucket at once.
+    Trades may come in any order, ties in trade time keep their arrival order for open/close.
+    Returns a dict of arrays with one element (row for "quantiles") per non-empty bucket.
+    Prices and volumes (quote_volume too) stay exact scaled integers, only vwap is a float in quote currency.
+    Sums too large for int64 are object arrays of Python ints (see fixedpoint.sum_scaled).
+    """
+    trade_times = trades["trade_time"]
+    if (np.diff(trades["trade_time"]) < 0).any():  # usually already in time order
+        trades = trades[np.argsort(trades["trade_time"], kind="stable")]
+        trade_times = trades["trade_time"]
+    prices = trades["price"]
+    quantities = trades["quantity"]
+    is_buyer_maker = trades["is_buyer_maker"]
+
+    buckets = trade_times - trade_times % interval_ms
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.append(starts[1:], len(buckets))
+    counts = ends - starts
+
+    volume = sum_scaled(quantities, starts)
+    buy_volume = sum_scaled(np.where(is_buyer_maker, 0, quantities), starts)  # buyer is taker
+    quote_volume = sum_scaled(mul_scaled_array(prices, quantities), starts)
+
+    # quantiles: prices sorted inside every bucket, buckets stay in the same place
+    positions = starts[:, None] + np.floor(np.outer(counts - 1, quantiles)).astype(np.int64)
+    if len(starts) == 1:
+        sorted_prices = np.partition(prices, np.unique(positions))  # only the quantile positions are needed
+    else:
+        sorted_prices = prices[np.lexsort((prices, buckets))]
+
+    return {
+        "bucket": buckets[starts],
+        "open": prices[starts],
+        "high": np.maximum.reduceat(prices, starts),
+        "low": np.minimum.reduceat(prices, starts),
+        "close": prices[ends - 1],
+        "volume": volume,
+        "buy_volume": buy_volume,
+        "sell_volume": volume - buy_volume,
+        "quote_volume": quote_volume,
+        "price_sum": sum_scaled(prices, starts),
+        "vwap": np.divide(
+            quote_volume.astype(np.float64), volume.astype(np.float64), out=np.zeros(len(volume)), where=volume > 0,
+        ),
+        "count": counts,
+        "open_time": trade_times[starts],
+        "close_time": trade_times[ends - 1],
+        "quantiles": sorted_prices[positions],
+    }
+
+
+def aggregate(trades, interval_ms, quantiles=QUANTILES):  # single bar, trades of one bucket
+    return {key: values[0] for key, values in aggregate_bars(trades, interval_ms, quantiles).items()}
@@ -0,0 +1,230 @@
+"""
+Recovery of trades missed while the listener was disconnected from Binance.
+GapFiller sits between the socket loops and RedisTradeWriter and remembers the last trade id of every symbol.
+When a connection drops, the bars of its symbols are held open (api.bars.hold_key), so aggregate_trades
+does not close them with trades missing. After the reconnect the missed range is fetched from the aggTrades
+REST endpoint, one task per symbol and at most BACKFILL_CONCURRENCY at a time, while the symbol's live trades wait.
+Then the live trades resume, those already backfilled are dropped by their trade id. The hold is released
+once the writer has flushed the backfilled trades, with BAR_SOURCE = "stream" once the "bars" group merged them too.
+An aggregate trade merges the fills of one taker order at one price, so backfilled bars have exact prices
+and volumes but may count fewer trades. An aggregate trade whose first fills were seen before the gap is kept
+without them (GapFiller.tail). Aggregate trades only go into the bars, persist_trades skips them:
+stored as raw trades under the id of their first fill they would double the volume of any later import of the fills.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from decimal import Decimal
+
+import requests
+from redis.exceptions import RedisError
+
+from TradeWS.variables import (
+    BINANCE_REST_URL, BACKFILL_MAX_SECONDS, BACKFILL_CONCURRENCY, LISTENER_BACKOFF_SECONDS,
+    LISTENER_BACKOFF_MAX_SECONDS,
+)
+from api.bars import BAR_INTERVAL_MS, bucket_start, hold_key
+from api.codecs import BinanceTrade
+from api.streams import BARS_GROUP, group_processed
+
+AGG_TRADES_PATH = "/api/v3/aggTrades"
+AGG_TRADES_LIMIT = 1000  # max aggregate trades per request
+AGG_TRADES_WINDOW_MS = 3600 * 1000  # startTime and endTime may be at most an hour apart
+RETRY_STATUSES = (418, 429, 500, 502, 503, 504)  # rate limits and server errors
+MAX_ATTEMPTS = 5
+STREAM_POLL_SECONDS = 0.2  # how often the "bars" group is checked before a hold is released
+BACKFILL_STATS_KEY = "stats:backfill"
+
+
+class Backoff:
+    """Exponential backoff with full jitter: the n-th delay is random between 0 and min(cap, base * 2 ** n)."""
+
+    def __init__(self, base=LISTENER_BACKOFF_SECONDS, cap=LISTENER_BACKOFF_MAX_SECONDS):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def next_delay(self):
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** self.attempt))
+        self.attempt += 1
+        return delay
+
+    def reset(self):
+        self.attempt = 0
+
+
+class BackfillError(Exception):
+    pass
+
+
+def fetch_agg_trades(session, symbol, params, base_url=BINANCE_REST_URL, backoff=None):
+    """One page of aggTrades, retried on rate limits (after Retry-After), server and network errors."""
+    backoff = backoff or Backoff(base=0.5, cap=10)
+    for _ in range(MAX_ATTEMPTS):
+        delay = backoff.next_delay()
+        try:
+            response = session.get(
+                f"{base_url}{AGG_TRADES_PATH}", params={"symbol": symbol.upper(), "limit": AGG_TRADES_LIMIT, **params},
+                timeout=10,
+            )
+        except requests.RequestException as e:
+            error = str(e)
+        else:
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code not in RETRY_STATUSES:
+                raise BackfillError(f"{symbol}: aggTrades returned {response.status_code} {response.text[:200]}")
+            error = f"HTTP {response.status_code}"
+            delay = max(delay, float(response.headers.get("Retry-After", 0)))
+        time.sleep(delay)
+    raise BackfillError(f"{symbol}: aggTrades failed {MAX_ATTEMPTS} times, last error: {error}")
+
+
+def missed_trades(symbol, after_id, after_time, stop_id=lambda: None, base_url=BINANCE_REST_URL, seen=None):
+    """
+    Trades after trade `after_id` (made at `after_time`, ms) as [(BinanceTrade, id of its last fill)] in order.
+    Pages through aggTrades until it is caught up with the present or with `stop_id()`,
+    the id of the first live trade received since (None while there is none).
+    An aggregate trade with fills up to `after_id` keeps the rest: the quantities of `seen` ({trade id: quantity}
+    of the last live trades) are subtracted and it gets the id of its first fill after `after_id`.
+    """
+    missed = []
+    seen = seen or {}
+    params = {"startTime": after_time, "endTime": after_time + AGG_TRADES_WINDOW_MS - 1}  # then page by id
+    with requests.Session() as session:
+        while True:
+            page = fetch_agg_trades(session, symbol, params, base_url)
+            for agg in page:
+                if agg["l"] <= after_id:  # seen before the gap
+                    continue
+                first_id, quantity = agg["f"], agg["q"]
+                if first_id <= after_id:
+                    rest = Decimal(quantity) - sum(
+                        Decimal(seen_quantity) for trade_id, seen_quantity in seen.items()
+                        if first_id <= trade_id <= after_id
+                    )
+                    if rest <= 0:
+                        continue
+                    first_id, quantity = after_id + 1, str(rest)
+                missed.append((BinanceTrade(symbol.upper(), agg["p"], quantity, agg["T"], first_id, agg["m"]), agg["l"]))
+            stop = stop_id()
+            if len(page) < AGG_TRADES_LIMIT or (stop is not None and page[-1]["l"] >= stop):
+                return missed
+            params = {"fromId": page[-1]["a"] + 1}
+
+
+class GapFiller:
+    """
+    Passes trades to `writer` (RedisTradeWriter) and backfills the gaps of reconnected symbols, see the module.
+    `hold` is called when a connection drops, `recover` once it is subscribed again.
+    """
+
+    def __init__(self, writer, base_url=BINANCE_REST_URL, concurrency=BACKFILL_CONCURRENCY,
+                 max_gap_seconds=BACKFILL_MAX_SECONDS, log=None):
+        self.writer = writer
+        self.base_url = base_url
+        self.requests = asyncio.Semaphore(concurrency)
+        self.max_gap_seconds = max_gap_seconds
+        self.log = log  # called with a message when a backfill fails
+        self.last = {}  # symbol -> (trade id, trade time) of the last trade passed to the writer
+        # symbol -> ((price, time, buyer is maker), {trade id: quantity}) of the last live trades that may be fills
+        # of one aggregate trade, so an aggregate trade split by the gap is backfilled without them
+        self.tail = {}
+        self.waiting = {}  # symbol -> live trades held back while its gap is backfilled
+        self.tasks = set()
+
+    async def put(self, symbol, trade):
+        waiting = self.waiting.get(symbol)
+        if waiting is not None:
+            waiting.append(trade)
+            return
+        await self._put(symbol, trade)
+
+    async def _put(self, symbol, trade, last_id=None):  # False for a trade that was already written
+        last = self.last.get(symbol)
+        if last is not None and trade.trade_id <= last[0]:
+            return False
+        self.last[symbol] = (last_id or trade.trade_id, trade.trade_time)
+        if last_id is None:
+            fill = (trade.price, trade.trade_time, trade.is_buyer_maker)
+            tail = self.tail.get(symbol)
+            if tail is None or tail[0] != fill:
+                tail = self.tail[symbol] = (fill, {})
+            tail[1][trade.trade_id] = trade.quantity
+        else:
+            self.tail.pop(symbol, None)  # ends with a whole aggregate trade
+        await self.writer.put(symbol, trade, aggregated=last_id is not None)  # only backfilled trades have a last id
+        return True
+
+    async def hold(self, symbols):  # keeps the bars from the last trade on open until the gap is backfilled
+        held = {
+            symbol: bucket_start(self.last[symbol][1]) - BAR_INTERVAL_MS for symbol in symbols if symbol in self.last
+        }
+        if not held:
+            return
+        try:
+            async with self.writer.redis.pipeline(transaction=False) as pipe:
+                for symbol, bucket in held.items():
+                    pipe.set(hold_key(symbol), bucket, ex=self.max_gap_seconds, nx=True)  # the earliest hold stays
+                await pipe.execute()
+        except RedisError:
+            pass  # bars of the gap may be closed before it is backfilled, its trades are then counted as late
+
+    def recover(self, symbols):  # after a reconnect: backfills the symbols seen before, in the background
+        for symbol in symbols:
+            if symbol in self.last and symbol not in self.waiting:
+                self.waiting[symbol] = deque()
+                task = asyncio.create_task(self._backfill(symbol))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+    async def _backfill(self, symbol):
+        after_id, after_time = self.last[symbol]
+        waiting = self.waiting[symbol]
+        stats = {"gaps": 1, "backfilled": 0, "duplicates": 0, "skipped": 0, "errors": 0}
+        missed = []
+        try:
+            if time.time() * 1000 - after_time > self.max_gap_seconds * 1000:
+                stats["skipped"] = 1  # its bars are closed already
+            else:
+                seen = dict(self.tail.get(symbol, (None, {}))[1])
+                async with self.requests:
+                    missed = await asyncio.to_thread(
+                        missed_trades, symbol, after_id, after_time, lambda: waiting[0].trade_id if waiting else None,
+                        self.base_url, seen,
+                    )
+        except Exception as e:  # the live trades must not wait forever, the gap is then left as it is
+            stats["errors"] = 1
+            if self.log is not None:
+                self.log(f"Backfill failed: {e}")
+
+        try:
+            for trade, last_id in missed:
+                stats["backfilled"] += await self._put(symbol, trade, last_id)
+            while waiting:  # the symbol stays in self.waiting until they are all written, so the order is kept
+                stats["duplicates"] += not await self._put(symbol, waiting.popleft())
+        finally:
+            del self.waiting[symbol]
+        await self._release(symbol, stats)
+
+    async def _written(self):  # until the trades put so far are in the bars
+        await self.writer.wait_flushed()
+        entry_id = self.writer.last_entry_id
+        if self.writer.bar_source == "stream" and entry_id is not None:  # merged by aggregate_stream
+            while not await group_processed(self.writer.redis, BARS_GROUP, entry_id):
+                await asyncio.sleep(STREAM_POLL_SECONDS)
+
+    async def _release(self, symbol, stats):
+        try:  # closing the bars before the backfilled trades are in them would count those as late
+            await asyncio.wait_for(self._written(), self.max_gap_seconds)
+        except (asyncio.TimeoutError, RedisError):
+            pass  # the hold would have expired by now anyway
+        try:
+            async with self.writer.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(hold_key(symbol))
+                for name, value in stats.items():
+                    pipe.hincrby(BACKFILL_STATS_KEY, name, value)
+                await pipe.execute()
+        except RedisError:
+            pass  # the hold expires after max_gap_seconds
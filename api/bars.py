@@ -0,0 +1,350 @@
+import json
+from datetime import datetime, timezone
+
+from TradeWS.variables import BAR_INTERVAL, BAR_CLOSE_GRACE_MS, BAR_MAX_ATTEMPTS
+from api.aggregation import aggregate
+from api.codecs import decode_trade_records
+from api.fixedpoint import to_scaled, from_scaled, mul_scaled, div_scaled
+
+BAR_INTERVAL_MS = BAR_INTERVAL * 1000
+BAR_KEY_VERSION = 2  # bumped when the fields of running bars change type, 2 - fixed-point integers (HINCRBY)
+PENDING_LEASE_MS = 300000  # a tick that took bars and neither committed nor released them by then has died
+DEAD_BARS_KEY = "bars:dead"  # list of bars that failed to be stored BAR_MAX_ATTEMPTS times, see fail_bars
+
+# Merges a partial bar (built from one batch of trades) into the running bar of its time bucket.
+# Prices and volumes are fixed-point integers (see api.fixedpoint), so the sums are exact.
+# KEYS[1] - bar hash, KEYS[2] - index of open buckets (zset), KEYS[3] - last closed bucket
+# ARGV - bucket, open, high, low, close, volume, quote_volume, buy_volume, price_sum, count, open_time, close_time
+# Returns -1 if the bucket is already closed (late trades), so nothing is counted twice.
+MERGE_BAR_SCRIPT = """
+local key = KEYS[1]
+local closed = redis.call('GET', KEYS[3])
+if closed and tonumber(ARGV[1]) <= tonumber(closed) then
+    return -1
+end
+redis.call('ZADD', KEYS[2], ARGV[1], ARGV[1])
+
+if redis.call('EXISTS', key) == 0 then
+    redis.call('HSET', key,
+        'open', ARGV[2], 'high', ARGV[3], 'low', ARGV[4], 'close', ARGV[5],
+        'volume', ARGV[6], 'quote_volume', ARGV[7], 'buy_volume', ARGV[8], 'price_sum', ARGV[9], 'count', ARGV[10],
+        'open_time', ARGV[11], 'close_time', ARGV[12])
+    return 1
+end
+
+local bar = redis.call('HMGET', key, 'high', 'low', 'open_time', 'close_time')
+if tonumber(ARGV[3]) > tonumber(bar[1]) then
+    redis.call('HSET', key, 'high', ARGV[3])
+end
+if tonumber(ARGV[4]) < tonumber(bar[2]) then
+    redis.call('HSET', key, 'low', ARGV[4])
+end
+if tonumber(ARGV[11]) < tonumber(bar[3]) then
+    redis.call('HSET', key, 'open', ARGV[2], 'open_time', ARGV[11])
+end
+if tonumber(ARGV[12]) >= tonumber(bar[4]) then
+    redis.call('HSET', key, 'close', ARGV[5], 'close_time', ARGV[12])
+end
+redis.call('HINCRBY', key, 'volume', ARGV[6])
+redis.call('HINCRBY', key, 'quote_volume', ARGV[7])
+redis.call('HINCRBY', key, 'buy_volume', ARGV[8])
+redis.call('HINCRBY', key, 'price_sum', ARGV[9])
+redis.call('HINCRBY', key, 'count', ARGV[10])
+return 0
+"""
+
+# Closes every bar with bucket <= ARGV[1]: moves it from the open index to the pending one and moves
+# the closed watermark forward. Bars stay in Redis until release_bars, once the tick is committed.
+# Returns the pending bars that are not leased: the ones just closed and those of a tick that failed
+# or died, leased to this tick until ARGV[4].
+# KEYS[1] - index of open buckets (zset), KEYS[2] - last closed bucket, KEYS[3] - hold (see hold_key),
+# KEYS[4] - index of pending buckets (zset, score - lease end)
+# ARGV[1] - cutoff bucket, ARGV[2] - bar key prefix, ARGV[3] - now (ms), ARGV[4] - lease end (ms)
+# Returns a flat list: bucket, bar fields, bucket, bar fields, ...
+CLOSE_BARS_SCRIPT = """
+local cutoff = ARGV[1]
+local hold = redis.call('GET', KEYS[3])
+if hold and tonumber(hold) < tonumber(cutoff) then
+    cutoff = hold
+end
+for _, bucket in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', cutoff)) do
+    redis.call('ZADD', KEYS[4], 0, bucket)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', cutoff)
+
+local bars = {}
+for _, bucket in ipairs(redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', ARGV[3])) do
+    local fields = redis.call('HGETALL', ARGV[2] .. bucket)
+    if #fields == 0 then
+        redis.call('ZREM', KEYS[4], bucket)
+    else
+        redis.call('ZADD', KEYS[4], ARGV[4], bucket)
+        bars[#bars + 1] = bucket
+        bars[#bars + 1] = fields
+    end
+end
+
+local closed = redis.call('GET', KEYS[2])
+if not closed or tonumber(cutoff) > tonumber(closed) then
+    redis.call('SET', KEYS[2], cutoff)
+end
+return bars
+"""
+
+# Appends raw trade records to the list of their time bucket (BAR_SOURCE = "trades").
+# KEYS[1] - trades list, KEYS[2] - index of open buckets (zset), KEYS[3] - last closed bucket
+# ARGV - bucket, records...
+# Returns -1 if the bucket is already drained (late trades).
+PUSH_TRADES_SCRIPT = """
+local closed = redis.call('GET', KEYS[3])
+if closed and tonumber(ARGV[1]) <= tonumber(closed) then
+    return -1
+end
+redis.call('ZADD', KEYS[2], ARGV[1], ARGV[1])
+for i = 2, #ARGV, 1000 do
+    redis.call('RPUSH', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+return 0
+"""
+
+# Same as CLOSE_BARS_SCRIPT for raw trade lists: bucket, records, bucket, records, ...
+DRAIN_TRADES_SCRIPT = """
+local cutoff = ARGV[1]
+local hold = redis.call('GET', KEYS[3])
+if hold and tonumber(hold) < tonumber(cutoff) then
+    cutoff = hold
+end
+for _, bucket in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', cutoff)) do
+    redis.call('ZADD', KEYS[4], 0, bucket)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', cutoff)
+
+local trades = {}
+for _, bucket in ipairs(redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', ARGV[3])) do
+    local records = redis.call('LRANGE', ARGV[2] .. bucket, 0, -1)
+    if #records == 0 then
+        redis.call('ZREM', KEYS[4], bucket)
+    else
+        redis.call('ZADD', KEYS[4], ARGV[4], bucket)
+        trades[#trades + 1] = bucket
+        trades[#trades + 1] = records
+    end
+end
+
+local closed = redis.call('GET', KEYS[2])
+if not closed or tonumber(cutoff) > tonumber(closed) then
+    redis.call('SET', KEYS[2], cutoff)
+end
+return trades
+"""
+
+
+def bucket_start(timestamp_ms, interval_ms=BAR_INTERVAL_MS):  # epoch-aligned start of the interval
+    return timestamp_ms - timestamp_ms % interval_ms
+
+
+def bar_key_prefix(symbol):  # running bars written by another version are never merged into, see BAR_KEY_VERSION
+    return f"bar:v{BAR_KEY_VERSION}:{symbol}:"
+
+
+def bar_key(symbol, bucket):
+    return f"{bar_key_prefix(symbol)}{bucket}"
+
+
+def bar_keys(symbol, bucket):  # KEYS of MERGE_BAR_SCRIPT
+    return [bar_key(symbol, bucket), f"bars:{symbol}", f"bars:{symbol}:closed"]
+
+
+def pending_key(symbol, source="bars"):  # closed buckets not committed yet, "bars" or "trades" (BAR_SOURCE)
+    return f"bars:{symbol}:pending" if source == "bars" else f"trade_buckets:{symbol}:pending"
+
+
+def attempts_key(symbol, source="bars"):  # failed attempts to store each pending bucket, see fail_bars
+    return f"{pending_key(symbol, source)}:attempts"
+
+
+def trades_key(symbol, bucket):
+    return f"trades:{symbol}:{bucket}"
+
+
+def trade_bucket_keys(symbol, bucket):  # KEYS of PUSH_TRADES_SCRIPT
+    return [trades_key(symbol, bucket), f"trade_buckets:{symbol}", f"trade_buckets:{symbol}:closed"]
+
+
+def hold_key(symbol):  # last bucket that may be closed while the listener backfills a gap (api.backfill)
+    return f"bars:{symbol}:hold"
+
+
+def group_by_bucket(trades):
+    buckets = {}
+    for trade in trades:
+        buckets.setdefault(bucket_start(trade.trade_time), []).append(trade)
+    return buckets
+
+
+def summarize_trades(trades):  # partial bar of a batch, in MERGE_BAR_SCRIPT argument order (without bucket)
+    first = trades[0]
+    open_price = close_price = high = low = to_scaled(first.price)
+    open_time = close_time = first.trade_time
+    volume = quote_volume = buy_volume = price_sum = 0
+
+    for trade in trades:
+        price = to_scaled(trade.price)
+        quantity = to_scaled(trade.quantity)
+        trade_time = trade.trade_time
+
+        if price > high:
+            high = price
+        if price < low:
+            low = price
+        if trade_time < open_time:
+            open_price, open_time = price, trade_time
+        if trade_time >= close_time:
+            close_price, close_time = price, trade_time
+
+        volume += quantity
+        quote_volume += mul_scaled(price, quantity)
+        if not trade.is_buyer_maker:  # buyer is taker
+            buy_volume += quantity
+        price_sum += price
+
+    return [
+        open_price, high, low, close_price, volume, quote_volume, buy_volume, price_sum, len(trades),
+        open_time, close_time,
+    ]
+
+
+def close_bars(r, symbols, now_ms, grace_ms=BAR_CLOSE_GRACE_MS, lease_ms=PENDING_LEASE_MS):
+    """
+    Atomically closes every finished bar of the symbols, one pipelined script call per symbol.
+    A bucket is finished once its end is at least `grace_ms` in the past and it is not held by a backfill,
+    trades that arrive for it after that are rejected by MERGE_BAR_SCRIPT.
+    Returns (symbol, bar) pairs, also of earlier ticks that were not committed. The bars stay in Redis
+    until they are passed to release_bars.
+    """
+    cutoff = now_ms - grace_ms - BAR_INTERVAL_MS
+    close = r.register_script(CLOSE_BARS_SCRIPT)
+    with r.pipeline(transaction=False) as pipe:
+        for symbol in symbols:
+            close(
+                keys=[f"bars:{symbol}", f"bars:{symbol}:closed", hold_key(symbol), pending_key(symbol)],
+                args=[cutoff, bar_key_prefix(symbol), now_ms, now_ms + lease_ms],
+                client=pipe,
+            )
+        results = pipe.execute()
+
+    bars = []
+    for symbol, result in zip(symbols, results):
+        for bucket, fields in zip(result[::2], result[1::2]):
+            if fields:
+                bars.append((symbol, _parse_bar(int(bucket), dict(zip(fields[::2], fields[1::2])))))
+    return bars
+
+
+def drain_trades(r, symbols, now_ms, grace_ms=BAR_CLOSE_GRACE_MS, lease_ms=PENDING_LEASE_MS):
+    """
+    Atomically closes the raw trades of every finished bucket and builds their bars, as close_bars.
+    `r` must not decode responses, records may be binary. Returns (symbol, bar) pairs.
+    """
+    cutoff = now_ms - grace_ms - BAR_INTERVAL_MS
+    drain = r.register_script(DRAIN_TRADES_SCRIPT)
+    with r.pipeline(transaction=False) as pipe:
+        for symbol in symbols:
+            drain(
+                keys=[
+                    f"trade_buckets:{symbol}", f"trade_buckets:{symbol}:closed", hold_key(symbol),
+                    pending_key(symbol, "trades"),
+                ],
+                args=[cutoff, f"trades:{symbol}:", now_ms, now_ms + lease_ms],
+                client=pipe,
+            )
+        results = pipe.execute()
+
+    bars = []
+    for symbol, result in zip(symbols, results):
+        for bucket, records in zip(result[::2], result[1::2]):
+            if records:
+                bars.append((symbol, bar_from_trades(int(bucket), decode_trade_records(records))))
+    return bars
+
+
+def release_bars(r, bars, source="bars", retry=False):
+    """
+    Called with the (symbol, bar) pairs of close_bars ("bars") or drain_trades ("trades") once they are committed:
+    deletes them from Redis. With `retry` (the transaction failed) their lease ends instead,
+    so the next tick takes them again.
+    """
+    with r.pipeline(transaction=False) as pipe:
+        for symbol, bar in bars:
+            bucket = bar["bucket"]
+            if retry:
+                pipe.zadd(pending_key(symbol, source), {bucket: 0}, xx=True)
+                continue
+            pipe.delete(bar_key(symbol, bucket) if source == "bars" else trades_key(symbol, bucket))
+            pipe.zrem(pending_key(symbol, source), bucket)
+            pipe.hdel(attempts_key(symbol, source), bucket)
+        pipe.execute()
+
+
+def fail_bars(r, bars, source="bars", error=None, max_attempts=BAR_MAX_ATTEMPTS):
+    """
+    Called with the (symbol, bar) pairs that could not be stored while the rest of the tick was, e.g. a volume
+    too large for the column. They are retried by the next ticks as with release_bars(retry=True), but after
+    `max_attempts` failures a bar is moved to DEAD_BARS_KEY (JSON, with the error) instead of blocking its symbol.
+    Returns the pairs moved there.
+    """
+    with r.pipeline(transaction=False) as pipe:
+        for symbol, bar in bars:
+            pipe.hincrby(attempts_key(symbol, source), bar["bucket"], 1)
+        attempts = pipe.execute()
+
+    dead = []
+    with r.pipeline(transaction=False) as pipe:
+        for (symbol, bar), attempt in zip(bars, attempts):
+            bucket = bar["bucket"]
+            if int(attempt) < max_attempts:
+                pipe.zadd(pending_key(symbol, source), {bucket: 0}, xx=True)
+                continue
+            pipe.rpush(DEAD_BARS_KEY, json.dumps(
+                {"symbol": symbol, "source": source, "bar": bar, "error": repr(error)}, default=str,
+            ))
+            pipe.delete(bar_key(symbol, bucket) if source == "bars" else trades_key(symbol, bucket))
+            pipe.zrem(pending_key(symbol, source), bucket)
+            pipe.hdel(attempts_key(symbol, source), bucket)
+            dead.append((symbol, bar))
+        pipe.execute()
+    return dead
+
+
+def bar_from_trades(bucket, trades):  # trades - RECORD_DTYPE array of one bucket in arrival order
+    bar = aggregate(trades, BAR_INTERVAL_MS)
+    return _make_bar(
+        bucket, bar["open"], bar["high"], bar["low"], bar["close"], bar["volume"], bar["quote_volume"],
+        bar["buy_volume"], bar["price_sum"], bar["count"],
+    )
+
+
+def _parse_bar(bucket, bar):
+    return _make_bar(
+        bucket, bar["open"], bar["high"], bar["low"], bar["close"], bar["volume"], bar["quote_volume"],
+        bar.get("buy_volume", 0), bar["price_sum"], bar["count"],
+    )
+
+
+def _make_bar(bucket, open_price, high, low, close_price, volume, quote_volume, buy_volume, price_sum, count):
+    volume = int(volume)
+    count = int(count)
+    return {  # fixed-point values become exact Decimals here
+        "bucket": bucket,
+        "open_price": from_scaled(open_price),
+        "high_price": from_scaled(high),
+        "low_price": from_scaled(low),
+        "close_price": from_scaled(close_price),
+        "volume": from_scaled(volume),
+        "buy_volume": from_scaled(buy_volume),
+        "vwap": div_scaled(quote_volume, volume) if volume else None,
+        "avg_price": from_scaled(price_sum) / count,
+        "trade_count": count,
+        "start_time": datetime.fromtimestamp(bucket / 1000, tz=timezone.utc),  # [start, end)
+        "end_time": datetime.fromtimestamp((bucket + BAR_INTERVAL_MS) / 1000, tz=timezone.utc),
+    }
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+
+from api.codecs import BarPayload, dumps
+from api.rollups import BASE_INTERVAL
+
+ALL_BARS_GROUP = "trades"  # every symbol's BAR_INTERVAL bars, for clients subscribed to "*"
+PUBLISH_STATS_KEY = "stats:broadcast"
+
+
+def bar_group(symbol, interval):  # one group per symbol and interval, e.g. "bars.BTCUSDT.1m"
+    return f"bars.{symbol.upper()}.{interval}"
+
+
+def ticker_payload(ticker):
+    return BarPayload(
+        symbol=ticker.symbol,
+        open_price=str(ticker.open_price),
+        close_price=str(ticker.close_price),
+        high_price=str(ticker.high_price),
+        low_price=str(ticker.low_price),
+        volume=str(ticker.volume),
+        interval=ticker.interval,
+    )
+
+
+def bar_frames(tickers):  # (symbol, interval, frame): each bar is encoded once, for Redis and every subscriber
+    return [(ticker.symbol, ticker.interval, dumps(ticker_payload(ticker))) for ticker in tickers]
+
+
+def broadcast_frames(frames):  # send the bars of a tick (base and rollups) to their subscribers
+    async_to_sync(send_bars)(get_channel_layer(), frames)
+
+
+def publish_tick(r, frames, closed_at_ms):
+    """
+    Sends the frames of an aggregation tick with one async call and records its latency in PUBLISH_STATS_KEY:
+    how long the channel layer took and how long after the bars closed they reached it.
+    Totals let a reader compute averages: total_publish_ms / publishes.
+    """
+    started = time.time() * 1000
+    try:
+        broadcast_frames(frames)
+    except Exception:  # the bars are stored already, clients get the next tick
+        r.hincrby(PUBLISH_STATS_KEY, "errors")
+        return
+    finished = time.time() * 1000
+
+    with r.pipeline(transaction=False) as pipe:
+        pipe.hincrby(PUBLISH_STATS_KEY, "publishes")
+        pipe.hincrby(PUBLISH_STATS_KEY, "frames", len(frames))
+        pipe.hincrbyfloat(PUBLISH_STATS_KEY, "total_publish_ms", round(finished - started, 3))
+        pipe.hincrbyfloat(PUBLISH_STATS_KEY, "total_close_to_publish_ms", round(finished - closed_at_ms, 3))
+        pipe.hset(PUBLISH_STATS_KEY, mapping={
+            "last_publish_ms": round(finished - started, 3),  # channel layer round trips
+            "last_close_to_publish_ms": round(finished - closed_at_ms, 3),  # bar close -> subscribers' channels
+        })
+        pipe.execute()
+
+
+async def send_bars(channel_layer, frames):
+    """
+    Messages carry the encoded frames, which consumers forward as they are: the channel layer
+    serializes a string instead of a dict for every channel, and no consumer encodes JSON.
+    """
+    tick = time.time_ns()  # lets a server process apply the bars to api.latest once
+    sends = [
+        channel_layer.group_send(bar_group(symbol, interval), {
+            "type": "send_trade_update", "tick": tick, "symbol": symbol, "interval": interval, "frame": frame,
+        })
+        for symbol, interval, frame in frames
+    ]
+    base = [(symbol, frame) for symbol, interval, frame in frames if interval == BASE_INTERVAL]
+    sends.append(channel_layer.group_send(ALL_BARS_GROUP, {  # a single message for the whole tick
+        "type": "send_trade_batch", "tick": tick,
+        "symbols": [symbol for symbol, _ in base], "frames": [frame for _, frame in base],
+    }))
+    await asyncio.gather(*sends)
@@ -0,0 +1,80 @@
+import hashlib
+import time
+
+import redis
+from redis.exceptions import RedisError
+
+from TradeWS.variables import REDIS_HOST, REDIS_PORT, HISTORY_CACHE_TTL
+
+ALL_SYMBOLS = "*"  # generation of listings without a symbol filter
+
+# Looks up a cached history response together with the current generation of its symbol.
+# KEYS[1] - generation counter, ARGV[1] - initial generation (ms), ARGV[2] - entry key prefix, ARGV[3] - params digest
+# The generation starts from the current time, so it never goes back after Redis loses it and old ETags can't match.
+# Returns {generation, entry fields}.
+LOOKUP_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'NX')
+local generation = redis.call('GET', KEYS[1])
+return {generation, redis.call('HGETALL', ARGV[2] .. generation .. ':' .. ARGV[3])}
+"""
+
+
+class HistoryCache:
+    """
+    Rendered /api/trades/ list responses in Redis, keyed by symbol, generation and normalized query parameters.
+    aggregate_trades bumps the generation of every symbol it writes (and of ALL_SYMBOLS), so entries
+    of that symbol become unreachable at once and expire after `ttl` seconds. Other symbols keep their entries.
+    The ETag is the generation and the digest: an unchanged listing is answered with 304 without reading the entry.
+    """
+
+    def __init__(self, client=None, ttl=HISTORY_CACHE_TTL):
+        self.redis = client or redis.Redis(host=REDIS_HOST, port=REDIS_PORT)  # bodies may be binary (Arrow)
+        self.lookup_entry = self.redis.register_script(LOOKUP_SCRIPT)
+        self.ttl = ttl
+
+    @staticmethod
+    def generation_key(symbol):
+        return f"history:generation:{symbol}"
+
+    @staticmethod
+    def entry_prefix(symbol):
+        return f"history:{symbol}:"
+
+    @staticmethod
+    def digest(params, output_format):  # same digest for the same request, whatever the parameter order
+        items = sorted((key, value) for key, value in params.items() if key != 'format' and value)
+        return hashlib.sha1(repr((items, output_format)).encode()).hexdigest()
+
+    def lookup(self, symbol, digest):  # (generation, entry) or None when Redis is unavailable
+        try:
+            generation, fields = self.lookup_entry(
+                keys=[self.generation_key(symbol)], args=[int(time.time() * 1000), self.entry_prefix(symbol), digest]
+            )
+        except RedisError:
+            return None
+        return generation.decode(), {key.decode(): value for key, value in zip(fields[::2], fields[1::2])}
+
+    def store(self, symbol, generation, digest, response):
+        entry = {"body": response.content, "content_type": response["Content-Type"]}
+        if response.has_header("Link"):
+            entry["link"] = response["Link"]
+        key = f"{self.entry_prefix(symbol)}{generation}:{digest}"
+        try:
+            with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping=entry)
+                pipe.expire(key, self.ttl)
+                pipe.execute()
+        except RedisError:
+            pass
+
+    def invalidate(self, symbols):  # called once the new bars are committed
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                for symbol in {*symbols, ALL_SYMBOLS}:
+                    pipe.incr(self.generation_key(symbol))
+                pipe.execute()
+        except RedisError:
+            pass  # stale entries are served until they expire
+
+
+history_cache = HistoryCache()
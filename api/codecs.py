@@ -0,0 +1,158 @@
+"""
+JSON codecs for the hot paths (listener, Redis records, broadcast).
+Uses msgspec when it is installed, then orjson, then the standard library.
+Raw trades in Redis are either JSON or compact fixed-width binary records, see TRADE_RECORD_FORMAT.
+"""
+import json
+import struct
+from dataclasses import dataclass, asdict
+
+import numpy as np
+
+from TradeWS.variables import TRADE_RECORD_FORMAT
+from api.fixedpoint import to_scaled
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if msgspec is not None:
+    class BinanceTrade(msgspec.Struct):  # trade stream message, only the fields we use
+        symbol: str = msgspec.field(name="s")
+        price: str = msgspec.field(name="p")
+        quantity: str = msgspec.field(name="q")
+        trade_time: int = msgspec.field(name="T")
+        trade_id: int = msgspec.field(name="t", default=0)
+        is_buyer_maker: bool = msgspec.field(name="m", default=False)
+
+    class BarPayload(msgspec.Struct):  # bar update sent to WebSocket clients
+        symbol: str
+        open_price: str
+        close_price: str
+        high_price: str
+        low_price: str
+        volume: str
+        interval: str = "1m"
+else:
+    @dataclass(slots=True)
+    class BinanceTrade:
+        symbol: str
+        price: str
+        quantity: str
+        trade_time: int
+        trade_id: int = 0
+        is_buyer_maker: bool = False
+
+    @dataclass(slots=True)
+    class BarPayload:
+        symbol: str
+        open_price: str
+        close_price: str
+        high_price: str
+        low_price: str
+        volume: str
+        interval: str = "1m"
+
+
+if msgspec is not None:
+    BACKEND = "msgspec"
+    _encoder = msgspec.json.Encoder()
+    _decoder = msgspec.json.Decoder()
+    _trade_decoder = msgspec.json.Decoder(BinanceTrade)
+
+    def dumpb(obj):
+        return _encoder.encode(obj)
+
+    def loads(data):
+        return _decoder.decode(data)
+
+    def decode_trade(message):  # None for anything that is not a trade (e.g. subscription replies)
+        try:
+            return _trade_decoder.decode(message)
+        except msgspec.ValidationError:
+            return None
+
+    def bar_to_dict(bar):
+        return msgspec.structs.asdict(bar)
+else:
+    if orjson is not None:
+        BACKEND = "orjson"
+
+        def dumpb(obj):
+            return orjson.dumps(obj)  # dataclasses are supported natively
+
+        loads = orjson.loads
+    else:
+        BACKEND = "json"
+
+        def dumpb(obj):
+            return json.dumps(obj, default=asdict, separators=(",", ":")).encode()
+
+        loads = json.loads
+
+    def decode_trade(message):
+        data = loads(message)
+        if "s" not in data or "p" not in data:
+            return None
+        return BinanceTrade(data["s"], data["p"], data["q"], data["T"], data.get("t", 0), data.get("m", False))
+
+    def bar_to_dict(bar):
+        return asdict(bar)
+
+
+def dumps(obj):
+    return dumpb(obj).decode()
+
+
+# version, trade id, price and quantity (scaled by fixedpoint.SCALE), trade time (ms), buyer is maker
+RECORD_VERSION = 1
+RECORD = struct.Struct("<Bqqqq?")
+RECORD_DTYPE = np.dtype([
+    ("version", "u1"), ("trade_id", "<i8"), ("price", "<i8"), ("quantity", "<i8"), ("trade_time", "<i8"),
+    ("is_buyer_maker", "?"),
+])  # same layout as RECORD, so a list of records can be read with np.frombuffer
+
+
+def encode_trade_record(trade, record_format=TRADE_RECORD_FORMAT):  # raw trade as stored in Redis
+    if record_format == "binary":
+        return RECORD.pack(
+            RECORD_VERSION, trade.trade_id, to_scaled(trade.price), to_scaled(trade.quantity), trade.trade_time,
+            trade.is_buyer_maker,
+        )
+    return dumps({
+        "symbol": trade.symbol.lower(),
+        "price": trade.price,
+        "quantity": trade.quantity,
+        "trade_time": trade.trade_time,
+        "trade_id": trade.trade_id,
+        "is_buyer_maker": trade.is_buyer_maker,
+    })
+
+
+def decode_trade_records(records):
+    """
+    Decodes raw trades read from Redis (bytes) into a RECORD_DTYPE array, keeping their order.
+    Binary records are read in bulk, JSON records written before the switch are converted one by one.
+    """
+    data = b"".join(records)
+    if len(data) == len(records) * RECORD.size:  # JSON records are always longer than binary ones
+        trades = np.frombuffer(data, dtype=RECORD_DTYPE)
+        if (trades["version"] == RECORD_VERSION).all():
+            return trades
+
+    trades = np.empty(len(records), dtype=RECORD_DTYPE)
+    for i, record in enumerate(records):
+        if len(record) == RECORD.size and record[0] == RECORD_VERSION:
+            trades[i] = RECORD.unpack(record)
+        else:
+            data = loads(record)
+            trades[i] = (RECORD_VERSION, data.get("trade_id", 0), to_scaled(data["price"]), to_scaled(data["quantity"]),
+                         int(data["trade_time"]), data.get("is_buyer_maker", False))
+    return trades
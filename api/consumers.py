@@ -1,32 +1,193 @@
 # api/consumers.py
-import json
+import asyncio
+import time
+
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import sync_to_async
 
-from api.models import TickerAggregate
+from TradeWS.variables import LIVE_MAX_HZ, WS_SEND_QUEUE_SIZE, WS_SEND_POLICY, WS_SLOW_CONSUMER_SECONDS
+from api.broadcast import ALL_BARS_GROUP, bar_group
+from api.codecs import dumps, loads
+from api.latest import latest_bars
+from api.live import live_group
+from api.outbox import Outbox, server_buffer, stats
+from api.rollups import BASE_INTERVAL, INTERVALS
+
+SLOW_CONSUMER_CLOSE_CODE = 4008
 
 
 class TradeConsumer(AsyncWebsocketConsumer):
+    """
+    Messages from the client:
+    {"action": "subscribe", "symbols": ["BTCUSDT", ...], "interval": "1m"} - bars of these symbols ("*" - all symbols)
+    {"action": "unsubscribe", "symbols": [...], "interval": "1m"}
+    {"action": "subscribe", "symbols": [...], "live": true, "max_hz": 5} - in-progress bars of these symbols (unsubscribe with "live": true too)
+    {"symbol": "BTCUSDT"} - latest bar of the symbol
+    A new connection is subscribed to nothing.
+    Live updates are conflated: a client gets at most `max_hz` (LIVE_MAX_HZ at most) frames a second per symbol,
+    each with the latest bar, and updates that arrive in between replace the pending one. `max_hz` applies
+    to the symbols of its subscribe message. LIVE_MAX_HZ = 0 turns live subscriptions off.
+    Frames go through a bounded queue (api.outbox): a pending bar is replaced by a newer one of the same symbol
+    and interval, and a client whose queue stays full for WS_SLOW_CONSUMER_SECONDS is closed with code 4008.
+    """
+    max_subscriptions = 1000  # groups per connection
+
     async def connect(self):
-        await self.channel_layer.group_add("trades", self.channel_name)  # add the consumer to the group
+        self.subscriptions = set()
+        self.live_pending = {}  # symbol -> (frame, trade time) of the latest live bar not sent yet
+        self.live_flush = None  # task sending live_pending
+        self.live_intervals = {}  # symbol -> seconds between live frames
+        self.live_sent_at = {}  # symbol -> when its last live frame was queued
+        self.live_added = asyncio.Event()  # wakes flush_live when a symbol gets a pending frame
+        self.outbox = Outbox(
+            self.send_text, WS_SEND_QUEUE_SIZE, WS_SEND_POLICY, WS_SLOW_CONSUMER_SECONDS, on_lagging=self.evict,
+            buffered=server_buffer(self.base_send),  # Daphne's send does not wait for a slow client
+        )
+        self.evicted = False
         await self.accept()
+        self.outbox_task = asyncio.create_task(self.outbox.run())
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard("trades", self.channel_name)  # remove the consumer from the group
+        self.outbox_task.cancel()
+        self.outbox.close()
+        if self.live_flush is not None:
+            self.live_flush.cancel()
+        for group in self.subscriptions:
+            await self.channel_layer.group_discard(group, self.channel_name)  # remove the consumer from the group
 
     async def receive(self, text_data):
-        data = json.loads(text_data)
-        symbol = data.get("symbol")
-
-        ticker = await sync_to_async(TickerAggregate.objects.filter(symbol=symbol).latest)("id")
-        await self.send(text_data=json.dumps({
-            "symbol": ticker.symbol,
-            "open_price": str(ticker.open_price),
-            "close_price": str(ticker.close_price),
-            "high_price": str(ticker.high_price),
-            "low_price": str(ticker.low_price),
-            "volume": str(ticker.volume),
-        }))  # send the latest ticker data
-
-    async def send_trade_update(self, event):
-        await self.send(text_data=json.dumps(event["data"]))
+        data = loads(text_data)
+        if not isinstance(data, dict):
+            return await self.send_error("Expected a JSON object")
+        action = data.get("action", "snapshot")
+
+        if action in ("subscribe", "unsubscribe"):
+            await self.change_subscriptions(action, data)
+        elif action == "snapshot":
+            await self.send_snapshot(str(data.get("symbol", "")).upper())
+        else:
+            await self.send_error(f"Unknown action: {action}")
+
+    async def change_subscriptions(self, action, data):
+        symbols = data.get("symbols", [data["symbol"]] if "symbol" in data else [])
+        interval = data.get("interval", BASE_INTERVAL)
+        if interval not in INTERVALS:
+            return await self.send_error(f"Unknown interval: {interval}")
+        if not isinstance(symbols, list) or not all(isinstance(symbol, str) for symbol in symbols):
+            return await self.send_error("symbols must be a list of strings")
+        symbols = [symbol.upper() for symbol in symbols]
+        if not all(symbol == "*" or (symbol.isalnum() and len(symbol) <= 20) for symbol in symbols):
+            return await self.send_error("Invalid symbol")
+
+        live = bool(data.get("live"))
+        if live:
+            if "*" in symbols:
+                return await self.send_error("Live updates need explicit symbols")
+            if action == "subscribe":
+                if LIVE_MAX_HZ <= 0:
+                    return await self.send_error("Live updates are disabled")
+                max_hz = data.get("max_hz", LIVE_MAX_HZ)
+                if isinstance(max_hz, bool) or not isinstance(max_hz, (int, float)) or max_hz <= 0:
+                    return await self.send_error("max_hz must be a positive number")
+                max_hz = min(max_hz, LIVE_MAX_HZ)
+            groups = [live_group(symbol) for symbol in symbols]
+        else:
+            groups = [ALL_BARS_GROUP if symbol == "*" else bar_group(symbol, interval) for symbol in symbols]
+        if action == "subscribe":
+            new_groups = [group for group in dict.fromkeys(groups) if group not in self.subscriptions]
+            if len(self.subscriptions) + len(new_groups) > self.max_subscriptions:
+                return await self.send_error(f"At most {self.max_subscriptions} subscriptions per connection")
+            for group in new_groups:
+                await self.channel_layer.group_add(group, self.channel_name)  # add the consumer to the group
+                self.subscriptions.add(group)
+            if live:
+                self.live_intervals.update(dict.fromkeys(symbols, 1 / max_hz))
+        else:
+            for group in groups:
+                if group in self.subscriptions:
+                    await self.channel_layer.group_discard(group, self.channel_name)
+                    self.subscriptions.discard(group)
+            if live:
+                for symbol in symbols:
+                    self.live_pending.pop(symbol, None)
+                    self.live_intervals.pop(symbol, None)
+                    self.live_sent_at.pop(symbol, None)
+
+        reply = {"action": f"{action}d", "symbols": symbols, "interval": interval}
+        if live:
+            reply["live"] = True
+            if action == "subscribe":
+                reply["max_hz"] = max_hz
+        await self.queue(dumps(reply))
+
+    async def send_snapshot(self, symbol):
+        frame = await latest_bars.get(symbol)  # process memory, then Redis, then the database
+        if frame is None:
+            return await self.send_error("No data for this symbol", symbol=symbol)
+        await self.queue(frame)  # send the latest ticker data
+
+    async def send_error(self, message, **fields):
+        await self.queue(dumps({**fields, "error": message}))
+
+    async def send_text(self, frame):  # called by the outbox task
+        await self.send(text_data=frame)
+
+    async def queue(self, frame, key=None, event_time=None):  # frames with the same key replace each other while pending
+        if self.evicted:
+            return
+        if not self.outbox.put(frame, key, event_time):
+            await self.evict()
+        else:
+            await stats.write()
+
+    async def evict(self):  # the client does not read its frames, also called by the outbox
+        if self.evicted:
+            return
+        self.evicted = True
+        stats.evictions += 1
+        await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        await stats.write(force=True)
+
+    # Events carry frames encoded once by the sender (api.broadcast, api.live), they are forwarded as they are.
+
+    async def send_trade_update(self, event):  # bar of a per-symbol group
+        latest_bars.update_bar(event)
+        await self.queue(event["frame"], ("bar", event["symbol"], event["interval"]))
+
+    async def send_trade_batch(self, event):  # one frame per symbol, same format as send_trade_update
+        latest_bars.update(event)
+        for symbol, frame in zip(event["symbols"], event["frames"]):
+            await self.queue(frame, ("all", symbol))
+
+    async def send_live_update(self, event):  # in-progress bar, see api.live
+        if event["symbol"] not in self.live_intervals:
+            return  # sent before the unsubscribe took effect
+        if event["symbol"] not in self.live_pending:
+            self.live_added.set()  # it may be due before the symbol flush_live waits for
+        self.live_pending[event["symbol"]] = (event["frame"], event.get("time"))  # latest value wins
+        if self.live_flush is None:
+            self.live_flush = asyncio.create_task(self.flush_live())
+
+    async def flush_live(self):
+        try:
+            while self.live_pending:
+                now = time.monotonic()
+                due = {
+                    symbol: self.live_sent_at.get(symbol, 0) + self.live_intervals[symbol]
+                    for symbol in self.live_pending
+                }
+                ready = [symbol for symbol, at in due.items() if at <= now]
+                if not ready:  # updates arriving meanwhile replace the pending ones
+                    self.live_added.clear()
+                    try:
+                        await asyncio.wait_for(self.live_added.wait(), min(due.values()) - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                for symbol in ready:
+                    if symbol not in self.live_pending:
+                        continue  # unsubscribed while the previous frames were queued
+                    frame, event_time = self.live_pending.pop(symbol)
+                    self.live_sent_at[symbol] = now
+                    await self.queue(frame, ("live", symbol), event_time)
+        finally:
+            self.live_flush = None
@@ -0,0 +1,53 @@
+"""
+Fixed-point prices and quantities: integers scaled by SCALE (Binance uses 8 decimal places).
+Sums stay exact and fast, values become Decimal only when they are written to the database.
+"""
+from decimal import Decimal
+
+import numpy as np
+
+SCALE_DIGITS = 8  # Binance sends prices and quantities with 8 decimal places
+SCALE = 10 ** SCALE_DIGITS
+INT64_MAX = np.iinfo(np.int64).max
+
+
+def to_scaled(value):  # "82000.01000000" -> 8200001000000, exact
+    whole, _, fraction = value.partition(".")
+    return int(whole + fraction[:SCALE_DIGITS].ljust(SCALE_DIGITS, "0"))
+
+
+def from_scaled(value):
+    return Decimal(int(value)).scaleb(-SCALE_DIGITS)
+
+
+def mul_scaled(price, quantity):  # quote amount of a trade, scaled and rounded down to 1e-8
+    return price * quantity // SCALE
+
+
+def mul_scaled_array(prices, quantities):
+    """
+    mul_scaled over int64 arrays. price * quantity overflows int64 for real prices, so both are split
+    into whole and fractional parts; every partial product stays below the result, the price or the quantity.
+    """
+    price_whole, price_fraction = np.divmod(prices, SCALE)
+    quantity_whole, quantity_fraction = np.divmod(quantities, SCALE)
+    return (
+        price_whole * quantity_whole * SCALE
+        + price_whole * quantity_fraction
+        + price_fraction * quantity_whole
+        + price_fraction * quantity_fraction // SCALE
+    )
+
+
+def sum_scaled(values, starts):
+    """
+    np.add.reduceat of scaled values. Sums that may not fit into int64 (quote volumes of rollups, volumes
+    of cheap coins) are taken over Python ints, the result is then an object array.
+    """
+    if len(values) and int(np.abs(values).max()) > INT64_MAX // len(values):
+        values = values.astype(object)
+    return np.add.reduceat(values, starts)
+
+
+def div_scaled(numerator, denominator):  # ratio of two scaled values, e.g. VWAP = quote volume / volume
+    return Decimal(int(numerator)) / Decimal(int(denominator))
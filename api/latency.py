@@ -0,0 +1,49 @@
+"""
+Latency histograms of the live path, from the Binance trade time `T` to the listener publishing the bar
+(listener stats) and to the frame being written to the client's socket (WebSocket server stats).
+Both include the offset between the local clock and Binance's, negative values go to the first bucket.
+"""
+from bisect import bisect_left
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is above the largest bucket
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms):
+        self.counts[bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q):  # upper bound of the bucket holding the q-th percentile, None above the largest one
+        if not self.count:
+            return 0
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= self.count * q:
+                return bound
+        return None
+
+    def as_dict(self, prefix):  # cumulative counts, like Prometheus "le" buckets
+        fields = {}
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            fields[f"{prefix}_le_{bound}"] = seen
+        fields.update({
+            f"{prefix}_count": self.count,
+            f"{prefix}_avg_ms": round(self.total_ms / self.count, 3) if self.count else 0,
+            f"{prefix}_max_ms": round(self.max_ms, 3),
+        })
+        for name, q in (("p50", 0.5), ("p99", 0.99)):
+            bound = self.percentile(q)
+            fields[f"{prefix}_{name}_ms"] = "inf" if bound is None else bound
+        return fields
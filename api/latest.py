@@ -0,0 +1,85 @@
+"""
+Latest closed bar of every symbol, kept as the encoded frame sent to WebSocket clients.
+aggregate_trades mirrors it to a Redis hash, and every server process keeps a local copy,
+so snapshot requests are answered without the ORM or the thread pool.
+"""
+import asyncio
+import time
+
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from redis.exceptions import RedisError
+
+from TradeWS.variables import REDIS_HOST, REDIS_PORT
+from api.broadcast import ticker_payload
+from api.codecs import dumps
+from api.models import TickerAggregate
+from api.rollups import BASE_INTERVAL
+
+LATEST_BARS_KEY = "latest_bars"  # hash: symbol -> frame
+LOCAL_TTL = 1.0  # seconds a frame is served from process memory before it is read from Redis again
+
+
+def store_latest_bars(r, frames):  # called by aggregate_trades with the api.broadcast.bar_frames of the tick
+    r.hset(LATEST_BARS_KEY, mapping={symbol: frame for symbol, interval, frame in frames if interval == BASE_INTERVAL})
+
+
+class LatestBars:
+    """
+    Process-local frames by symbol, each served for LOCAL_TTL seconds, so a reconnect storm costs
+    at most one Redis read per symbol and second. Broadcasts that reach the process refresh them:
+    all consumers of the process receive the same batch, the first one updates the frames and the rest
+    only compare the tick id. A symbol missing in Redis is read from the database, a symbol without bars
+    is remembered as None for the same time.
+    """
+
+    def __init__(self, client=None, ttl=LOCAL_TTL):
+        self.redis = client
+        self.loop = None if client is None else False  # False - `client` is given, it is used in any loop
+        self.ttl = ttl
+        self.frames = {}  # symbol -> (frame, expires at)
+        self.tick = None
+
+    def update(self, event):  # send_trade_batch event
+        if event.get("tick") is not None and event["tick"] == self.tick:
+            return
+        self.tick = event.get("tick")
+        for symbol, frame in zip(event["symbols"], event["frames"]):
+            self.set(symbol, frame)
+
+    def update_bar(self, event):  # send_trade_update event of a per-symbol group
+        if event["interval"] == BASE_INTERVAL:
+            self.set(event["symbol"], event["frame"])
+
+    def set(self, symbol, frame):
+        self.frames[symbol] = (frame, time.monotonic() + self.ttl)
+
+    async def get(self, symbol):  # frame or None if the symbol has no bars
+        frame, expires = self.frames.get(symbol, (None, 0))
+        if time.monotonic() < expires:
+            return frame
+
+        try:
+            frame = await self.client().hget(LATEST_BARS_KEY, symbol)
+        except RedisError:
+            frame = None
+        if frame is None:
+            frame = await sync_to_async(self.load)(symbol)
+        self.set(symbol, frame)  # misses too, so unknown symbols do not reach the database on every request
+        return frame
+
+    def client(self):  # a client of the running loop, its connections cannot be used from another one
+        loop = asyncio.get_running_loop()
+        if self.loop is not False and self.loop is not loop:
+            self.loop = loop
+            self.redis = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        return self.redis
+
+    @staticmethod
+    def load(symbol):
+        tickers = TickerAggregate.objects.filter(symbol=symbol, interval=BASE_INTERVAL)
+        ticker = tickers.order_by('-start_time', '-id').first()
+        return None if ticker is None else dumps(ticker_payload(ticker))
+
+
+latest_bars = LatestBars()
@@ -0,0 +1,90 @@
+"""
+Live (in-progress) bars. The listener folds every batch it writes to Redis into the running bar of each symbol
+and publishes the changed bars to the Channels groups "live.<SYMBOL>" at most LIVE_PUBLISH_HZ times a second.
+Every symbol is handled by one listener process, so its bar here sees all of the symbol's trades
+(except those before a restart in the middle of a bar). Consumers conflate the updates per client, see TradeConsumer.
+"""
+import asyncio
+import time
+
+from channels.layers import get_channel_layer
+
+from TradeWS.variables import LIVE_PUBLISH_HZ
+from api.codecs import dumps
+from api.fixedpoint import from_scaled
+from api.latency import LatencyHistogram
+from api.rollups import BASE_INTERVAL
+
+
+def live_group(symbol):
+    return f"live.{symbol.upper()}"
+
+
+class LiveBars:
+    def __init__(self, channel_layer=None, publish_hz=LIVE_PUBLISH_HZ):
+        self.channel_layer = channel_layer or get_channel_layer()
+        self.publish_interval = 1 / publish_hz
+        self.bars = {}  # symbol -> [bucket, open, high, low, close, volume, count, open_time, close_time]
+        self.changed = set()
+        self.published = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()  # trade time of the bar's last trade -> published
+
+    def merge(self, symbol, bucket, summary):  # summary of a written batch, see api.bars.summarize_trades
+        open_price, high, low, close_price, volume, _, _, _, count, open_time, close_time = summary
+        bar = self.bars.get(symbol)
+        if bar is None or bucket > bar[0]:  # first batch of a new bar
+            self.bars[symbol] = [bucket, open_price, high, low, close_price, volume, count, open_time, close_time]
+        elif bucket < bar[0]:  # late trades of a bar that is no longer live
+            return
+        else:
+            bar[2] = max(bar[2], high)
+            bar[3] = min(bar[3], low)
+            if open_time < bar[7]:
+                bar[1], bar[7] = open_price, open_time
+            if close_time >= bar[8]:
+                bar[4], bar[8] = close_price, close_time
+            bar[5] += volume
+            bar[6] += count
+        self.changed.add(symbol)
+
+    def payload(self, symbol):
+        bucket, open_price, high, low, close_price, volume, count, _, close_time = self.bars[symbol]
+        return {
+            "symbol": symbol.upper(),
+            "interval": BASE_INTERVAL,
+            "open_price": str(from_scaled(open_price)),
+            "close_price": str(from_scaled(close_price)),  # last trade price
+            "high_price": str(from_scaled(high)),
+            "low_price": str(from_scaled(low)),
+            "volume": str(from_scaled(volume)),
+            "trade_count": count,
+            "start_time": bucket,  # ms
+            "time": close_time,  # ms, time of the last trade
+            "live": True,
+        }
+
+    async def publish(self):  # one message per symbol that changed since the last call
+        changed, self.changed = self.changed, set()
+        await asyncio.gather(*[
+            self.channel_layer.group_send(live_group(symbol), {
+                "type": "send_live_update", "symbol": symbol.upper(), "frame": dumps(self.payload(symbol)),
+                "time": self.bars[symbol][8],  # lets the consumers measure the latency without decoding the frame
+            })
+            for symbol in changed
+        ])
+        published_at = time.time() * 1000
+        for symbol in changed:
+            self.latency.record(published_at - self.bars[symbol][8])
+        self.published += len(changed)
+
+    def stats(self):  # written with the writer stats of the listener
+        return {"live_published": self.published, "live_errors": self.errors, **self.latency.as_dict("live_latency")}
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                await self.publish()
+            except Exception:  # the channel layer being down must not stop the listener
+                self.errors += 1
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from TradeWS.variables import BAR_SOURCE
+from api.streams import StreamAggregator
+
+
+class Command(BaseCommand):
+    help = "Fold trades from the Redis trade stream into the running bars (BAR_SOURCE=stream)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Aggregate one read of the stream and exit")
+
+    def handle(self, *args, **options):
+        if BAR_SOURCE != "stream":
+            self.stderr.write(f"BAR_SOURCE is {BAR_SOURCE!r}, the listener keeps the bars itself")
+
+        aggregator = StreamAggregator()
+        if options["once"]:
+            read = aggregator.aggregate_once(block=False)
+            self.stdout.write(f"Read {read} trades, {aggregator.late} late")
+            return
+        aggregator.run()  # run as many processes as needed, they share the "bars" consumer group
@@ -1,44 +1,98 @@
 import asyncio
 import json
+from multiprocessing import Process
+
 import websockets
-import redis
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 
-from TradeWS.variables import REDIS_HOST, REDIS_PORT, BINANCE_WS_URL, TIME_INTERVAL, SYMBOLS
+from TradeWS.variables import (
+    BINANCE_WS_URL, STREAMS_PER_CONNECTION, LISTENER_SHARDS, LIVE_PUBLISH_HZ, LISTENER_PING_SECONDS,
+)
+from api.backfill import Backoff, GapFiller
+from api.codecs import decode_trade
+from api.live import LiveBars
+from api.redis_writer import RedisTradeWriter, WRITER_STATS_KEY
+from api.symbols import get_symbols, shard_symbols, chunked
 
 
 class Command(BaseCommand):
     help = "Listen to Binance WebSocket and save trades to Redis"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--shards", type=int, default=LISTENER_SHARDS,
+                            help="Split the symbols between this many listener processes")
+        parser.add_argument("--shard", type=int,
+                            help="Run only this shard (0-based) in the current process, e.g. one per machine")
+
     def handle(self, *args, **options):
+        shards = options["shards"]
+        if shards < 1:
+            raise CommandError(f"--shards must be at least 1, got {shards}")
+        if options["shard"] is not None and not 0 <= options["shard"] < shards:
+            raise CommandError(f"--shard must be between 0 and {shards - 1}, got {options['shard']}")
+        symbols = get_symbols()
+
+        if options["shard"] is not None:
+            self.run_shard(shard_symbols(symbols, options["shard"], shards), options["shard"])
+        elif shards > 1:
+            connections.close_all()  # forked processes must not share the DB connection
+            processes = [
+                Process(target=self.run_shard, args=(shard_symbols(symbols, shard, shards), shard))
+                for shard in range(shards)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+        else:
+            self.run_shard(symbols)
+
+    def run_shard(self, symbols, shard=None):
         loop = asyncio.get_event_loop()
-        loop.run_until_complete(self.listen_binance())  # run the async function
+        loop.run_until_complete(self.listen_binance(symbols, shard))  # run the async function
+
+    async def listen_binance(self, symbols, shard=None):
+        stats_key = WRITER_STATS_KEY if shard is None else f"{WRITER_STATS_KEY}:{shard}"
+        live = LiveBars() if LIVE_PUBLISH_HZ > 0 else None  # in-progress bars for WebSocket clients
+        writer = RedisTradeWriter(stats_key=stats_key, live=live)
+        gaps = GapFiller(writer, log=self.stderr.write)  # backfills what was missed while a connection was down
+        tasks = [asyncio.create_task(writer.run())]  # writes to Redis without blocking the socket loops
+        if live is not None:
+            tasks.append(asyncio.create_task(live.run()))
 
-    async def listen_binance(self):
-        r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        try:
+            await asyncio.gather(*[
+                self.listen_connection(streams, writer, gaps) for streams in chunked(symbols, STREAMS_PER_CONNECTION)
+            ])  # one connection per chunk of symbols
+        finally:
+            for task in tasks + list(gaps.tasks):
+                task.cancel()
 
+    async def listen_connection(self, symbols, writer, gaps):
+        backoff = Backoff()
         while True:
             try:
-                async with websockets.connect(BINANCE_WS_URL) as websocket:
+                # a silently dead connection has to be noticed before the bars of its last trades are closed
+                async with websockets.connect(
+                    BINANCE_WS_URL, ping_interval=LISTENER_PING_SECONDS, ping_timeout=LISTENER_PING_SECONDS,
+                ) as websocket:
                     subscribe_message = {
                         "method": "SUBSCRIBE",
-                        "params": [f"{symbol}@trade" for symbol in SYMBOLS],
+                        "params": [f"{symbol}@trade" for symbol in symbols],
                         "id": 1
                     }
                     await websocket.send(json.dumps(subscribe_message))
+                    gaps.recover(symbols)  # trades missed since the last connection, live trades wait meanwhile
 
                     async for message in websocket:
-                        data = json.loads(message)
-                        if "s" in data and "p" in data:
-                            symbol = data["s"].lower()
-                            trade_data = {
-                                "symbol": symbol,
-                                "price": data["p"],
-                                "quantity": data["q"],
-                                "trade_time": data["T"],
-                            }
-                            r.lpush(f"trades:{symbol}", json.dumps(trade_data)) # save trade to Redis
-                            r.ltrim(f"trades:{symbol}", 0, TIME_INTERVAL)
+                        trade = decode_trade(message)
+                        if trade is not None:
+                            await gaps.put(trade.symbol.lower(), trade)  # queue trade for Redis
+                            backoff.reset()
             except Exception as e:
-                self.stderr.write(f"Error: {e}, reconnecting...")
-                await asyncio.sleep(5) # reconnect after 5 seconds
+                await gaps.hold(symbols)  # their bars stay open until the gap is backfilled
+                delay = backoff.next_delay()
+                stats = writer.stats.as_dict(writer.queue.qsize())
+                self.stderr.write(f"Error: {e}, reconnecting in {delay:.1f}s... writer stats: {stats}")
+                await asyncio.sleep(delay)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from TradeWS.variables import PARTITION_PERIOD, PARTITIONS_AHEAD
+from api.partitions import PERIODS, maintain_partitions
+
+
+class Command(BaseCommand):
+    help = "Create upcoming PostgreSQL partitions of trades and bars and drop the ones past the retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD,
+                            help="Partitions to create ahead of the current one")
+        parser.add_argument("--period", choices=list(PERIODS), default=PARTITION_PERIOD)
+        parser.add_argument("--dry-run", action="store_true", help="Only print what would be created and dropped")
+
+    def handle(self, *args, **options):
+        try:
+            changes = maintain_partitions(period=options["period"], ahead=options["ahead"], dry_run=options["dry_run"])
+        except ValueError as error:
+            raise CommandError(error)
+
+        if not changes:
+            self.stdout.write("The tables are not partitioned (PostgreSQL only, see migration 0008)")
+        for table, (created, dropped) in changes.items():
+            self.stdout.write(f"{table}: created {', '.join(created) or 'nothing'}, dropped {', '.join(dropped) or 'nothing'}")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from TradeWS.variables import PERSIST_BATCH_SIZE, PERSIST_RAW_TRADES
+from api.persist import TradePersister
+
+
+class Command(BaseCommand):
+    help = "Move raw trades from the Redis trade stream to the database with COPY"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=PERSIST_BATCH_SIZE, help="Trades per COPY, the last stream read may add a few more")
+        parser.add_argument("--once", action="store_true", help="Persist one batch and exit")
+
+    def handle(self, *args, **options):
+        if not PERSIST_RAW_TRADES:
+            self.stderr.write("PERSIST_RAW_TRADES is off, the listener does not add raw trades to the stream")
+
+        persister = TradePersister(batch_size=options["batch_size"])
+        if options["once"]:
+            read = persister.persist_once(block=False)
+            self.stdout.write(f"Read {read} trades, {persister.written} new")
+            return
+        persister.run()  # run as many processes as needed, they share the "persist" consumer group
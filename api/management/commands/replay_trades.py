@@ -0,0 +1,34 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import history_cache
+from api.replay import CHUNK_ROWS, find_archives, replay_archives, replay_intervals
+from api.rollups import INTERVALS
+
+
+class Command(BaseCommand):
+    help = "Rebuild bars from Binance trade archives (daily trades or aggTrades .zip/.csv files) on local disk"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Archive files or directories to search for them")
+        parser.add_argument("--symbols", help="Comma-separated symbols to replay, all found by default")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes aggregating the files")
+        parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="CSV lines aggregated at once")
+
+    def handle(self, *args, **options):
+        symbols = {symbol.strip().lower() for symbol in (options["symbols"] or "").split(",") if symbol.strip()}
+        paths = find_archives(options["paths"], symbols)
+        if not paths:
+            raise CommandError("No archives found, expected files like BTCUSDT-trades-2024-01-01.zip")
+
+        skipped = sorted(set(INTERVALS) - set(replay_intervals()))
+        if skipped:
+            self.stderr.write(f"Intervals longer than a day are not rebuilt: {', '.join(skipped)}")
+
+        def progress(symbol, day, rows):
+            self.stdout.write(f"{symbol} {day}: {rows} bars")
+
+        days = replay_archives(paths, options["workers"], options["chunk_rows"], progress)
+        history_cache.invalidate({symbol.upper() for symbol in days})  # cached history pages are stale
+        self.stdout.write(f"Replayed {sum(days.values())} days of {len(days)} symbols")
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tickeraggregate',
+            name='trade_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество сделок'),
+        ),
+        migrations.AddField(
+            model_name='tickeraggregate',
+            name='vwap',
+            field=models.DecimalField(blank=True, decimal_places=10, max_digits=20, null=True, verbose_name='Средневзвешенная цена'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_tickeraggregate_vwap_trade_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackedSymbol',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=10, unique=True, verbose_name='Торговая пара')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активна')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_trackedsymbol'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tickeraggregate',
+            name='buy_volume',
+            field=models.DecimalField(blank=True, decimal_places=10, max_digits=20, null=True, verbose_name='Объём покупок'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_tickeraggregate_buy_volume'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tickeraggregate',
+            name='interval',
+            field=models.CharField(db_index=True, default='1m', max_length=4, verbose_name='Интервал'),
+        ),
+    ]
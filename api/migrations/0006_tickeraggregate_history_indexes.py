@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_tickeraggregate_interval'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tickeraggregate',
+            name='interval',
+            field=models.CharField(default='1m', max_length=4, verbose_name='Интервал'),
+        ),
+        migrations.AlterField(
+            model_name='tickeraggregate',
+            name='start_time',
+            field=models.DateTimeField(verbose_name='Начало интервала'),
+        ),
+        migrations.AlterField(
+            model_name='tickeraggregate',
+            name='symbol',
+            field=models.CharField(max_length=10, verbose_name='Торговая пара'),
+        ),
+        migrations.AddIndex(
+            model_name='tickeraggregate',
+            index=models.Index(fields=['symbol', 'interval', '-start_time', '-id'], name='ticker_symbol_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tickeraggregate',
+            index=models.Index(fields=['interval', '-start_time', '-id'], name='ticker_time_idx'),
+        ),
+    ]
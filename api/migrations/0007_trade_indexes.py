@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_tickeraggregate_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trade',
+            name='symbol',
+            field=models.CharField(max_length=10, verbose_name='Торговая пара'),
+        ),
+        migrations.AlterField(
+            model_name='trade',
+            name='trade_time',
+            field=models.DateTimeField(verbose_name='Время сделки'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['symbol', '-trade_time'], name='trade_symbol_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['-trade_time'], name='trade_time_idx'),
+        ),
+    ]
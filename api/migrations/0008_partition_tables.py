@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations
+
+# Fixed here, so the migration does the same whatever the settings and api.partitions become later:
+# monthly partitions named as api.partitions names them, maintain_partitions continues from them.
+PARTITIONS_AHEAD = 3
+TABLES = [  # table, partition key, indexes (the ones of the models, recreated on the partitioned table)
+    ("api_trade", "trade_time", [
+        ("trade_symbol_time_idx", '"symbol", "trade_time" DESC'),
+        ("trade_time_idx", '"trade_time" DESC'),
+    ]),
+    ("api_tickeraggregate", "start_time", [
+        ("ticker_symbol_time_idx", '"symbol", "interval", "start_time" DESC, "id" DESC'),
+        ("ticker_time_idx", '"interval", "start_time" DESC, "id" DESC'),
+    ]),
+]
+
+
+def month_start(moment):
+    return moment.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def partition_tables(apps, schema_editor):
+    """
+    Rebuilds the tables as range-partitioned ones (PostgreSQL only) and copies the rows over.
+    The primary key has to include the partition key, so it becomes (id, <time>); id keeps its own sequence.
+    Rows outside of every partition go to the DEFAULT partition <table>_default instead of failing the insert,
+    api.partitions.create_partition moves them out when their partition is created.
+    The copy locks the tables, run it while the listener and Celery are stopped.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+
+    now = datetime.now(timezone.utc)
+    with connection.cursor() as cursor:
+        for table, column, indexes in TABLES:
+            cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [table])
+            if cursor.fetchone():
+                continue
+            old, sequence = f"{table}_unpartitioned", f"{table}_id_partitioned_seq"
+
+            cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+            cursor.execute(f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS) PARTITION BY RANGE ("{column}")')
+            cursor.execute(f'CREATE SEQUENCE "{sequence}" OWNED BY "{table}"."id"')
+            cursor.execute(f'ALTER TABLE "{table}" ALTER COLUMN "id" SET DEFAULT nextval(\'"{sequence}"\')')
+            cursor.execute(f'SELECT setval(\'"{sequence}"\', COALESCE((SELECT max("id") FROM "{old}"), 0) + 1, false)')
+
+            cursor.execute(f'SELECT min("{column}") FROM "{old}"')
+            oldest, = cursor.fetchone()
+            start = month_start(min(oldest or now, now))
+            last = month_start(now)
+            for _ in range(PARTITIONS_AHEAD + 1):
+                last = next_month(last)
+            while start < last:  # every month with rows, then PARTITIONS_AHEAD ahead of the current one
+                end = next_month(start)
+                cursor.execute(
+                    f'CREATE TABLE "{table}_p{start:%Y%m}" PARTITION OF "{table}" FOR VALUES FROM (%s) TO (%s)',
+                    [start, end],
+                )
+                start = end
+            cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+            cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{old}"')
+            cursor.execute(f'DROP TABLE "{old}"')  # frees the names of its primary key and indexes
+            cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY ("id", "{column}")')
+            for name, columns in indexes:
+                cursor.execute(f'CREATE INDEX "{name}" ON "{table}" ({columns})')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_trade_indexes'),
+    ]
+
+    operations = [
+        # not reversible in place: the partitioned tables keep working with the previous migrations
+        migrations.RunPython(partition_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_partition_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trade',
+            name='is_buyer_maker',
+            field=models.BooleanField(blank=True, null=True, verbose_name='Покупатель - мейкер'),
+        ),
+        migrations.AddField(
+            model_name='trade',
+            name='trade_id',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='ID сделки Binance'),
+        ),
+        migrations.AddConstraint(
+            model_name='trade',
+            constraint=models.UniqueConstraint(fields=('symbol', 'trade_id', 'trade_time'), name='trade_unique_id'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+TASK_NAME = "manage_partitions"
+
+
+def add_task(apps, schema_editor):
+    """Daily run of TradeWS.tasks.manage_partitions, so the partitions ahead never run out."""
+    CrontabSchedule = apps.get_model("django_celery_beat", "CrontabSchedule")
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+
+    schedule, _ = CrontabSchedule.objects.get_or_create(
+        minute="0", hour="3", day_of_week="*", day_of_month="*", month_of_year="*", timezone="UTC",
+    )
+    PeriodicTask.objects.get_or_create(
+        name=TASK_NAME, defaults={"task": "TradeWS.tasks.manage_partitions", "crontab": schedule},
+    )
+
+
+def remove_task(apps, schema_editor):
+    apps.get_model("django_celery_beat", "PeriodicTask").objects.filter(name=TASK_NAME).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_trade_raw_fields'),
+        ('django_celery_beat', '0019_alter_periodictasks_options'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_task, remove_task),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_manage_partitions_task'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tickeraggregate',
+            name='buy_volume',
+            field=models.DecimalField(blank=True, decimal_places=10, max_digits=38, null=True, verbose_name='Объём покупок'),
+        ),
+        migrations.AlterField(
+            model_name='tickeraggregate',
+            name='volume',
+            field=models.DecimalField(decimal_places=10, max_digits=38, verbose_name='Объём'),
+        ),
+        migrations.AlterField(
+            model_name='trade',
+            name='quantity',
+            field=models.DecimalField(decimal_places=10, max_digits=38, verbose_name='Объём'),
+        ),
+    ]
@@ -2,24 +2,55 @@ from django.db import models
 
 
 class Trade(models.Model):
-    symbol = models.CharField("Торговая пара", max_length=10, db_index=True)
+    symbol = models.CharField("Торговая пара", max_length=10)
     price = models.DecimalField("Цена", max_digits=20, decimal_places=10)
-    quantity = models.DecimalField("Объём", max_digits=20, decimal_places=10)
-    trade_time = models.DateTimeField("Время сделки", db_index=True)
+    quantity = models.DecimalField("Объём", max_digits=38, decimal_places=10)  # or a bar volume, aggregate_trades
+    trade_time = models.DateTimeField("Время сделки")
+    trade_id = models.BigIntegerField("ID сделки Binance", null=True, blank=True)  # raw trades only, see api.persist
+    is_buyer_maker = models.BooleanField("Покупатель - мейкер", null=True, blank=True)
 
     class Meta:
         ordering = ['-trade_time']
+        indexes = [  # on PostgreSQL the table is partitioned by trade_time, see api.partitions
+            models.Index(fields=['symbol', '-trade_time'], name='trade_symbol_time_idx'),
+            models.Index(fields=['-trade_time'], name='trade_time_idx'),
+        ]
+        constraints = [  # a trade id is unique per symbol, trade_time is part of it because of the partitioning
+            models.UniqueConstraint(fields=['symbol', 'trade_id', 'trade_time'], name='trade_unique_id'),
+        ]
 
 
 class TickerAggregate(models.Model):
-    symbol = models.CharField("Торговая пара", max_length=10, db_index=True)
-    start_time = models.DateTimeField("Начало интервала", db_index=True)
+    symbol = models.CharField("Торговая пара", max_length=10)
+    interval = models.CharField("Интервал", max_length=4, default="1m")  # "1m", "5m", "1h", ...
+    start_time = models.DateTimeField("Начало интервала")
     end_time = models.DateTimeField("Конец интервала")
     open_price = models.DecimalField("Открытие", max_digits=20, decimal_places=10)
     close_price = models.DecimalField("Закрытие", max_digits=20, decimal_places=10)
     high_price = models.DecimalField("Максимум", max_digits=20, decimal_places=10)
     low_price = models.DecimalField("Минимум", max_digits=20, decimal_places=10)
-    volume = models.DecimalField("Объём", max_digits=20, decimal_places=10)
+    # volumes of cheap coins (SHIBUSDT, PEPEUSDT) pass 10 ** 10 within an hour, hence 38 digits
+    volume = models.DecimalField("Объём", max_digits=38, decimal_places=10)
+    vwap = models.DecimalField("Средневзвешенная цена", max_digits=20, decimal_places=10, null=True, blank=True)
+    trade_count = models.PositiveIntegerField("Количество сделок", default=0)
+    buy_volume = models.DecimalField("Объём покупок", max_digits=38, decimal_places=10, null=True, blank=True)
 
     class Meta:
         ordering = ['-start_time']
+        # history pages are read as (start_time, id) ranges, see api.pagination;
+        # on PostgreSQL the table is partitioned by start_time, see api.partitions
+        indexes = [
+            models.Index(fields=['symbol', 'interval', '-start_time', '-id'], name='ticker_symbol_time_idx'),
+            models.Index(fields=['interval', '-start_time', '-id'], name='ticker_time_idx'),  # all symbols
+        ]
+
+
+class TrackedSymbol(models.Model):
+    name = models.CharField("Торговая пара", max_length=10, unique=True)
+    is_active = models.BooleanField("Активна", default=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
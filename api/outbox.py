@@ -0,0 +1,181 @@
+"""
+Bounded outbound queues of WebSocket connections. Handlers of TradeConsumer only put frames into the queue,
+a task per connection sends them, so a slow client costs at most `size` frames of memory
+instead of a growing channel layer backlog that ends in silently dropped messages.
+The queue only fills when sending stops. Daphne's send never waits: it writes into the unbounded buffer
+of the Twisted transport, so the bytes buffered there are read (server_buffer) and frames wait in the queue
+while they are above WS_SEND_BUFFER_BYTES. Under another server the send must wait under backpressure
+(e.g. uvicorn with websockets), or slow clients are never noticed.
+"""
+import asyncio
+import os
+import socket
+import time
+import weakref
+from collections import OrderedDict
+from functools import partial
+from itertools import count
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from TradeWS.variables import (
+    REDIS_HOST, REDIS_PORT, WS_SEND_QUEUE_SIZE, WS_SEND_POLICY, WS_SLOW_CONSUMER_SECONDS, WS_SEND_BUFFER_BYTES,
+)
+from api.latency import LatencyHistogram
+
+POLICIES = ("conflate", "drop")
+WEBSOCKET_STATS_KEY = f"stats:websocket:{socket.gethostname()}:{os.getpid()}"  # one hash per server process
+STATS_INTERVAL = 5.0  # seconds between writes of WEBSOCKET_STATS_KEY
+BUFFER_POLL_SECONDS = 0.05  # how often a full server buffer is checked again
+
+
+def server_buffer(send):
+    """
+    Function returning the bytes the server buffered for the connection of the ASGI `send`, not yet taken
+    by the socket, or None when the server does not tell. Daphne passes partial(Server.handle_reply, protocol),
+    the protocol writes to a Twisted transport (abstract.FileDescriptor; not behind Twisted's own TLS).
+    """
+    protocol = send.args[0] if isinstance(send, partial) and send.args else None
+    transport = getattr(protocol, "transport", None)
+    if not hasattr(transport, "dataBuffer") or not hasattr(transport, "_tempDataLen"):
+        return None
+    return lambda: len(transport.dataBuffer) - transport.offset + transport._tempDataLen
+
+
+class Outbox:
+    """
+    Frames with a key (e.g. a symbol's bar) replace the pending frame with the same key and keep its place,
+    with the "conflate" policy. Frames without a key, and all frames with the "drop" policy, are always queued.
+    When the queue is full, "conflate" drops the oldest frame and "drop" drops the new one.
+    A client whose queue stays full for `max_lag` seconds is `lagging` and should be disconnected:
+    `put` returns False then, and `on_lagging` (a coroutine function) is called even if no frame follows.
+    Frames put with `event_time` (ms, the Binance trade time) add to the send latency histogram once written.
+    With `buffered` (see server_buffer) frames are not sent while it returns more than `max_buffered` bytes.
+    """
+
+    def __init__(self, send, size=WS_SEND_QUEUE_SIZE, policy=WS_SEND_POLICY, max_lag=WS_SLOW_CONSUMER_SECONDS,
+                 on_lagging=None, buffered=None, max_buffered=WS_SEND_BUFFER_BYTES):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown send policy {policy!r}, expected one of {POLICIES}")
+        self.send = send  # coroutine function sending one text frame
+        self.size = size
+        self.policy = policy
+        self.max_lag = max_lag
+        self.frames = OrderedDict()  # key -> (frame, event time)
+        self.keys = count()  # keys of frames that are never replaced
+        self.ready = asyncio.Event()
+        self.behind_since = None  # when the queue got full, None once it is below `size` again
+        self.on_lagging = on_lagging
+        self.lag_check = None  # timer calling on_lagging once the queue has been full for max_lag
+        self.lag_task = None
+        self.buffered = buffered
+        self.max_buffered = max_buffered
+        stats.outboxes.add(self)
+
+    def put(self, frame, key=None, event_time=None):  # False when the client is too slow to keep
+        if key is None or self.policy == "drop":
+            key = next(self.keys)
+        if key in self.frames:
+            self.frames[key] = (frame, event_time)
+            stats.conflated += 1
+        elif len(self.frames) >= self.size:
+            if self.behind_since is None:
+                self.behind_since = time.monotonic()
+                self.watch_lag()
+            stats.dropped += 1
+            if self.policy == "conflate":
+                self.frames.popitem(last=False)
+                self.frames[key] = (frame, event_time)
+        else:
+            self.frames[key] = (frame, event_time)
+        self.ready.set()
+        return not self.lagging()
+
+    def lagging(self):
+        return self.behind_since is not None and time.monotonic() - self.behind_since >= self.max_lag
+
+    def watch_lag(self):
+        if self.on_lagging is not None:
+            if self.lag_check is not None:
+                self.lag_check.cancel()
+            self.lag_check = asyncio.get_running_loop().call_later(self.max_lag, self.check_lag)
+
+    def check_lag(self):
+        self.lag_check = None
+        if self.behind_since is None or self.lag_task is not None:  # caught up meanwhile
+            return
+        remaining = self.behind_since + self.max_lag - time.monotonic()
+        if remaining > 0:
+            self.lag_check = asyncio.get_running_loop().call_later(remaining, self.check_lag)
+        else:
+            self.lag_task = asyncio.create_task(self.on_lagging())
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            while self.frames:
+                if self.buffered is not None and self.buffered() > self.max_buffered:
+                    await asyncio.sleep(BUFFER_POLL_SECONDS)  # the client does not read, new frames queue up
+                    continue
+                _, (frame, event_time) = self.frames.popitem(last=False)
+                if len(self.frames) < self.size:
+                    self.behind_since = None  # room for a new frame again
+                await self.send(frame)  # waits while the server applies backpressure
+                stats.sent += 1
+                if event_time is not None:
+                    stats.latency.record(time.time() * 1000 - event_time)
+            self.ready.clear()
+
+    def close(self):  # called when the connection is gone
+        if self.lag_check is not None:
+            self.lag_check.cancel()
+        stats.outboxes.discard(self)
+
+
+class WebSocketStats:  # counters of the server process, written to WEBSOCKET_STATS_KEY
+    def __init__(self):
+        self.outboxes = weakref.WeakSet()
+        self.sent = 0
+        self.conflated = 0  # frames replaced by a newer frame with the same key
+        self.dropped = 0  # frames lost because a queue was full
+        self.evictions = 0  # slow clients disconnected
+        self.latency = LatencyHistogram()  # Binance trade time -> frame written, live frames only
+        self.next_write = 0
+        self.redis = None
+        self.loop = None  # the loop self.redis belongs to
+
+    def as_dict(self):
+        depths = [len(outbox.frames) for outbox in self.outboxes]
+        return {
+            "connections": len(depths),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "lagging": sum(outbox.behind_since is not None for outbox in self.outboxes),
+            "server_buffered": sum(outbox.buffered() for outbox in self.outboxes if outbox.buffered is not None),
+            "sent": self.sent,
+            "conflated": self.conflated,
+            "dropped": self.dropped,
+            "evictions": self.evictions,
+            **self.latency.as_dict("send_latency"),
+        }
+
+    async def write(self, force=False):  # at most once per STATS_INTERVAL unless forced
+        now = time.monotonic()
+        if now < self.next_write and not force:
+            return
+        self.next_write = now + STATS_INTERVAL
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:  # connections of a client cannot be used from another loop
+            self.loop = loop
+            self.redis = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(WEBSOCKET_STATS_KEY, mapping=self.as_dict())
+                pipe.expire(WEBSOCKET_STATS_KEY, int(STATS_INTERVAL * 3))  # gone soon after the process stops
+                await pipe.execute()
+        except (RedisError, OSError):
+            pass
+
+
+stats = WebSocketStats()
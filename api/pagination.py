@@ -0,0 +1,94 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from collections import OrderedDict
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on (start_time, id), newest first.
+    A page is read as one index range from the last row of the previous page, so deep pages cost
+    the same as the first one, and there is no count(*).
+    The cursor is opaque: direction, start_time and id of the row the page continues from.
+    """
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[0]
+
+        if cursor is None:
+            queryset = queryset.order_by('-start_time', '-id')
+        elif reverse:  # previous page: rows after the cursor, read oldest first
+            _, start_time, pk = cursor
+            queryset = queryset.filter(start_time__gte=start_time).exclude(start_time=start_time, id__lte=pk)
+            queryset = queryset.order_by('start_time', 'id')
+        else:
+            _, start_time, pk = cursor
+            queryset = queryset.filter(start_time__lte=start_time).exclude(start_time=start_time, id__gte=pk)
+            queryset = queryset.order_by('-start_time', '-id')
+
+        rows = list(queryset[:self.limit + 1])  # one extra row tells whether there is more
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if reverse:
+            rows.reverse()
+
+        self.next_row = rows[-1] if rows and (reverse or has_more) else None
+        self.previous_row = rows[0] if rows and ((reverse and has_more) or (cursor and not reverse)) else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_link(self.next_row, False)),
+            ('previous', self.get_link(self.previous_row, True)),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(limit, 1), self.max_page_size)
+
+    def decode_cursor(self, request):  # (reverse, start_time, id) or None for the first page
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            direction, start_time, pk = urlsafe_b64decode(encoded.encode()).decode().split(',')
+            start_time = parse_datetime(start_time)
+            pk = int(pk)
+        except (Base64Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('n', 'p') or start_time is None:
+            raise NotFound(self.invalid_cursor_message)
+        return direction == 'p', start_time, pk
+
+    def get_link(self, row, reverse):
+        if row is None:
+            return None
+        cursor = urlsafe_b64encode(f"{'p' if reverse else 'n'},{row.start_time.isoformat()},{row.id}".encode())
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor.decode())
@@ -0,0 +1,166 @@
+"""
+PostgreSQL range partitions of the Trade and TickerAggregate tables, by month or day of their time column.
+Partitions are named <table>_p<YYYYMM> or <table>_p<YYYYMMDD>, their bounds are read from the name.
+maintain_partitions creates the current and PARTITIONS_AHEAD next partitions and drops whole partitions
+that are past the retention, so retention never deletes rows. Other databases are left alone.
+Rows without a partition land in the DEFAULT partition <table>_default (migration 0008)
+until their partition is created.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection, transaction
+
+from TradeWS.variables import PARTITION_PERIOD, PARTITIONS_AHEAD, TRADE_RETENTION_DAYS, BAR_RETENTION_DAYS
+from api.models import Trade, TickerAggregate
+
+PERIODS = {"month": "%Y%m", "day": "%Y%m%d"}
+PARTITIONED = [  # model, partition key column, retention days
+    (Trade, "trade_time", TRADE_RETENTION_DAYS),
+    (TickerAggregate, "start_time", BAR_RETENTION_DAYS),
+]
+
+
+def period_start(moment, period):
+    day = moment.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day.replace(day=1) if period == "month" else day
+
+
+def next_period(start, period):
+    if period == "day":
+        return start + timedelta(days=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def partition_name(table, start, period):
+    return f"{table}_p{start.strftime(PERIODS[period])}"
+
+
+def partition_bounds(table, name):  # (start, end) of a partition created here, None for anything else
+    suffix = name[len(table) + 2:] if name.startswith(f"{table}_p") else ""
+    for period, date_format in PERIODS.items():
+        if len(suffix) == len(datetime(2000, 1, 1).strftime(date_format)):
+            try:
+                start = datetime.strptime(suffix, date_format).replace(tzinfo=timezone.utc)
+            except ValueError:
+                return None
+            return start, next_period(start, period)
+    return None
+
+
+def plan_partitions(table, existing, now, period=PARTITION_PERIOD, ahead=PARTITIONS_AHEAD, retention_days=0):
+    """
+    Partitions to create ([(name, start, end)]) and to drop ([name]) given the names of the existing ones.
+    A new partition is skipped when it would overlap an existing one (e.g. after switching from month to day).
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown partition period {period!r}, expected one of {list(PERIODS)}")
+    bounds = [bound for bound in (partition_bounds(table, name) for name in existing) if bound]
+
+    create = []
+    start = period_start(now, period)
+    for _ in range(ahead + 1):
+        end = next_period(start, period)
+        if not any(start < existing_end and existing_start < end for existing_start, existing_end in bounds):
+            create.append((partition_name(table, start, period), start, end))
+        start = end
+
+    drop = []
+    if retention_days > 0:
+        cutoff = now - timedelta(days=retention_days)
+        drop = sorted(name for name in existing if (bound := partition_bounds(table, name)) and bound[1] <= cutoff)
+    return create, drop
+
+
+def default_partition(table):
+    return f"{table}_default"
+
+
+def partition_key(table):
+    return next(column for model, column, _ in PARTITIONED if model._meta.db_table == table)
+
+
+def is_partitioned(table):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [table])
+        return cursor.fetchone() is not None
+
+
+def existing_partitions(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass", [table]
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def create_partition(table, name, start, end):
+    """
+    Creates the partition [start, end) unless it exists. Rows of the range in the DEFAULT partition
+    are moved into it first, PostgreSQL refuses to create the partition otherwise.
+    """
+    quote = connection.ops.quote_name
+    default, column = quote(default_partition(table)), quote(partition_key(table))
+    in_range = f"{column} >= %s AND {column} < %s"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s), to_regclass(%s)", [quote(name), default])
+        exists, has_default = cursor.fetchone()
+        if exists:
+            return
+        if has_default:
+            cursor.execute(f"SELECT 1 FROM {default} WHERE {in_range} LIMIT 1", [start, end])
+        if not has_default or cursor.fetchone() is None:
+            cursor.execute(
+                f"CREATE TABLE {quote(name)} PARTITION OF {quote(table)} FOR VALUES FROM (%s) TO (%s)", [start, end]
+            )
+            return
+        cursor.execute(f"CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS)")
+        cursor.execute(f"INSERT INTO {quote(name)} SELECT * FROM {default} WHERE {in_range}", [start, end])
+        cursor.execute(f"DELETE FROM {default} WHERE {in_range}", [start, end])
+        cursor.execute(f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)",
+                       [start, end])
+
+
+def ensure_partitions(model, moments, period=PARTITION_PERIOD):
+    """
+    Creates the missing partitions of the periods of `moments`, e.g. the days of an import of old data,
+    so its rows do not pile up in the DEFAULT partition. Returns the names created.
+    """
+    table = model._meta.db_table
+    if not is_partitioned(table):
+        return []
+    existing = list(existing_partitions(table))
+    created = []
+    for period_begin in sorted({period_start(moment, period) for moment in moments}):
+        for name, start, end in plan_partitions(table, existing, period_begin, period, ahead=0)[0]:
+            create_partition(table, name, start, end)
+            existing.append(name)
+            created.append(name)
+    return created
+
+
+def drop_partition(table, name):
+    # dropping a partition detaches it in the same statement; DETACH ... CONCURRENTLY is not an option,
+    # PostgreSQL refuses it while the table has a DEFAULT partition
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+
+
+def maintain_partitions(now=None, period=PARTITION_PERIOD, ahead=PARTITIONS_AHEAD, dry_run=False):
+    """Returns {table: (created names, dropped names)}, empty when the tables are not partitioned."""
+    now = now or datetime.now(timezone.utc)
+    changes = {}
+    for model, _, retention_days in PARTITIONED:
+        table = model._meta.db_table
+        if not is_partitioned(table):
+            continue
+        create, drop = plan_partitions(table, existing_partitions(table), now, period, ahead, retention_days)
+        if not dry_run:
+            for name, start, end in create:
+                create_partition(table, name, start, end)
+            for name in drop:
+                drop_partition(table, name)
+        changes[table] = ([name for name, _, _ in create], drop)
+    return changes
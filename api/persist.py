@@ -0,0 +1,103 @@
+"""
+Raw trade persistence. With PERSIST_RAW_TRADES the listener adds every trade to the trade stream (api.streams),
+and the persist_trades command (the "persist" consumer group) moves them to the Trade table in large batches:
+PostgreSQL gets one COPY FROM STDIN into a temporary table and one INSERT ... ON CONFLICT DO NOTHING per batch,
+so the Binance trade id deduplicates replays. Entries are acknowledged only after the batch is committed:
+a crash between the two replays the batch, never loses it.
+"""
+import io
+from datetime import datetime, timezone
+
+from django.db import close_old_connections, connection, transaction
+
+from TradeWS.variables import PERSIST_BATCH_SIZE
+from api.fixedpoint import SCALE_DIGITS, from_scaled
+from api.models import Trade
+from api.streams import PERSIST_GROUP, StreamConsumer
+
+COPY_COLUMNS = "symbol, trade_id, price, quantity, trade_time, is_buyer_maker"
+
+
+def copy_rows(batches):
+    """
+    Tab-separated COPY text of [(symbol, RECORD_DTYPE array)]: prices, quantities and times stay integers,
+    PostgreSQL scales them in the INSERT.
+    """
+    buffer = io.StringIO()
+    for symbol, trades in batches:
+        symbol = symbol.upper()
+        buffer.writelines(
+            f"{symbol}\t{trade_id}\t{price}\t{quantity}\t{trade_time}\t{'t' if maker else 'f'}\n"
+            for trade_id, price, quantity, trade_time, maker in zip(
+                trades["trade_id"].tolist(), trades["price"].tolist(), trades["quantity"].tolist(),
+                trades["trade_time"].tolist(), trades["is_buyer_maker"].tolist(),
+            )
+        )
+    buffer.seek(0)
+    return buffer
+
+
+def copy_trades(batches):  # returns how many trades were new
+    if connection.vendor != "postgresql":
+        return insert_trades(batches)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE persist_trades (symbol varchar(10), trade_id bigint, price bigint, quantity bigint, "
+            "trade_time bigint, is_buyer_maker boolean) ON COMMIT DROP"
+        )
+        cursor.copy_expert(f"COPY persist_trades ({COPY_COLUMNS}) FROM STDIN", copy_rows(batches))
+        cursor.execute(
+            f"INSERT INTO {Trade._meta.db_table} ({COPY_COLUMNS}) "
+            f"SELECT symbol, trade_id, price::numeric / 1e{SCALE_DIGITS}, quantity::numeric / 1e{SCALE_DIGITS}, "
+            f"timestamptz 'epoch' + trade_time * interval '1 millisecond', is_buyer_maker FROM persist_trades "
+            f"ON CONFLICT (symbol, trade_id, trade_time) DO NOTHING"
+        )
+        return cursor.rowcount
+
+
+def insert_trades(batches):  # other databases (tests, SQLite): the ORM with the same deduplication
+    existing = Trade.objects.count()
+    Trade.objects.bulk_create([
+        Trade(
+            symbol=symbol.upper(), trade_id=int(trade["trade_id"]), price=from_scaled(trade["price"]),
+            quantity=from_scaled(trade["quantity"]), is_buyer_maker=bool(trade["is_buyer_maker"]),
+            trade_time=datetime.fromtimestamp(int(trade["trade_time"]) / 1000, tz=timezone.utc),
+        )
+        for symbol, trades in batches for trade in trades
+    ], ignore_conflicts=True)
+    return Trade.objects.count() - existing
+
+
+class TradePersister:
+    def __init__(self, consumer=None, batch_size=PERSIST_BATCH_SIZE):
+        # several processes share the group; backfilled aggregate trades are not raw trades, they are not stored
+        self.consumer = consumer or StreamConsumer(PERSIST_GROUP, skip_aggregated=True)
+        self.batch_size = batch_size
+        self.read = 0
+        self.written = 0
+
+    def persist_once(self, block=True):  # one batch of about batch_size trades, returns trades read
+        entries = []
+        read = 0
+        while read < self.batch_size:  # stream entries are writer flushes, usually far smaller than a batch
+            more = self.consumer.read(block=block and not entries)
+            if not more:
+                break
+            entries += more
+            read += sum(len(trades) for _, _, trades in more)
+        if not entries:
+            return 0
+
+        with transaction.atomic():
+            self.written += copy_trades([(symbol, trades) for _, symbol, trades in entries])
+        self.consumer.ack([entry_id for entry_id, _, _ in entries])  # only once the trades are committed
+
+        self.read += read
+        return read
+
+    def run(self):
+        while True:
+            close_old_connections()  # the command runs for days
+            self.persist_once()
+            self.consumer.write_stats(trades=self.read, written=self.written)
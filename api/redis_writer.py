@@ -0,0 +1,197 @@
+import asyncio
+import time
+from collections import defaultdict
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from TradeWS.variables import (
+    REDIS_HOST, REDIS_PORT, TIME_INTERVAL,
+    REDIS_WRITE_QUEUE_SIZE, REDIS_WRITE_BATCH_SIZE, REDIS_WRITE_FLUSH_MS, STORE_RAW_TRADES, BAR_SOURCE,
+    PERSIST_RAW_TRADES,
+)
+from api.bars import (
+    MERGE_BAR_SCRIPT, PUSH_TRADES_SCRIPT, bar_keys, trade_bucket_keys, trades_key, group_by_bucket, summarize_trades,
+)
+from api.codecs import encode_trade_record
+from api.streams import add_trades
+
+WRITER_STATS_KEY = "stats:redis_writer"
+
+
+class WriterStats:
+    def __init__(self):
+        self.enqueued = 0  # trades accepted from the socket loop
+        self.written = 0  # trades written to Redis
+        self.dropped = 0  # trades lost because a flush failed
+        self.late = 0  # trades that arrived after their bar was closed
+        self.queue_full = 0  # how many times the socket loop had to wait for the writer
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def record_flush(self, trades_count, elapsed_ms):
+        self.flushes += 1
+        self.written += trades_count
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+
+    def as_dict(self, queue_depth):
+        return {
+            "queue_depth": queue_depth,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "late": self.late,
+            "queue_full": self.queue_full,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0,
+        }
+
+
+class RedisTradeWriter:
+    """
+    Buffers trades coming from the Binance socket in a bounded queue and writes them
+    to Redis from a separate task, one pipelined MULTI per batch.
+    A batch is flushed when it reaches `batch_size` trades or `flush_ms` after its first trade.
+    Every flush folds the batch into the running bars of the time buckets it covers,
+    raw trade lists (one per bucket, expiring after TIME_INTERVAL) are only kept when `store_raw` is enabled.
+    With `bar_source` "trades" the raw trades of each bucket are kept instead, until aggregate_trades drains them.
+    With `bar_source` "stream", or with `persist`, every batch is added to the trade stream (api.streams);
+    the listener then keeps no bars, the "bars" consumer group of the stream does. Aggregated (backfilled) trades
+    go into the bars as the others, but into the stream only for the "bars" group, in entries of their own.
+    Written batches are also folded into `live` (api.live.LiveBars) when it is given.
+    """
+
+    def __init__(self, client=None, queue_size=REDIS_WRITE_QUEUE_SIZE,
+                 batch_size=REDIS_WRITE_BATCH_SIZE, flush_ms=REDIS_WRITE_FLUSH_MS, store_raw=STORE_RAW_TRADES,
+                 stats_key=WRITER_STATS_KEY, bar_source=BAR_SOURCE, live=None, persist=PERSIST_RAW_TRADES):
+        self.redis = client or aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        self.merge_bar = self.redis.register_script(MERGE_BAR_SCRIPT)
+        self.push_trades = self.redis.register_script(PUSH_TRADES_SCRIPT)
+        self.bar_source = bar_source
+        self.store_raw = store_raw
+        self.stats_key = stats_key
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.stats = WriterStats()
+        self.live = live
+        self.stream = bar_source == "stream" or persist  # consumer groups of the stream: aggregate_stream, persist_trades
+        self.flushed = 0  # trades taken from the queue and flushed (or dropped), see wait_flushed
+        self.flush_done = asyncio.Event()  # set and replaced after every flush
+        self.last_entry_id = None  # of the last stream entry written
+
+    async def put(self, symbol, trade, aggregated=False):
+        if self.queue.full():
+            self.stats.queue_full += 1  # backpressure: the socket loop waits here until the writer catches up
+        await self.queue.put((symbol, trade, aggregated))
+        self.stats.enqueued += 1
+
+    async def wait_flushed(self):  # until every trade put so far is written to Redis, or dropped
+        target = self.stats.enqueued
+        while self.flushed < target:
+            await self.flush_done.wait()
+
+    async def run(self):
+        while True:
+            batch, count, aggregated = await self._collect()
+            await self.flush(batch, count, aggregated)
+
+    async def _collect(self):  # (live trades, count, aggregated trades), trades by symbol
+        loop = asyncio.get_running_loop()
+        batch = defaultdict(list)
+        aggregated = defaultdict(list)
+
+        symbol, trade, is_aggregated = await self.queue.get()  # wait for the first trade of the batch
+        (aggregated if is_aggregated else batch)[symbol].append(trade)
+        count = 1
+        deadline = loop.time() + self.flush_interval
+
+        while count < self.batch_size:
+            if self.queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    symbol, trade, is_aggregated = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                symbol, trade, is_aggregated = self.queue.get_nowait()
+            (aggregated if is_aggregated else batch)[symbol].append(trade)
+            count += 1
+
+        return batch, count, aggregated
+
+    async def flush(self, batch, count, aggregated=None):
+        started = time.perf_counter()
+        aggregated = aggregated or {}
+        merges = []  # (position in the pipeline, trades in the bucket)
+        live = []  # (position in the pipeline, symbol, bucket, summary)
+        entries = []  # positions of the XADDs in the pipeline
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for symbol in {**aggregated, **batch}:
+                    trades = aggregated.get(symbol, []) + batch.get(symbol, [])  # backfilled ones come first
+                    if self.stream and batch.get(symbol):
+                        entries.append(len(pipe))
+                        add_trades(pipe, symbol, batch[symbol])
+                    if self.bar_source == "stream" and aggregated.get(symbol):  # skipped by persist_trades
+                        entries.append(len(pipe))
+                        add_trades(pipe, symbol, aggregated[symbol], aggregated=True)
+                    for bucket, bucket_trades in group_by_bucket(trades).items():
+                        if self.bar_source == "stream":  # bars are merged by aggregate_stream
+                            if self.live is not None:
+                                live.append((None, symbol, bucket, summarize_trades(bucket_trades)))
+                            continue
+
+                        position = len(pipe)
+                        merges.append((position, len(bucket_trades)))
+                        summary = None
+                        if self.bar_source != "trades" or self.live is not None:
+                            summary = summarize_trades(bucket_trades)
+                            if self.live is not None:
+                                live.append((position, symbol, bucket, summary))
+
+                        if self.bar_source == "trades":
+                            records = [encode_trade_record(trade) for trade in bucket_trades]
+                            await self.push_trades(keys=trade_bucket_keys(symbol, bucket), args=[bucket, *records],
+                                                   client=pipe)
+                            continue
+
+                        await self.merge_bar(keys=bar_keys(symbol, bucket), args=[bucket, *summary], client=pipe)
+                        if self.store_raw:
+                            key = trades_key(symbol, bucket)
+                            pipe.rpush(key, *[encode_trade_record(trade) for trade in bucket_trades])
+                            pipe.expire(key, TIME_INTERVAL)
+                stats = self.stats.as_dict(self.queue.qsize())
+                if self.live is not None:
+                    stats.update(self.live.stats())
+                pipe.hset(self.stats_key, mapping=stats)
+                results = await pipe.execute()
+        except RedisError:
+            self.stats.errors += 1
+            self.stats.dropped += count
+            self._flushed(count)
+            return
+
+        if entries:
+            self.last_entry_id = results[entries[-1]]
+        self.stats.late += sum(trades_count for position, trades_count in merges if results[position] == -1)
+        for position, symbol, bucket, summary in live:
+            if position is None or results[position] != -1:
+                self.live.merge(symbol, bucket, summary)
+        self.stats.record_flush(count, (time.perf_counter() - started) * 1000)
+        self._flushed(count)
+
+    def _flushed(self, count):
+        self.flushed += count
+        self.flush_done.set()
+        self.flush_done = asyncio.Event()
@@ -0,0 +1,94 @@
+"""
+Output formats of the trade history (?format=... or the Accept header).
+History pages arrive as api.serializers.HistoryRows and are encoded straight from the value tuples.
+"""
+import csv
+import io
+
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+
+from api.codecs import dumpb
+from api.serializers import HISTORY_FIELDS, HistoryRows
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+def _is_page(data):
+    return isinstance(data, dict) and isinstance(data.get('results'), HistoryRows)
+
+
+def _set_links(data, renderer_context):  # pagination links go to the Link header when the body has no room for them
+    response = (renderer_context or {}).get('response')
+    links = [f'<{data[rel]}>; rel="{rel}"' for rel in ('next', 'previous') if data.get(rel)]
+    if response is not None and links:
+        response['Link'] = ', '.join(links)
+
+
+class FastJSONRenderer(JSONRenderer):  # api.codecs instead of json.dumps, default format
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if _is_page(data):
+            data = {**data, 'results': self.results(data['results'])}
+        if self.get_indent(accepted_media_type, renderer_context or {}) is None:  # browsable API wants it indented
+            try:
+                return dumpb(data)
+            except TypeError:  # ErrorDetail and other DRF types
+                pass
+        return super().render(data, accepted_media_type, renderer_context)
+
+    def results(self, rows):
+        return rows.as_dicts()
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):  # "results": {"field": [values...]}, field names are sent once
+    format = 'columnar'
+
+    def results(self, rows):
+        return rows.as_columns()
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if _is_page(data):
+            _set_links(data, renderer_context)
+            writer.writerow(HISTORY_FIELDS)
+            writer.writerows(zip(*data['results'].formatted_columns()))
+        elif isinstance(data, dict):  # a single bar or an error
+            writer.writerow(data.keys())
+            writer.writerow(data.values())
+        return buffer.getvalue().encode(self.charset)
+
+
+if pyarrow is not None:
+    class ArrowRenderer(BaseRenderer):  # Arrow IPC stream with typed columns, for pandas / polars clients
+        media_type = 'application/vnd.apache.arrow.stream'
+        format = 'arrow'
+        charset = None
+        render_style = 'binary'
+
+        def render(self, data, accepted_media_type=None, renderer_context=None):
+            if _is_page(data):
+                _set_links(data, renderer_context)
+                table = pyarrow.table(dict(zip(HISTORY_FIELDS, data['results'].columns())))
+            else:
+                table = pyarrow.Table.from_pylist([data] if isinstance(data, dict) else [])
+            sink = pyarrow.BufferOutputStream()
+            with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue().to_pybytes()
+
+
+HISTORY_RENDERERS = [FastJSONRenderer, BrowsableAPIRenderer, ColumnarJSONRenderer, CSVRenderer]
+if pyarrow is not None:
+    HISTORY_RENDERERS.append(ArrowRenderer)
@@ -0,0 +1,225 @@
+"""
+Rebuilds bar history from Binance trade archives on local disk (data.binance.vision daily files,
+<SYMBOL>-trades-<YYYY-MM-DD>.zip or <SYMBOL>-aggTrades-<YYYY-MM-DD>.zip, or the extracted .csv).
+Every (symbol, day) file is aggregated by a process of a pool: the CSV is streamed straight out of the zip
+in chunks of `chunk_rows` lines, every chunk is aggregated with api.aggregation and the partial bars
+are combined, so memory stays bounded by a chunk. Rollups are combined from the base bars of the day.
+The parent creates the missing partitions of the days first (api.partitions),
+then replaces the bars of each day in one transaction with bulk inserts.
+"""
+import io
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from itertools import islice
+
+import numpy as np
+from django.db import connections, transaction
+
+from api.aggregation import aggregate_bars
+from api.bars import BAR_INTERVAL_MS
+from api.codecs import RECORD_DTYPE, RECORD_VERSION
+from api.fixedpoint import SCALE, to_scaled, from_scaled, div_scaled, sum_scaled
+from api.models import TickerAggregate
+from api.partitions import ensure_partitions
+from api.rollups import INTERVALS, VWAP_QUANTUM
+
+ARCHIVE_NAME = re.compile(r"^(?P<symbol>[A-Z0-9]+)-(?P<kind>trades|aggTrades)-(?P<day>\d{4}-\d{2}-\d{2})\.(zip|csv)$")
+COLUMNS = {  # CSV columns: price, quantity, time, buyer is maker, and for aggTrades the first and last trade id
+    "trades": (1, 2, 4, 5),
+    "aggTrades": (1, 2, 5, 6, 3, 4),
+}
+CHUNK_ROWS = 1_000_000
+# below it a parsed float64 rounds back to the exact scaled value: parsing and multiplying by SCALE are off by
+# up to 2 ** -3 each under 2 ** 50, closer to 2 ** 52 the errors add up to more than half a unit
+FLOAT_EXACT_LIMIT = 2 ** 50 // SCALE
+BAR_FIELDS = (
+    "bucket", "open", "high", "low", "close", "volume", "buy_volume", "quote_volume", "price_sum", "count",
+    "open_time", "close_time",
+)
+
+
+def parse_archive_name(path):  # (symbol, kind, day) or None for other files
+    match = ARCHIVE_NAME.match(os.path.basename(path))
+    if match is None:
+        return None
+    return match["symbol"], match["kind"], date.fromisoformat(match["day"])
+
+
+def find_archives(paths, symbols=None):  # archive files under the paths, sorted by symbol and day
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+        else:
+            files.append(path)
+    archives = [(parse_archive_name(path), path) for path in files]
+    return [
+        path for name, path in sorted(archive for archive in archives if archive[0])
+        if not symbols or name[0].lower() in symbols
+    ]
+
+
+@contextmanager
+def open_archive(path):  # text stream of the CSV, read straight out of the zip
+    if not path.endswith(".zip"):
+        with open(path, encoding="ascii") as stream:
+            yield stream
+        return
+    with zipfile.ZipFile(path) as archive:
+        member = next(name for name in archive.namelist() if name.endswith(".csv"))
+        with io.TextIOWrapper(archive.open(member), encoding="ascii") as stream:
+            yield stream
+
+
+def scale_column(values, lines, column):
+    """
+    Scaled integers of a column parsed as float64. Values too large for a float to keep 8 decimals
+    are parsed again from their text, so the result is always exact.
+    """
+    scaled = np.rint(values * SCALE).astype(np.int64)
+    for i in np.flatnonzero(np.abs(values) >= FLOAT_EXACT_LIMIT):
+        scaled[i] = to_scaled(lines[i].split(",")[column].strip())
+    return scaled
+
+
+def read_chunks(path, kind, chunk_rows=CHUNK_ROWS):
+    """Yields (RECORD_DTYPE array, fills per trade) of every chunk, fills are 1 for raw trades."""
+    columns = COLUMNS[kind]
+    dtype = np.dtype([("price", "f8"), ("quantity", "f8"), ("time", "i8"), ("maker", "U5")] + (
+        [("first", "i8"), ("last", "i8")] if kind == "aggTrades" else []
+    ))
+    with open_archive(path) as stream:
+        while lines := list(islice(stream, chunk_rows)):
+            if not lines[0][:1].isdigit():  # newer archives start with a header
+                lines = lines[1:]
+                if not lines:
+                    continue
+            rows = np.loadtxt(lines, delimiter=",", usecols=columns, dtype=dtype, ndmin=1)
+            trades = np.empty(len(rows), dtype=RECORD_DTYPE)
+            trades["version"] = RECORD_VERSION
+            trades["trade_id"] = 0
+            trades["price"] = scale_column(rows["price"], lines, columns[0])
+            trades["quantity"] = scale_column(rows["quantity"], lines, columns[1])
+            times = rows["time"]
+            trades["trade_time"] = times // 1000 if times[0] >= 10 ** 14 else times  # microseconds since 2025
+            trades["is_buyer_maker"] = np.char.lower(rows["maker"]) == "true"
+            fills = rows["last"] - rows["first"] + 1 if kind == "aggTrades" else np.ones(len(rows), dtype=np.int64)
+            yield trades, fills
+
+
+def aggregate_chunk(trades, fills):  # base bars of a chunk, trade counts include every fill of an aggregate trade
+    order = np.argsort(trades["trade_time"], kind="stable")
+    trades, fills = trades[order], fills[order]
+    bars = aggregate_bars(trades, BAR_INTERVAL_MS, quantiles=())
+    bars["count"] = np.add.reduceat(fills, np.searchsorted(trades["trade_time"], bars["bucket"]))
+    return {field: bars[field] for field in BAR_FIELDS}
+
+
+def combine_bars(bars, interval_ms):
+    """Combines bars (dict of arrays, BAR_FIELDS) into bars of `interval_ms`, e.g. partial bars of chunks or rollups."""
+    buckets = bars["bucket"] - bars["bucket"] % interval_ms
+    by_open = np.lexsort((bars["open_time"], buckets))
+    by_close = np.lexsort((bars["close_time"], buckets))
+    sorted_buckets = buckets[by_open]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_buckets)) + 1))
+    ends = np.append(starts[1:], len(sorted_buckets))
+
+    combined = {"bucket": sorted_buckets[starts]}
+    for field, reduce in (("high", np.maximum), ("low", np.minimum), ("count", np.add)):
+        combined[field] = reduce.reduceat(bars[field][by_open], starts)
+    for field in ("volume", "buy_volume", "quote_volume", "price_sum"):  # a day of quote volume overflows int64
+        combined[field] = sum_scaled(bars[field][by_open], starts)
+    for field in ("open", "open_time"):
+        combined[field] = bars[field][by_open][starts]
+    for field in ("close", "close_time"):
+        combined[field] = bars[field][by_close][ends - 1]
+    return combined
+
+
+def aggregate_archive(path, intervals, chunk_rows=CHUNK_ROWS):
+    """
+    Runs in a pool process. Returns (symbol, day, {interval label: bars}) for the intervals
+    ({label: seconds}, the first one is the base interval).
+    """
+    symbol, kind, day = parse_archive_name(path)
+    chunks = [aggregate_chunk(trades, fills) for trades, fills in read_chunks(path, kind, chunk_rows)]
+    if not chunks:
+        return symbol, day, {}
+    base = combine_bars({field: np.concatenate([chunk[field] for chunk in chunks]) for field in BAR_FIELDS},
+                        BAR_INTERVAL_MS)  # a bar may span two chunks
+    return symbol, day, {label: combine_bars(base, seconds * 1000) for label, seconds in intervals.items()}
+
+
+def bar_objects(symbol, label, seconds, bars):
+    columns = [bars[field].tolist() for field in BAR_FIELDS]
+    return [
+        TickerAggregate(
+            symbol=symbol.upper(),
+            interval=label,
+            start_time=datetime.fromtimestamp(bucket / 1000, tz=timezone.utc),
+            end_time=datetime.fromtimestamp(bucket / 1000 + seconds, tz=timezone.utc),
+            open_price=from_scaled(open_price),
+            close_price=from_scaled(close_price),
+            high_price=from_scaled(high),
+            low_price=from_scaled(low),
+            volume=from_scaled(volume),
+            buy_volume=from_scaled(buy_volume),
+            vwap=div_scaled(quote_volume, volume).quantize(VWAP_QUANTUM) if volume else None,
+            trade_count=count,
+        )
+        for bucket, open_price, high, low, close_price, volume, buy_volume, quote_volume, _, count, _, _
+        in zip(*columns)
+    ]
+
+
+def replay_intervals():  # intervals rebuilt per day: rollups longer than a day would span several files
+    return {label: seconds for label, seconds in INTERVALS.items() if 86400 % seconds == 0}
+
+
+def store_day(symbol, day, bars_by_interval, intervals):  # replaces the bars of the day, returns rows written
+    start = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
+    bars = [
+        bar for label, bars in bars_by_interval.items() for bar in bar_objects(symbol, label, intervals[label], bars)
+    ]
+    with transaction.atomic():
+        TickerAggregate.objects.filter(
+            symbol=symbol.upper(), interval__in=list(intervals), start_time__gte=start,
+            start_time__lt=start + timedelta(days=1),
+        ).delete()
+        TickerAggregate.objects.bulk_create(bars, batch_size=5000)
+    return len(bars)
+
+
+def replay_archives(paths, workers=None, chunk_rows=CHUNK_ROWS, progress=None):
+    """
+    Aggregates the archive files in a pool of `workers` processes (in this process with one worker)
+    and stores every day as soon as it is aggregated. `progress` is called with (symbol, day, rows written).
+    Returns {symbol: days replayed}.
+    """
+    intervals = replay_intervals()
+    days = {parse_archive_name(path)[2] for path in paths}
+    ensure_partitions(TickerAggregate, [datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc) for day in days])
+    if workers == 1:
+        results = (aggregate_archive(path, intervals, chunk_rows) for path in paths)
+        return _store_results(results, intervals, progress)
+
+    connections.close_all()  # forked processes must not share the DB connection
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(aggregate_archive, paths, [intervals] * len(paths), [chunk_rows] * len(paths))
+        return _store_results(results, intervals, progress)
+
+
+def _store_results(results, intervals, progress):
+    days = {}
+    for symbol, day, bars_by_interval in results:
+        if not bars_by_interval:
+            continue
+        rows = store_day(symbol, day, bars_by_interval, intervals)
+        days[symbol] = days.get(symbol, 0) + 1
+        if progress is not None:
+            progress(symbol, day, rows)
+    return days
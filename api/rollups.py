@@ -0,0 +1,120 @@
+"""
+Multi-resolution bars: every closed BAR_INTERVAL bar is folded into the running bar
+of each coarser interval (ROLLUP_INTERVALS), so no history is ever rescanned.
+"""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from TradeWS.variables import BAR_INTERVAL, ROLLUP_INTERVALS
+from api.models import TickerAggregate
+
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+VWAP_QUANTUM = Decimal(1).scaleb(-10)  # decimal_places of TickerAggregate.vwap
+
+
+def interval_seconds(label):  # "15m" -> 900
+    number, unit = label[:-1], label[-1:]
+    if unit not in UNITS or not number.isdigit() or int(number) == 0:
+        raise ValueError(f"Invalid interval: {label!r}")
+    return int(number) * UNITS[unit]
+
+
+def interval_label(seconds):  # 900 -> "15m"
+    for unit, unit_seconds in sorted(UNITS.items(), key=lambda item: -item[1]):
+        if seconds % unit_seconds == 0:
+            return f"{seconds // unit_seconds}{unit}"
+
+
+def _rollup_intervals():
+    rollups = {}
+    for label in ROLLUP_INTERVALS:
+        seconds = interval_seconds(label)
+        if seconds <= BAR_INTERVAL or seconds % BAR_INTERVAL:
+            raise ValueError(f"Rollup interval {label!r} must be a multiple of BAR_INTERVAL ({BAR_INTERVAL}s)")
+        rollups[interval_label(seconds)] = seconds
+    return rollups
+
+
+BASE_INTERVAL = interval_label(BAR_INTERVAL)
+ROLLUPS = _rollup_intervals()  # label -> seconds
+INTERVALS = {BASE_INTERVAL: BAR_INTERVAL, **ROLLUPS}  # every interval stored in TickerAggregate
+
+
+def rollup_start(start_time, seconds):  # epoch-aligned, same as api.bars.bucket_start
+    timestamp = int(start_time.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=timezone.utc)
+
+
+def rollup_bars(bars):
+    """
+    Folds newly closed base bars (TickerAggregate) into the coarser bars of every rollup interval.
+    A rollup bar is stored as soon as its first base bar closes and is updated in place until its interval ends.
+    Base bars must close in time order, as aggregate_trades closes them (open_price is taken from the first one).
+    Must run inside a transaction, the running rollup bars are locked while they are updated.
+    Returns the rollup bars touched.
+    """
+    rollups = {}  # (symbol, interval, start_time) -> TickerAggregate
+    for bar in bars:
+        for label, seconds in ROLLUPS.items():
+            rollups.setdefault((bar.symbol, label, rollup_start(bar.start_time, seconds)), None)
+    if not rollups:
+        return []
+
+    existing = TickerAggregate.objects.select_for_update().filter(
+        symbol__in={symbol for symbol, _, _ in rollups},
+        interval__in={label for _, label, _ in rollups},
+        start_time__in={start_time for _, _, start_time in rollups},
+    )
+    for rollup in existing:
+        key = (rollup.symbol, rollup.interval, rollup.start_time)
+        if key in rollups:
+            rollups[key] = rollup
+    created = {key for key, rollup in rollups.items() if rollup is None}
+
+    for bar in sorted(bars, key=lambda bar: bar.start_time):
+        for label, seconds in ROLLUPS.items():
+            key = (bar.symbol, label, rollup_start(bar.start_time, seconds))
+            rollup = rollups[key]
+            if rollup is None:
+                rollups[key] = _new_rollup(bar, label, key[2], seconds)
+            else:
+                _merge(rollup, bar)
+
+    TickerAggregate.objects.bulk_create([rollups[key] for key in created])
+    TickerAggregate.objects.bulk_update([rollup for key, rollup in rollups.items() if key not in created], [
+        'close_price', 'high_price', 'low_price', 'volume', 'buy_volume', 'vwap', 'trade_count',
+    ])
+    return list(rollups.values())
+
+
+def _new_rollup(bar, label, start_time, seconds):
+    return TickerAggregate(
+        symbol=bar.symbol,
+        interval=label,
+        start_time=start_time,
+        end_time=start_time + timedelta(seconds=seconds),
+        open_price=bar.open_price,
+        close_price=bar.close_price,
+        high_price=bar.high_price,
+        low_price=bar.low_price,
+        volume=bar.volume,
+        buy_volume=bar.buy_volume,
+        vwap=bar.vwap,
+        trade_count=bar.trade_count,
+    )
+
+
+def _merge(rollup, bar):
+    if rollup.vwap is None or bar.vwap is None:
+        rollup.vwap = rollup.vwap if bar.vwap is None else bar.vwap
+    elif rollup.volume + bar.volume:  # volume-weighted, quote volumes are added back up
+        rollup.vwap = ((rollup.vwap * rollup.volume + bar.vwap * bar.volume) / (rollup.volume + bar.volume)).quantize(
+            VWAP_QUANTUM
+        )
+    rollup.close_price = bar.close_price
+    rollup.high_price = max(rollup.high_price, bar.high_price)
+    rollup.low_price = min(rollup.low_price, bar.low_price)
+    rollup.volume += bar.volume
+    if bar.buy_volume is not None:
+        rollup.buy_volume = (rollup.buy_volume or 0) + bar.buy_volume
+    rollup.trade_count += bar.trade_count
@@ -1,3 +1,5 @@
+from django.db import models
+from django.utils import timezone
 from rest_framework import serializers
 
 from api.models import TickerAggregate
@@ -7,3 +9,67 @@ class TickerAggregateSerializer(serializers.ModelSerializer):
     class Meta:
         model = TickerAggregate
         fields = '__all__'
+
+
+HISTORY_FIELDS = tuple(field.attname for field in TickerAggregate._meta.concrete_fields)  # same as fields='__all__'
+
+
+def _decimal_column(decimal_places):  # DecimalField.to_representation without the per-value context work
+    def format_column(values):
+        return [None if value is None else f"{value:.{decimal_places}f}" for value in values]
+    return format_column
+
+
+def _datetime_column(values):  # DateTimeField.to_representation, the current time zone is looked up once
+    tz = timezone.get_current_timezone()
+    values = [None if value is None else value.astimezone(tz).isoformat() for value in values]
+    return [value[:-6] + 'Z' if value and value.endswith('+00:00') else value for value in values]
+
+
+def _formatters():
+    formatters = []
+    for field in TickerAggregate._meta.concrete_fields:
+        if isinstance(field, models.DecimalField):
+            formatters.append(_decimal_column(field.decimal_places))
+        elif isinstance(field, models.DateTimeField):
+            formatters.append(_datetime_column)
+        else:
+            formatters.append(None)  # str / int go out as they are
+    return formatters
+
+
+HISTORY_FORMATTERS = _formatters()  # one function per field, formats a whole column
+
+
+class HistoryRows:
+    """
+    A page of TickerAggregate rows as values_list() tuples in HISTORY_FIELDS order.
+    Skips model instances and serializer fields: the renderer formats the values column by column,
+    with the same output as TickerAggregateSerializer.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.as_dicts())
+
+    def columns(self):  # typed values, one list per field
+        if not self.rows:
+            return [[] for _ in HISTORY_FIELDS]
+        return [list(column) for column in zip(*self.rows)]
+
+    def formatted_columns(self):
+        return [
+            column if formatter is None else formatter(column)
+            for formatter, column in zip(HISTORY_FORMATTERS, self.columns())
+        ]
+
+    def as_columns(self):  # {"field": [values...]}
+        return dict(zip(HISTORY_FIELDS, self.formatted_columns()))
+
+    def as_dicts(self):  # [{"field": value}, ...] as TickerAggregateSerializer(many=True).data
+        return [dict(zip(HISTORY_FIELDS, row)) for row in zip(*self.formatted_columns())]
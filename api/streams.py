@@ -0,0 +1,248 @@
+"""
+Redis Stream of raw trades (TRADE_STREAM_KEY), written by the listener with XADD ... MINID ~ <now - retention>:
+one entry per symbol and writer flush, its trades as concatenated binary records (codecs.RECORD).
+Every consumer group reads the whole stream independently: "bars" (aggregate_stream, BAR_SOURCE = "stream")
+and "persist" (persist_trades). Processes of one group share the entries, so each can be scaled out.
+An entry is acknowledged only once it is processed; entries left pending by a dead process are claimed
+by the others after TRADE_STREAM_CLAIM_IDLE_MS, so a stalled process may find its entries taken over. Entries older than TRADE_STREAM_RETENTION_SECONDS are trimmed
+even if a group did not read them yet, whatever the trade rate: keep it above how long a consumer may be stopped.
+"""
+import os
+import socket
+import time
+from collections import defaultdict
+
+import numpy as np
+import redis
+from redis.exceptions import ResponseError
+
+from TradeWS.variables import (
+    REDIS_HOST, REDIS_PORT, TRADE_STREAM_RETENTION_SECONDS, TRADE_STREAM_BATCH, TRADE_STREAM_CLAIM_IDLE_MS,
+)
+from api.aggregation import aggregate_bars
+from api.bars import MERGE_BAR_SCRIPT, BAR_INTERVAL_MS, bar_keys
+from api.codecs import RECORD_DTYPE, encode_trade_record
+
+TRADE_STREAM_KEY = "stream:trades"
+BARS_GROUP = "bars"
+PERSIST_GROUP = "persist"
+STREAM_STATS_KEY = "stats:stream"  # stats:stream:<group>:<consumer>
+
+# Acknowledges stream entries and merges their partial bars (MERGE_BAR_SCRIPT) at once, if the consumer
+# still owns every entry. Another consumer may have claimed some of them while this one stalled, then nothing changes.
+# KEYS[1] - stream, then the 3 bar_keys of every merge
+# ARGV[1] - group, ARGV[2] - consumer, ARGV[3] - number of entries, the entry ids,
+# then the 12 MERGE_BAR_SCRIPT arguments of every merge
+# Returns {1, MERGE_BAR_SCRIPT results} or {0, ids of the entries owned by others}.
+ACK_AND_MERGE_SCRIPT = """
+local function merge_bar(KEYS, ARGV)
+""" + MERGE_BAR_SCRIPT + """
+end
+
+local group, consumer, entries = ARGV[1], ARGV[2], tonumber(ARGV[3])
+local lost = {}
+for i = 4, entries + 3 do
+    local pending = redis.call('XPENDING', KEYS[1], group, ARGV[i], ARGV[i], 1)
+    if #pending == 0 or pending[1][2] ~= consumer then
+        lost[#lost + 1] = ARGV[i]
+    end
+end
+if #lost > 0 then
+    return {0, lost}
+end
+
+redis.call('XACK', KEYS[1], group, unpack(ARGV, 4, entries + 3))
+local results = {}
+local arg = entries + 4
+for k = 2, #KEYS, 3 do
+    results[#results + 1] = merge_bar({KEYS[k], KEYS[k + 1], KEYS[k + 2]}, {unpack(ARGV, arg, arg + 11)})
+    arg = arg + 12
+end
+return {1, results}
+"""
+
+
+def stream_entry(symbol, trades, aggregated=False):  # fields of the XADD of one symbol's batch
+    fields = {"symbol": symbol.lower(), "trades": b"".join(encode_trade_record(trade, "binary") for trade in trades)}
+    if aggregated:  # backfilled aggregate trades (api.backfill), one record per taker order
+        fields["aggregated"] = "1"
+    return fields
+
+
+def add_trades(pipe, symbol, trades, retention_seconds=TRADE_STREAM_RETENTION_SECONDS, aggregated=False):
+    minid = int(time.time() * 1000) - retention_seconds * 1000  # entry ids start with the time they were added
+    pipe.xadd(TRADE_STREAM_KEY, stream_entry(symbol, trades, aggregated), minid=minid, approximate=True)
+
+
+def entry_key(entry_id):  # "1700000000000-3" -> (1700000000000, 3), comparable
+    milliseconds, _, sequence = (entry_id.decode() if isinstance(entry_id, bytes) else entry_id).partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+async def group_processed(r, group, entry_id, stream=TRADE_STREAM_KEY):
+    """
+    True once the group has read every entry up to `entry_id` and acknowledged them all. `r` is an asyncio client,
+    used by the listener to wait until aggregate_stream merged what it wrote.
+    """
+    for info in await r.xinfo_groups(stream):
+        name = info["name"]
+        if (name.decode() if isinstance(name, bytes) else name) == group:
+            if entry_key(info["last-delivered-id"]) < entry_key(entry_id):
+                return False
+            return not await r.xpending_range(stream, group, min="-", max=entry_id, count=1)
+    return False
+
+
+def decode_entry(fields):  # (symbol, RECORD_DTYPE array), fields as returned by a client that does not decode
+    return fields[b"symbol"].decode(), np.frombuffer(fields[b"trades"], dtype=RECORD_DTYPE)
+
+
+class StreamConsumer:
+    """
+    One consumer of a group. `read` returns [(entry id, symbol, trades)]: entries pending for more than
+    `claim_idle_ms` in any consumer of the group first (XAUTOCLAIM), then new ones (XREADGROUP, up to `count`
+    entries, waiting up to `block_ms`). Entries have to be acknowledged with `ack` once they are processed.
+    With `skip_aggregated` entries of backfilled aggregate trades are acknowledged right away and not returned.
+    """
+
+    def __init__(self, group, client=None, consumer=None, count=TRADE_STREAM_BATCH, block_ms=1000,
+                 claim_idle_ms=TRADE_STREAM_CLAIM_IDLE_MS, stream=TRADE_STREAM_KEY, skip_aggregated=False):
+        self.redis = client or redis.Redis(host=REDIS_HOST, port=REDIS_PORT)  # records are binary
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}:{os.getpid()}"
+        self.count = count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.stream = stream
+        self.skip_aggregated = skip_aggregated
+        self.claim_from = "0-0"  # XAUTOCLAIM cursor
+        self.next_claim = 0.0
+        self.read_entries = 0
+        self.claimed = 0
+        self.acked = 0
+        self.has_group = False
+
+    def ensure_group(self):  # from the start of the stream, so nothing written before the first consumer is lost
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self.has_group = True
+
+    def read(self, block=True):
+        if not self.has_group:
+            self.ensure_group()
+        entries = self._claim()
+        if not entries:
+            result = self.redis.xreadgroup(
+                self.group, self.consumer, {self.stream: ">"}, count=self.count,
+                block=self.block_ms if block else None,
+            )
+            entries = result[0][1] if result else []
+        self.read_entries += len(entries)
+        skipped = {  # trimmed before they were processed, or not for this group
+            entry_id for entry_id, fields in entries if not fields or (self.skip_aggregated and b"aggregated" in fields)
+        }
+        self.ack([entry_id for entry_id, _ in entries if entry_id in skipped])
+        return [(entry_id, *decode_entry(fields)) for entry_id, fields in entries if entry_id not in skipped]
+
+    def _claim(self):  # pending entries of dead (or stuck) consumers, checked every claim_idle_ms
+        now = time.monotonic()
+        if now < self.next_claim:
+            return []
+        self.claim_from, entries, *_ = self.redis.xautoclaim(
+            self.stream, self.group, self.consumer, self.claim_idle_ms, start_id=self.claim_from, count=self.count,
+        )
+        if self.claim_from in (b"0-0", "0-0"):  # scanned the whole pending list
+            self.next_claim = now + self.claim_idle_ms / 1000
+        self.claimed += len(entries)
+        return entries
+
+    def ack(self, entry_ids, client=None):  # `client` - a pipeline, to ack together with the writes
+        if entry_ids:
+            (client or self.redis).xack(self.stream, self.group, *entry_ids)
+            self.acked += len(entry_ids)
+
+    def stats(self):
+        return {"read": self.read_entries, "claimed": self.claimed, "acked": self.acked}
+
+    def group_stats(self):
+        """
+        Pending entries of the group (read, not acknowledged) and its lag, the entries not read yet
+        (XINFO GROUPS, Redis 7+). The lag is -1 when Redis cannot tell, e.g. right after a trim.
+        """
+        for info in self.redis.xinfo_groups(self.stream):
+            name = info["name"]
+            if (name.decode() if isinstance(name, bytes) else name) == self.group:
+                lag = info.get("lag")
+                return {"group_pending": info["pending"], "group_lag": -1 if lag is None else lag}
+        return {}
+
+    def write_stats(self, **extra):
+        key = f"{STREAM_STATS_KEY}:{self.group}:{self.consumer}"
+        group_stats = self.group_stats()
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={**self.stats(), **group_stats, **extra})
+            pipe.expire(key, 60)  # gone soon after the process stops
+            pipe.execute()
+
+
+def merge_args(trades):  # (bucket, MERGE_BAR_SCRIPT arguments) of every bucket of a RECORD_DTYPE array
+    bars = aggregate_bars(trades, BAR_INTERVAL_MS, quantiles=())
+    columns = [
+        bars[name].tolist() for name in (
+            "bucket", "open", "high", "low", "close", "volume", "quote_volume", "buy_volume", "price_sum", "count",
+            "open_time", "close_time",
+        )
+    ]
+    return [(row[0], list(row)) for row in zip(*columns)]
+
+
+class StreamAggregator:
+    """
+    Folds the trades of the stream into the running bars (the "bars" group), aggregate_trades closes them
+    as with BAR_SOURCE = "bars". The merges of a read and the XACK of its entries are one script
+    (ACK_AND_MERGE_SCRIPT), so a crash applies both or neither. It only runs while the consumer still owns
+    the entries: those claimed by another consumer meanwhile are left to it, so no entry is counted twice.
+    """
+
+    def __init__(self, consumer=None):
+        self.consumer = consumer or StreamConsumer(BARS_GROUP)
+        self.ack_and_merge = self.consumer.redis.register_script(ACK_AND_MERGE_SCRIPT)
+        self.trades = 0
+        self.late = 0
+        self.lost = 0  # entries claimed by another consumer before they were merged here
+
+    def aggregate_once(self, block=True):  # returns how many trades were merged
+        entries = self.consumer.read(block)
+        while entries:
+            by_symbol = defaultdict(list)
+            for _, symbol, trades in entries:
+                by_symbol[symbol].append(trades)
+
+            keys, args, merges = [self.consumer.stream], [], []  # merges - trades count of every merge
+            for symbol, arrays in by_symbol.items():
+                for bucket, merge in merge_args(np.concatenate(arrays)):
+                    keys += bar_keys(symbol, bucket)
+                    args += merge
+                    merges.append(merge[9])
+            entry_ids = [entry_id for entry_id, _, _ in entries]
+            done, results = self.ack_and_merge(
+                keys=keys, args=[self.consumer.group, self.consumer.consumer, len(entry_ids), *entry_ids, *args],
+            )
+            if done:
+                self.consumer.acked += len(entry_ids)
+                read = sum(merges)
+                self.trades += read
+                self.late += sum(count for count, result in zip(merges, results) if result == -1)  # bar already closed
+                return read
+            lost = set(results)
+            self.lost += len(lost)
+            entries = [entry for entry in entries if entry[0] not in lost]  # merged without them
+        return 0
+
+    def run(self):
+        while True:
+            self.aggregate_once()
+            self.consumer.write_stats(trades=self.trades, late=self.late, lost=self.lost)
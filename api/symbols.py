@@ -0,0 +1,21 @@
+import zlib
+
+from TradeWS.variables import SYMBOLS
+from api.models import TrackedSymbol
+
+
+def get_symbols():  # symbols enabled in the admin, or the SYMBOLS setting if there are none
+    symbols = TrackedSymbol.objects.filter(is_active=True).values_list("name", flat=True)
+    return [symbol.lower() for symbol in symbols] or SYMBOLS
+
+
+def shard_for(symbol, shards):  # crc32 instead of hash() so every process and restart agrees
+    return zlib.crc32(symbol.lower().encode()) % shards
+
+
+def shard_symbols(symbols, shard, shards):
+    return [symbol for symbol in symbols if shard_for(symbol, shards) == shard]
+
+
+def chunked(symbols, size):
+    return [symbols[i:i + size] for i in range(0, len(symbols), size)]
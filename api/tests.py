@@ -1,5 +1,10 @@
+import asyncio
 import json
-from unittest.mock import patch, MagicMock, AsyncMock
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from unittest.mock import patch, MagicMock, AsyncMock, ANY
 from decimal import Decimal
 from datetime import datetime, timedelta
 
@@ -14,7 +19,8 @@ from channels.db import database_sync_to_async
 from channels.routing import URLRouter
 from channels.layers import get_channel_layer
 
-from TradeWS.tasks import aggregate_trades
+from TradeWS.tasks import BAD_BAR_ERRORS, aggregate_trades
+from api.cache import HistoryCache, history_cache
 from api.models import Trade, TickerAggregate
 from api.routing import websocket_urlpatterns
 from api.serializers import TickerAggregateSerializer
@@ -40,137 +46,480 @@ class BinanceWebSocketTest(TestCase):  # Tests for connecting to Binance WebSock
         mock_redis.return_value = mock_redis_instance
 
         output = StringIO()
-        call_command('listen_binance', stdout=output)
+        call_command('binance_listener', stdout=output)
 
         mock_loop_instance.run_until_complete.assert_called_once()
 
     @pytest.mark.asyncio
     async def test_binance_websocket_connection(self):
-        from TradeWS.variables import SYMBOLS
+        from io import StringIO
+        from TradeWS.variables import STREAMS_PER_CONNECTION
 
+        symbols = [f"sym{i}usdt" for i in range(STREAMS_PER_CONNECTION * 2 + 1)]
         mock_websocket = AsyncMock()
+        mock_websocket.__aenter__.return_value.__aiter__.side_effect = Exception("Test exit")
 
-        with patch('websockets.connect', return_value=mock_websocket):
+        with patch('websockets.connect', return_value=mock_websocket) as mock_connect, \
+                patch('api.management.commands.binance_listener.RedisTradeWriter') as mock_writer, \
+                patch('asyncio.sleep', side_effect=asyncio.CancelledError):
             from api.management.commands.binance_listener import Command
-            command = Command()
+            mock_writer.return_value.run = AsyncMock()
+            command = Command(stderr=StringIO())
+
+            with self.assertRaises(asyncio.CancelledError):
+                await command.listen_binance(symbols)
+
+            self.assertEqual(mock_connect.call_count, 3)  # symbols are split between connections
+
+            sent = [json.loads(call[0][0]) for call in mock_websocket.__aenter__.return_value.send.call_args_list]
+            self.assertEqual(len(sent), 3)
+            self.assertTrue(all(message["method"] == "SUBSCRIBE" for message in sent))
+            self.assertEqual(
+                [param for message in sent for param in message["params"]],
+                [f"{symbol}@trade" for symbol in symbols],
+            )
+
+    def test_shard_out_of_range(self):
+        from django.core.management import CommandError, call_command
 
-            mock_websocket.__aenter__.return_value.recv = AsyncMock(side_effect=Exception("Test exit"))
+        for args in (["--shards", "4", "--shard", "4"], ["--shards", "4", "--shard", "-1"], ["--shards", "0"]):
+            with patch('api.management.commands.binance_listener.Command.run_shard') as run_shard, \
+                    self.assertRaises(CommandError):
+                call_command('binance_listener', *args)
+            run_shard.assert_not_called()
 
-            try:
-                await command.listen_binance()
-            except Exception as e:
-                if str(e) != "Test exit":
-                    raise
+    def test_symbols_sharding(self):
+        from TradeWS.variables import SYMBOLS
+        from api.models import TrackedSymbol
+        from api.symbols import get_symbols, shard_symbols
+
+        self.assertEqual(get_symbols(), SYMBOLS)  # nothing enabled in the admin
 
-            mock_websocket.__aenter__.assert_called_once()
+        TrackedSymbol.objects.create(name="SOLUSDT")
+        TrackedSymbol.objects.create(name="XRPUSDT", is_active=False)
+        self.assertEqual(get_symbols(), ["solusdt"])
 
-            expected_subscribe_message = {
-                "method": "SUBSCRIBE",
-                "params": [f"{symbol}@trade" for symbol in SYMBOLS],
-                "id": 1
-            }
-            mock_websocket.__aenter__.return_value.send.assert_called_once_with(json.dumps(expected_subscribe_message))
+        symbols = [f"sym{i}usdt" for i in range(100)]
+        shards = [shard_symbols(symbols, shard, 4) for shard in range(4)]
+        self.assertEqual(sorted(symbol for shard in shards for symbol in shard), sorted(symbols))
+        self.assertTrue(all(shard for shard in shards))
+        self.assertEqual(shards, [shard_symbols(list(reversed(symbols)), shard, 4)[::-1] for shard in range(4)])
 
     @pytest.mark.asyncio
     async def test_binance_message_processing(self):
-        from TradeWS.variables import BINANCE_WS_URL, SYMBOLS, TIME_INTERVAL
+        from TradeWS.variables import TIME_INTERVAL
+        from api.codecs import BinanceTrade
+        from api.redis_writer import RedisTradeWriter
 
-        mock_websocket = AsyncMock()
+        mock_pipeline = MagicMock()
+        mock_pipeline.execute = AsyncMock()
         mock_redis_instance = MagicMock()
+        mock_redis_instance.pipeline.return_value.__aenter__.return_value = mock_pipeline
+        mock_merge_bar = AsyncMock()
+        mock_redis_instance.register_script.return_value = mock_merge_bar
+
+        writer = RedisTradeWriter(client=mock_redis_instance, batch_size=10, flush_ms=5, store_raw=True)
+        writer_task = asyncio.create_task(writer.run())
+
+        trade_time = int(datetime.now().timestamp() * 1000)
+        for price in ("45000.00", "45100.00"):
+            await writer.put("btcusdt", BinanceTrade(symbol="BTCUSDT", price=price, quantity="0.5", trade_time=trade_time))
+
+        await asyncio.sleep(0.05)
+        writer_task.cancel()
+
+        mock_redis_instance.pipeline.assert_called_once_with(transaction=True)  # both trades in one round trip
+        mock_pipeline.execute.assert_awaited_once()
+
+        mock_merge_bar.assert_awaited_once()  # batch folded into the running bar with one script call
+        merge_kwargs = mock_merge_bar.call_args.kwargs
+        bucket = trade_time - trade_time % 60000
+        self.assertEqual(merge_kwargs['keys'], [f'bar:v2:btcusdt:{bucket}', 'bars:btcusdt', 'bars:btcusdt:closed'])
+        bar_bucket, open_price, high, low, close_price, volume, quote_volume, buy_volume, price_sum, count, *_ = \
+            merge_kwargs['args']
+        self.assertEqual(bar_bucket, bucket)
+        scale = 10 ** 8  # prices and volumes are fixed-point integers
+        self.assertEqual((open_price, close_price), (45000 * scale, 45100 * scale))
+        self.assertEqual((high, low), (45100 * scale, 45000 * scale))
+        self.assertEqual(volume, 1 * scale)
+        self.assertEqual(quote_volume, 45050 * scale)
+        self.assertEqual(count, 2)
+
+        call_args = mock_pipeline.rpush.call_args[0]
+        self.assertEqual(call_args[0], f'trades:btcusdt:{bucket}')
+        saved_data = [json.loads(trade) for trade in call_args[1:]]
+        self.assertEqual([trade['price'] for trade in saved_data], ['45000.00', '45100.00'])
+        self.assertEqual(saved_data[0]['quantity'], '0.5')
+        self.assertIn('trade_time', saved_data[0])
+
+        mock_pipeline.expire.assert_called_once_with(f'trades:btcusdt:{bucket}', TIME_INTERVAL)
+
+        self.assertEqual(writer.stats.flushes, 1)
+        self.assertEqual(writer.stats.written, 2)
+        self.assertEqual(writer.queue.qsize(), 0)
+
+
+    def test_decode_binance_trade(self):
+        from api.codecs import decode_trade, dumps, loads, BarPayload
+
+        trade = decode_trade(json.dumps({
+            "e": "trade", "E": 1741680000001, "s": "BTCUSDT", "t": 12345, "p": "45000.00", "q": "0.5",
+            "T": 1741680000000, "m": True, "M": True,
+        }))
+        self.assertEqual(
+            (trade.symbol, trade.price, trade.quantity, trade.trade_time, trade.trade_id, trade.is_buyer_maker),
+            ("BTCUSDT", "45000.00", "0.5", 1741680000000, 12345, True),
+        )
+        self.assertIsNone(decode_trade(json.dumps({"result": None, "id": 1})))  # subscription reply
 
-        test_message = json.dumps({
-            "e": "trade",
-            "s": "BTCUSDT",
-            "p": "45000.00",
-            "q": "0.5",
-            "T": int(datetime.now().timestamp() * 1000)
+        bar = BarPayload(symbol="BTCUSDT", open_price="1", close_price="2", high_price="3", low_price="0.5", volume="7")
+        self.assertEqual(loads(dumps(bar)), {
+            "symbol": "BTCUSDT", "open_price": "1", "close_price": "2", "high_price": "3", "low_price": "0.5",
+            "volume": "7", "interval": "1m",
         })
 
-        mock_websocket.__aenter__.return_value.__aiter__.return_value = [test_message]
 
-        with patch('websockets.connect', return_value=mock_websocket), \
-                patch('redis.Redis', return_value=mock_redis_instance):
+class CeleryTasksTest(TestCase):  # Tests for Celery tasks.
 
-            from api.management.commands.binance_listener import Command
-            command = Command()
+    def setUp(self):
+        patcher = patch('TradeWS.tasks.history_cache')
+        self.mock_history_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def make_running_bar(bucket, **fields):  # 45000 x 0.5, 45100 x 0.3, 45200 x 0.7 as accumulated by the listener
+        running_bar = {  # fixed-point integers scaled by 10 ** 8
+            "open": "4500000000000",
+            "high": "4520000000000",
+            "low": "4500000000000",
+            "close": "4520000000000",
+            "volume": "150000000",
+            "quote_volume": "6767000000000",
+            "buy_volume": "150000000",
+            "price_sum": "13530000000000",
+            "count": "3",
+            "open_time": str(bucket + 1000),
+            "close_time": str(bucket + 59000),
+            **fields,
+        }
+        return [item for field in running_bar.items() for item in field]
 
-            with patch.object(command, 'listen_binance', side_effect=Exception("Test exit")):
-                try:
-                    await command.listen_binance()
-                except Exception as e:
-                    if str(e) != "Test exit":
-                        raise
+    @patch('api.broadcast.get_channel_layer')
+    @patch('redis.Redis')
+    def test_aggregate_trades_task(self, mock_redis, mock_get_channel_layer):
+        mock_get_channel_layer.return_value.group_send = AsyncMock()
+        mock_redis_instance = MagicMock()
+        mock_redis.return_value = mock_redis_instance
+        mock_close_bars = mock_redis_instance.register_script.return_value
+        mock_pipeline = mock_redis_instance.pipeline.return_value.__enter__.return_value
 
-            mock_redis_instance.lpush.assert_called_once()
+        test_symbol = "BTCUSDT"
+        bucket = int((datetime.now() - timedelta(minutes=5)).timestamp()) // 60 * 60000
+        mock_pipeline.execute.return_value = [[str(bucket), self.make_running_bar(bucket)]]
 
-            call_args = mock_redis_instance.lpush.call_args[0]
-            self.assertTrue(call_args[0].startswith('trades:'))
+        with patch('TradeWS.tasks.get_symbols', return_value=[test_symbol]), \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            aggregate_trades()
+        self.assertEqual(len(callbacks), 2)  # the bars leave Redis and are published once the tick is committed
+
+        close_kwargs = mock_close_bars.call_args.kwargs
+        self.assertEqual(close_kwargs['keys'], [
+            f"bars:{test_symbol}", f"bars:{test_symbol}:closed", f"bars:{test_symbol}:hold",
+            f"bars:{test_symbol}:pending",
+        ])
+        self.assertEqual(close_kwargs['args'][1], f"bar:v2:{test_symbol}:")
+        self.assertIs(close_kwargs['client'], mock_pipeline)
+        mock_pipeline.delete.assert_called_once_with(f"bar:v2:{test_symbol}:{bucket}")  # only once committed
+        mock_pipeline.zrem.assert_called_once_with(f"bars:{test_symbol}:pending", bucket)
+
+        ticker = TickerAggregate.objects.get(symbol=test_symbol.upper(), interval="1m")
+        self.assertEqual(ticker.high_price, Decimal('45200.00'))
+        self.assertEqual(ticker.low_price, Decimal('45000.00'))
+        self.assertEqual(ticker.open_price, Decimal('45000.00'))
+        self.assertEqual(ticker.close_price, Decimal('45200.00'))
+        self.assertEqual(ticker.volume, Decimal('1.5'))  # 0.5 + 0.3 + 0.7
+        self.assertEqual(ticker.trade_count, 3)
+        self.assertEqual(ticker.vwap, Decimal('45113.3333333333'))  # 67670 / 1.5, exact up to decimal_places
+        self.assertEqual(int(ticker.start_time.timestamp() * 1000), bucket)  # bar covers exactly [start, end)
+        self.assertEqual(ticker.end_time - ticker.start_time, timedelta(minutes=1))
+
+        trade = Trade.objects.get(symbol=test_symbol.upper())
+        avg_price = (45000.00 + 45100.00 + 45200.00) / 3
+        self.assertEqual(float(trade.price), avg_price)
+        self.assertEqual(float(trade.quantity), 1.5)
+
+        self.mock_history_cache.invalidate.assert_called_once_with({test_symbol})
+        mock_redis_instance.hset.assert_any_call("latest_bars", mapping=ANY)  # snapshot for WebSocket clients
+        mapping = mock_redis_instance.hset.call_args_list[0].kwargs['mapping']
+        self.assertEqual(Decimal(json.loads(mapping[test_symbol])['volume']), ticker.volume)
+
+        stats = mock_pipeline.hset.call_args.kwargs['mapping']  # publication latency
+        mock_pipeline.hset.assert_called_with("stats:broadcast", mapping=ANY)
+        self.assertGreaterEqual(stats['last_close_to_publish_ms'], 4 * 60000)  # the bar closed minutes ago
+        self.assertGreaterEqual(stats['last_publish_ms'], 0)
+
+    @patch('api.broadcast.get_channel_layer')
+    @patch('redis.Redis')
+    def test_aggregate_trades_bulk_insert(self, mock_redis, mock_get_channel_layer):
+        mock_redis_instance = MagicMock()
+        mock_redis.return_value = mock_redis_instance
+        mock_pipeline = mock_redis_instance.pipeline.return_value.__enter__.return_value
+        mock_channel_layer = MagicMock()
+        mock_channel_layer.group_send = AsyncMock()
+        mock_get_channel_layer.return_value = mock_channel_layer
+
+        symbols = [f"SYM{i}USDT" for i in range(50)]
+        bucket = int((datetime.now() - timedelta(minutes=5)).timestamp()) // 60 * 60000
+        mock_pipeline.execute.return_value = [[str(bucket), self.make_running_bar(bucket)] for _ in symbols]
+
+        with patch('TradeWS.tasks.get_symbols', return_value=symbols), \
+                patch('api.rollups.ROLLUPS', {"5m": 300}), \
+                self.captureOnCommitCallbacks(execute=True), \
+                self.assertNumQueries(6):  # one rollup keeps every insert within the SQLite parameter limit
+            # savepoint, 2 inserts, running rollup bars (select + insert), release
+            aggregate_trades()
 
-            saved_data = json.loads(call_args[1])
-            self.assertEqual(saved_data['symbol'], 'btcusdt')
-            self.assertEqual(saved_data['price'], '45000.00')
-            self.assertEqual(saved_data['quantity'], '0.5')
-            self.assertIn('trade_time', saved_data)
+        self.assertEqual(TickerAggregate.objects.filter(interval="1m").count(), len(symbols))
+        self.assertEqual(Trade.objects.count(), len(symbols))
 
-            mock_redis_instance.ltrim.assert_called_once()
-            ltrim_args = mock_redis_instance.ltrim.call_args[0]
-            self.assertEqual(ltrim_args[1], 0)
-            self.assertEqual(ltrim_args[2], TIME_INTERVAL)
+        sends = dict(call.args for call in mock_channel_layer.group_send.await_args_list)
+        self.assertEqual(len(sends), 2 * len(symbols) + 1)  # 1m and 5m group of every symbol, all symbols group
+        self.assertEqual(json.loads(sends["bars.SYM0USDT.5m"]["frame"])["interval"], "5m")  # pre-encoded frames
+        message = sends["trades"]  # one message for the whole tick
+        self.assertEqual(message["type"], "send_trade_batch")
+        self.assertEqual(sorted(message["symbols"]), sorted(symbols))
+        self.assertEqual([json.loads(frame)["symbol"] for frame in message["frames"]], message["symbols"])
+        self.assertEqual(mock_redis_instance.hset.call_args_list[0].kwargs['mapping']["SYM0USDT"],
+                         message["frames"][0])
 
+    @patch('api.broadcast.get_channel_layer')
+    @patch('redis.Redis')
+    def test_aggregate_trades_rollups(self, mock_redis, mock_get_channel_layer):
+        mock_get_channel_layer.return_value.group_send = AsyncMock()
+        mock_pipeline = mock_redis.return_value.pipeline.return_value.__enter__.return_value
+        day = int(datetime.now().timestamp()) // 86400 * 86400000  # start of a 5m, 15m, 1h and 1d bar at once
 
-class CeleryTasksTest(TestCase):  # Tests for Celery tasks.
+        with patch('TradeWS.tasks.get_symbols', return_value=["btcusdt"]):
+            mock_pipeline.execute.return_value = [[str(day), self.make_running_bar(day)]]
+            aggregate_trades()
+            mock_pipeline.execute.return_value = [[
+                str(day + 60000), self.make_running_bar(day + 60000, high="4530000000000", low="4490000000000"),
+            ]]
+            aggregate_trades()  # the next minute is folded into the same rollup bars
+
+        self.assertEqual(TickerAggregate.objects.filter(interval="1m").count(), 2)
+        for interval, length in [("5m", 5), ("15m", 15), ("1h", 60), ("1d", 1440)]:
+            rollup = TickerAggregate.objects.get(interval=interval)
+            self.assertEqual(int(rollup.start_time.timestamp() * 1000), day)
+            self.assertEqual(rollup.end_time - rollup.start_time, timedelta(minutes=length))
+            self.assertEqual(
+                (rollup.open_price, rollup.high_price, rollup.low_price, rollup.close_price),
+                (Decimal('45000'), Decimal('45300'), Decimal('44900'), Decimal('45200')),
+            )
+            self.assertEqual(rollup.volume, Decimal('3.0'))
+            self.assertEqual(rollup.buy_volume, Decimal('3.0'))
+            self.assertEqual(rollup.trade_count, 6)
+            self.assertEqual(rollup.vwap, Decimal('45113.3333333333'))
 
+    @patch('api.broadcast.get_channel_layer')
     @patch('redis.Redis')
-    def test_aggregate_trades_task(self, mock_redis):
+    def test_aggregate_trades_from_raw_records(self, mock_redis, mock_get_channel_layer):
+        from api.codecs import BinanceTrade, encode_trade_record
+
+        mock_get_channel_layer.return_value.group_send = AsyncMock()
         mock_redis_instance = MagicMock()
         mock_redis.return_value = mock_redis_instance
+        mock_pipeline = mock_redis_instance.pipeline.return_value.__enter__.return_value
 
-        test_symbol = "BTCUSDT"
-        test_trades = [
-            json.dumps({
-                "symbol": test_symbol,
-                "price": "45000.00",
-                "quantity": "0.5",
-                "trade_time": str(int((datetime.now() - timedelta(minutes=5)).timestamp() * 1000))
-            }),
-            json.dumps({
-                "symbol": test_symbol,
-                "price": "45100.00",
-                "quantity": "0.3",
-                "trade_time": str(int((datetime.now() - timedelta(minutes=2)).timestamp() * 1000))
-            }),
-            json.dumps({
-                "symbol": test_symbol,
-                "price": "45200.00",
-                "quantity": "0.7",
-                "trade_time": str(int(datetime.now().timestamp() * 1000))
-            })
+        bucket = int((datetime.now() - timedelta(minutes=5)).timestamp()) // 60 * 60000
+        trades = [
+            BinanceTrade("BTCUSDT", "45000.00", "0.5", bucket + 1000, 1, False),
+            BinanceTrade("BTCUSDT", "45100.00", "0.3", bucket + 2000, 2, True),
+            BinanceTrade("BTCUSDT", "45200.00", "0.7", bucket + 3000, 3, False),
         ]
+        records = [  # written before and after switching TRADE_RECORD_FORMAT to binary
+            encode_trade_record(trades[0], "json").encode(),
+            encode_trade_record(trades[1], "binary"),
+            encode_trade_record(trades[2], "binary"),
+        ]
+        mock_pipeline.execute.return_value = [[str(bucket).encode(), records]]
 
-        mock_redis_instance.lrange.return_value = test_trades
+        with patch('TradeWS.tasks.get_symbols', return_value=["btcusdt"]), \
+                patch('TradeWS.tasks.BAR_SOURCE', "trades"):
+            aggregate_trades()
 
-        with patch('api.tasks.SYMBOLS', [test_symbol]):
+        mock_redis.assert_called_with(host=ANY, port=ANY)  # binary records, responses are not decoded
+        ticker = TickerAggregate.objects.get(symbol="BTCUSDT", interval="1m")
+        self.assertEqual(
+            (ticker.open_price, ticker.high_price, ticker.low_price, ticker.close_price, ticker.volume),
+            (Decimal('45000'), Decimal('45200'), Decimal('45000'), Decimal('45200'), Decimal('1.5')),
+        )
+        self.assertEqual(ticker.trade_count, 3)
+        self.assertAlmostEqual(float(ticker.vwap), 67670.0 / 1.5)
+        self.assertEqual(int(ticker.start_time.timestamp() * 1000), bucket)
+
+    @patch('api.broadcast.get_channel_layer')
+    @patch('redis.Redis')
+    def test_aggregate_trades_rollback(self, mock_redis, mock_get_channel_layer):
+        mock_pipeline = mock_redis.return_value.pipeline.return_value.__enter__.return_value
+        bucket = int((datetime.now() - timedelta(minutes=5)).timestamp()) // 60 * 60000
+        mock_pipeline.execute.return_value = [[str(bucket), self.make_running_bar(bucket)]]
+
+        with patch('TradeWS.tasks.get_symbols', return_value=["btcusdt"]), \
+                patch('TradeWS.tasks.rollup_bars', side_effect=RuntimeError), \
+                self.captureOnCommitCallbacks(execute=True), \
+                self.assertRaises(RuntimeError):
+            aggregate_trades()
+
+        self.assertFalse(TickerAggregate.objects.exists())
+        mock_get_channel_layer.assert_not_called()  # nothing is published for bars that were rolled back
+        self.mock_history_cache.invalidate.assert_not_called()
+        mock_redis.return_value.hset.assert_not_called()
+        mock_pipeline.delete.assert_not_called()  # the bars stay in Redis
+        mock_pipeline.zrem.assert_not_called()
+        mock_pipeline.zadd.assert_called_once_with("bars:btcusdt:pending", {bucket: 0}, xx=True)  # for the next tick
+
+        mock_pipeline.reset_mock()
+        mock_pipeline.execute.return_value = [[str(bucket), self.make_running_bar(bucket)]]  # taken again
+        with patch('TradeWS.tasks.get_symbols', return_value=["btcusdt"]), \
+                self.captureOnCommitCallbacks(execute=True):
             aggregate_trades()
 
-            mock_redis_instance.lrange.assert_called_with(f"trades:{test_symbol}", 0, -1)
-            mock_redis_instance.delete.assert_called_with(f"trades:{test_symbol}")
+        self.assertEqual(TickerAggregate.objects.filter(interval="1m").count(), 1)
+        mock_pipeline.delete.assert_called_once_with(f"bar:v2:btcusdt:{bucket}")
+
+    @patch('api.broadcast.get_channel_layer')
+    @patch('redis.Redis')
+    def test_aggregate_trades_high_volume_symbol(self, mock_redis, mock_get_channel_layer):
+        mock_get_channel_layer.return_value.group_send = AsyncMock()
+        mock_pipeline = mock_redis.return_value.pipeline.return_value.__enter__.return_value
+        day = int(datetime.now().timestamp()) // 86400 * 86400000
+        shib = {  # 6e9 SHIB at 0.00001 a minute, two minutes pass 10 ** 10 in the rollups
+            "open": "1000", "high": "1000", "low": "1000", "close": "1000", "volume": "600000000000000000",
+            "quote_volume": "6000000000000", "buy_volume": "600000000000000000", "price_sum": "3000",
+        }
+        bad = {**shib, "volume": "1" + "0" * 37, "buy_volume": "0"}  # 10 ** 29, does not fit even 38 digits
+        mock_pipeline.execute.return_value = [
+            [str(day), self.make_running_bar(day, **shib), str(day + 60000), self.make_running_bar(day + 60000, **shib)],
+            [str(day), self.make_running_bar(day, **bad)],
+            [str(day), self.make_running_bar(day)],
+        ]
+
+        with patch('TradeWS.tasks.get_symbols', return_value=["shibusdt", "badusdt", "btcusdt"]), \
+                patch('TradeWS.tasks.fail_bars') as fail_bars, \
+                self.captureOnCommitCallbacks(execute=True):
+            aggregate_trades()
 
-            ticker = TickerAggregate.objects.get(symbol=test_symbol.upper())
-            self.assertEqual(ticker.high_price, Decimal('45200.00'))
-            self.assertEqual(ticker.low_price, Decimal('45000.00'))
-            self.assertEqual(ticker.open_price, Decimal('45000.00'))
-            self.assertEqual(ticker.close_price, Decimal('45200.00'))
-            self.assertEqual(ticker.volume, Decimal('1.5'))  # 0.5 + 0.3 + 0.7
+        for interval in ("1h", "1d"):
+            rollup = TickerAggregate.objects.get(symbol="SHIBUSDT", interval=interval)
+            self.assertEqual((rollup.volume, rollup.buy_volume), (Decimal("12000000000"), Decimal("12000000000")))
+        self.assertTrue(TickerAggregate.objects.filter(symbol="BTCUSDT", interval="1m").exists())
+        self.assertFalse(TickerAggregate.objects.filter(symbol="BADUSDT").exists())  # its savepoint rolled back
+
+        (_, failed, source, error), _ = fail_bars.call_args
+        self.assertEqual(([symbol for symbol, _ in failed], source), (["badusdt"], "bars"))  # retried, then dead
+        self.assertIsInstance(error, BAD_BAR_ERRORS)  # InvalidOperation on SQLite, DataError on PostgreSQL
+        deleted = {call.args[0] for call in mock_pipeline.delete.call_args_list}
+        self.assertEqual(deleted, {f"bar:v2:shibusdt:{day}", f"bar:v2:shibusdt:{day + 60000}", f"bar:v2:btcusdt:{day}"})
+
+    def test_failed_bars_are_dead_lettered(self):
+        from api.bars import DEAD_BARS_KEY, fail_bars
+
+        r = MagicMock()
+        pipe = r.pipeline.return_value.__enter__.return_value
+        pipe.execute.side_effect = [[1, 5], None]  # failed attempts of each bar so far
+        bars = [("btcusdt", {"bucket": 60000}), ("shibusdt", {"bucket": 120000, "volume": Decimal("1E+29")})]
+
+        dead = fail_bars(r, bars, "bars", error=ArithmeticError("overflow"), max_attempts=5)
+
+        self.assertEqual(dead, bars[1:])
+        pipe.hincrby.assert_any_call("bars:btcusdt:pending:attempts", 60000, 1)
+        pipe.zadd.assert_called_once_with("bars:btcusdt:pending", {60000: 0}, xx=True)  # taken again by the next tick
+        key, record = pipe.rpush.call_args.args
+        self.assertEqual(key, DEAD_BARS_KEY)
+        self.assertEqual(json.loads(record), {
+            "symbol": "shibusdt", "source": "bars", "bar": {"bucket": 120000, "volume": "1E+29"},
+            "error": "ArithmeticError('overflow')",
+        })
+        pipe.delete.assert_called_once_with("bar:v2:shibusdt:120000")
+        pipe.zrem.assert_called_once_with("bars:shibusdt:pending", 120000)
+        pipe.hdel.assert_called_once_with("bars:shibusdt:pending:attempts", 120000)
 
-            trade = Trade.objects.get(symbol=test_symbol.upper())
-            avg_price = (45000.00 + 45100.00 + 45200.00) / 3
-            self.assertEqual(float(trade.price), avg_price)
-            self.assertEqual(float(trade.quantity), 1.5)
+    @patch('api.broadcast.get_channel_layer')
+    @patch('redis.Redis')
+    def test_aggregate_trades_without_trades(self, mock_redis, mock_get_channel_layer):
+        mock_redis_instance = MagicMock()
+        mock_redis.return_value = mock_redis_instance
+        mock_redis_instance.pipeline.return_value.__enter__.return_value.execute.return_value = [[], []]
+
+        aggregate_trades()
+
+        self.assertFalse(TickerAggregate.objects.exists())
+        mock_get_channel_layer.assert_not_called()
+
+
+class AggregationEngineTest(TestCase):  # Tests for the vectorized aggregation engine.
+
+    def test_aggregate_bars(self):
+        import numpy as np
+        from api.aggregation import aggregate_bars
+        from api.codecs import RECORD_DTYPE
+        from api.fixedpoint import SCALE
+
+        trades = np.array([  # (version, trade id, price, quantity, trade time, buyer is maker), out of time order
+            (1, 3, 12 * SCALE, 1 * SCALE, 61000, False),
+            (1, 1, 10 * SCALE, 2 * SCALE, 1000, False),
+            (1, 2, 14 * SCALE, 1 * SCALE, 1000, True),
+            (1, 4, 11 * SCALE, 3 * SCALE, 62000, True),
+            (1, 5, 13 * SCALE, 1 * SCALE, 62000, False),
+        ], dtype=RECORD_DTYPE)
+
+        bars = aggregate_bars(trades, 60000, quantiles=(0.0, 0.5, 1.0))
+
+        self.assertEqual(bars["bucket"].tolist(), [0, 60000])
+        self.assertEqual(bars["open"].tolist(), [10 * SCALE, 12 * SCALE])
+        self.assertEqual(bars["close"].tolist(), [14 * SCALE, 13 * SCALE])  # last of the trades at the same time
+        self.assertEqual(bars["high"].tolist(), [14 * SCALE, 13 * SCALE])
+        self.assertEqual(bars["low"].tolist(), [10 * SCALE, 11 * SCALE])
+        self.assertEqual(bars["volume"].tolist(), [3 * SCALE, 5 * SCALE])
+        self.assertEqual(bars["buy_volume"].tolist(), [2 * SCALE, 2 * SCALE])
+        self.assertEqual(bars["sell_volume"].tolist(), [1 * SCALE, 3 * SCALE])
+        self.assertEqual(bars["count"].tolist(), [2, 3])
+        self.assertAlmostEqual(bars["vwap"][1], (12 + 33 + 13) / 5)
+        self.assertEqual(bars["quantiles"].tolist(), [
+            [10 * SCALE, 10 * SCALE, 14 * SCALE],
+            [11 * SCALE, 12 * SCALE, 13 * SCALE],
+        ])
+
+    def test_sums_beyond_int64(self):
+        import numpy as np
+        from api.aggregation import aggregate_bars
+        from api.codecs import RECORD_DTYPE
+        from api.fixedpoint import SCALE
+        from api.replay import BAR_FIELDS, combine_bars
+
+        price, quantity = 100000 * SCALE, 100000 * SCALE  # 1e10 quote volume per trade, 1e18 scaled
+        trades = np.array([(1, i, price, quantity, i * 1000, False) for i in range(100)], dtype=RECORD_DTYPE)
+
+        bars = aggregate_bars(trades, 60000, quantiles=())
+        self.assertEqual(bars["quote_volume"].tolist(), [60 * 10 ** 10 * SCALE, 40 * 10 ** 10 * SCALE])  # exact
+        self.assertEqual(bars["price_sum"].tolist(), [60 * price, 40 * price])
+        self.assertAlmostEqual(bars["vwap"][0], 100000)
+
+        day = combine_bars({field: bars[field] for field in BAR_FIELDS}, 86400 * 1000)
+        self.assertEqual(day["quote_volume"].tolist(), [100 * 10 ** 10 * SCALE])
+        self.assertEqual(day["volume"].tolist(), [100 * quantity])
+
+        small = aggregate_bars(trades[:2], 60000, quantiles=())  # int64 while the sums fit
+        self.assertEqual(small["volume"].dtype, np.int64)
 
 
 class RESTAPITest(TestCase):  # Tests for the REST API.
 
     def setUp(self):
+        patcher = patch.object(history_cache, 'ttl', 0)  # responses come from the database, see HistoryCacheTest
+        patcher.start()
+        self.addCleanup(patcher.stop)
         self.client = APIClient()
         self.test_symbol = "BTCUSDT"
 
@@ -229,6 +578,108 @@ class RESTAPITest(TestCase):  # Tests for the REST API.
         for item in response.data['results']:
             self.assertEqual(item['symbol'], self.test_symbol)
 
+    def test_filter_by_interval(self):
+        hourly = TickerAggregate.objects.create(
+            symbol=self.test_symbol,
+            interval="1h",
+            start_time=self.ticker1.start_time,
+            end_time=self.ticker1.start_time + timedelta(hours=1),
+            open_price=Decimal('44000.00'),
+            close_price=Decimal('44300.00'),
+            high_price=Decimal('44400.00'),
+            low_price=Decimal('43900.00'),
+            volume=Decimal('5.7')
+        )
+
+        response = self.client.get(f"{reverse('trade-list')}?interval=1h&limit=10")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [hourly.id])
+
+        response = self.client.get(f"{reverse('trade-list')}?limit=10")  # BAR_INTERVAL bars by default
+        self.assertEqual({item['interval'] for item in response.data['results']}, {"1m"})
+
+        response = self.client.get(f"{reverse('trade-list')}?interval=7x")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_keyset_pagination(self):
+        start = self.ticker1.start_time - timedelta(hours=1)
+        for i in range(5):  # several symbols in the same minute, ties are broken by id
+            TickerAggregate.objects.create(
+                symbol=f"SYM{i}USDT", start_time=start, end_time=start + timedelta(minutes=1),
+                open_price=Decimal('1'), close_price=Decimal('1'), high_price=Decimal('1'), low_price=Decimal('1'),
+                volume=Decimal('1'),
+            )
+        expected = list(TickerAggregate.objects.order_by('-start_time', '-id').values_list('id', flat=True))
+
+        pages = []
+        url = f"{reverse('trade-list')}?limit=2"
+        while url:
+            with self.assertNumQueries(1):  # no count(*)
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.json())
+            url = pages[-1]['next']
+        self.assertEqual([item['id'] for page in pages for item in page['results']], expected)
+        self.assertIsNone(pages[0]['previous'])
+
+        response = self.client.get(pages[-1]['previous'])  # back from the last page
+        self.assertEqual(response.json()['results'], pages[-2]['results'])
+
+        response = self.client.get(f"{reverse('trade-list')}?cursor=broken")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_filter_by_time_range(self):
+        TickerAggregate.objects.create(
+            symbol="ETHUSDT", start_time=self.ticker1.start_time, end_time=self.ticker1.end_time,
+            open_price=Decimal('1'), close_price=Decimal('1'), high_price=Decimal('1'), low_price=Decimal('1'),
+            volume=Decimal('1'),
+        )
+        start = int(self.ticker1.start_time.timestamp() * 1000)
+        end = self.ticker2.start_time.isoformat()
+
+        response = self.client.get(reverse('trade-list'), {'symbol': 'btcusdt', 'start': start, 'end': end})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.ticker1.id])
+
+        for value in ('yesterday', '9' * 20, '253402300800000'):  # not a time, overflow, after year 9999
+            response = self.client.get(reverse('trade-list'), {'start': value})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('start', response.json())
+
+    def test_history_formats(self):
+        self.ticker2.vwap = Decimal('44210.1234567891')
+        self.ticker2.save()
+        url = reverse('trade-list')
+        expected = TickerAggregateSerializer(TickerAggregate.objects.order_by('-start_time', '-id'), many=True).data
+
+        response = self.client.get(url)  # lean path, same output as the serializer
+        self.assertEqual(response.json()['results'], json.loads(json.dumps(expected)))
+
+        response = self.client.get(url, {'format': 'columnar'})
+        columns = response.json()['results']
+        self.assertEqual(columns['id'], [self.ticker2.id, self.ticker1.id])
+        self.assertEqual(columns['vwap'], ['44210.1234567891', None])
+
+        response = self.client.get(url, {'format': 'csv', 'limit': 1})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('rel="next"', response['Link'])
+        header, row = response.content.decode().splitlines()
+        self.assertEqual(header.split(',')[:3], ['id', 'symbol', 'interval'])
+        self.assertEqual(row.split(',')[:2], [str(self.ticker2.id), self.test_symbol])
+
+    def test_history_arrow_format(self):
+        from api.renderers import pyarrow
+        if pyarrow is None:
+            self.skipTest("pyarrow is not installed")
+
+        response = self.client.get(reverse('trade-list'), {'format': 'arrow'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        table = pyarrow.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.column('id').to_pylist(), [self.ticker2.id, self.ticker1.id])
+        self.assertEqual(table.column('volume').to_pylist(), [Decimal('3.2'), Decimal('2.5')])
+
     def test_swagger_documentation(self):
         url = reverse('schema-swagger-ui')
         response = self.client.get(url)
@@ -238,25 +689,957 @@ class RESTAPITest(TestCase):  # Tests for the REST API.
 
 
 @pytest.mark.asyncio
-class WebSocketServerTest(TransactionTestCase):  # Tests for WebSocket server.
+class HistoryCacheTest(TestCase):  # Tests for the history response cache.
 
-    async def setUp(self):
-        self.test_symbol = "BTCUSDT"
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('trade-list')
+        self.redis = MagicMock()
+        self.lookup = self.redis.register_script.return_value
+        self.pipeline = self.redis.pipeline.return_value.__enter__.return_value
+        self.cache = HistoryCache(client=self.redis, ttl=60)
+        patcher = patch('api.views.history_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
-        @database_sync_to_async
-        def create_ticker():
-            return TickerAggregate.objects.create(
-                symbol=self.test_symbol,
-                start_time=timezone.now() - timedelta(minutes=5),
-                end_time=timezone.now(),
-                open_price=Decimal('44100.00'),
-                close_price=Decimal('44300.00'),
-                high_price=Decimal('44400.00'),
-                low_price=Decimal('44050.00'),
-                volume=Decimal('3.2')
-            )
+        now = timezone.now()
+        TickerAggregate.objects.create(
+            symbol="BTCUSDT", start_time=now - timedelta(minutes=1), end_time=now,
+            open_price=Decimal('1'), close_price=Decimal('1'), high_price=Decimal('1'), low_price=Decimal('1'),
+            volume=Decimal('1'),
+        )
+
+    def test_miss_is_stored(self):
+        self.lookup.return_value = [b"7", []]
+
+        response = self.client.get(self.url, {'symbol': 'btcusdt'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.lookup.call_args.kwargs['keys'], ["history:generation:BTCUSDT"])
+        self.assertTrue(response['ETag'].startswith('"7-'))
+        key, = self.pipeline.hset.call_args.args
+        self.assertTrue(key.startswith("history:BTCUSDT:7:"))
+        self.assertEqual(self.pipeline.hset.call_args.kwargs['mapping']['body'], response.content)
+        self.pipeline.expire.assert_called_once_with(key, 60)
+
+    def test_hit_skips_database(self):
+        self.lookup.return_value = [b"7", [b"body", b'{"results":[]}', b"content_type", b"application/json"]]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'symbol': 'BTCUSDT'})
+
+        self.assertEqual(response.content, b'{"results":[]}')
+        self.assertEqual(response['Content-Type'], "application/json")
+
+    def test_not_modified(self):
+        self.lookup.return_value = [b"7", []]
+        etag = self.client.get(self.url, {'symbol': 'BTCUSDT', 'limit': 10})['ETag']
+
+        response = self.client.get(self.url, {'limit': 10, 'symbol': 'btcusdt'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.lookup.return_value = [b"8", []]  # a new bar of the symbol was written
+        response = self.client.get(self.url, {'symbol': 'BTCUSDT', 'limit': 10}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalidate(self):
+        self.cache.invalidate({"BTCUSDT", "ETHUSDT"})
+
+        keys = sorted(call.args[0] for call in self.pipeline.incr.call_args_list)
+        self.assertEqual(keys, ["history:generation:*", "history:generation:BTCUSDT", "history:generation:ETHUSDT"])
+
+
+class LatestBarsTest(TestCase):  # Tests for the latest bar cache used by WebSocket snapshots.
+
+    def setUp(self):
+        from api.latest import LatestBars
+
+        self.redis = MagicMock()
+        self.redis.hget = AsyncMock(return_value=None)
+        self.latest_bars = LatestBars(client=self.redis)
+
+    @staticmethod
+    def create_ticker(interval, minutes_ago, close_price):
+        start_time = timezone.now() - timedelta(minutes=minutes_ago)
+        return TickerAggregate.objects.create(
+            symbol="BTCUSDT", interval=interval, start_time=start_time, end_time=start_time + timedelta(minutes=1),
+            open_price=Decimal('1'), close_price=Decimal(close_price), high_price=Decimal('1'), low_price=Decimal('1'),
+            volume=Decimal('1'),
+        )
+
+    async def test_batch_updates_frames_once_per_tick(self):
+        self.latest_bars.update({"tick": 1, "symbols": ["BTCUSDT"], "frames": ['{"close_price":"45000"}']})
+        self.latest_bars.update({"tick": 1, "symbols": ["BTCUSDT"], "frames": ['{"close_price":"46000"}']})  # same tick
+
+        frame = await self.latest_bars.get("BTCUSDT")
+
+        self.assertEqual(json.loads(frame)["close_price"], "45000")
+        self.redis.hget.assert_not_awaited()
 
-        self.ticker = await create_ticker()
+    async def test_miss_reads_redis(self):
+        self.redis.hget.return_value = '{"symbol":"BTCUSDT","close_price":"45000"}'
+
+        self.assertEqual(json.loads(await self.latest_bars.get("BTCUSDT"))["close_price"], "45000")
+        await self.latest_bars.get("BTCUSDT")
+
+        self.redis.hget.assert_awaited_once_with("latest_bars", "BTCUSDT")
+
+    async def test_miss_falls_back_to_database(self):
+        await database_sync_to_async(self.create_ticker)("1m", 2, '44000')
+        await database_sync_to_async(self.create_ticker)("1m", 1, '45000')
+        await database_sync_to_async(self.create_ticker)("5m", 5, '46000')  # rollups are newer rows, not snapshots
+
+        frame = await self.latest_bars.get("BTCUSDT")
+
+        self.assertEqual(Decimal(json.loads(frame)["close_price"]), Decimal('45000'))
+        self.assertIsNone(await self.latest_bars.get("ETHUSDT"))
+
+    async def test_miss_is_cached(self):
+        with patch('api.latest.LatestBars.load', return_value=None) as load:
+            self.assertIsNone(await self.latest_bars.get("ETHUSDT"))
+            self.assertIsNone(await self.latest_bars.get("ETHUSDT"))  # within the TTL
+
+            self.latest_bars.frames["ETHUSDT"] = (None, 0)  # expired
+            self.assertIsNone(await self.latest_bars.get("ETHUSDT"))
+
+        self.assertEqual(load.call_count, 2)
+        self.assertEqual(self.redis.hget.await_count, 2)
+        self.latest_bars.update_bar({"symbol": "ETHUSDT", "interval": "1m", "frame": '{"close_price":"3000"}'})
+        self.assertEqual(json.loads(await self.latest_bars.get("ETHUSDT"))["close_price"], "3000")
+
+
+class LiveBarsTest(TestCase):  # Tests for in-progress bars published by the listener.
+
+    def setUp(self):
+        from api.live import LiveBars
+
+        self.channel_layer = MagicMock()
+        self.channel_layer.group_send = AsyncMock()
+        self.live = LiveBars(channel_layer=self.channel_layer, publish_hz=10)
+
+    @staticmethod
+    def summary(price, quantity, trade_time):
+        from api.bars import summarize_trades
+        from api.codecs import BinanceTrade
+        return summarize_trades([BinanceTrade(symbol="BTCUSDT", price=price, quantity=quantity, trade_time=trade_time)])
+
+    async def test_merge_and_publish(self):
+        self.live.merge("BTCUSDT", 60000, self.summary("45000", "1", 60001))
+        self.live.merge("BTCUSDT", 60000, self.summary("45200", "0.5", 60003))
+        self.live.merge("BTCUSDT", 60000, self.summary("44900", "0.5", 60002))  # older trade, not the last price
+        self.live.merge("BTCUSDT", 0, self.summary("40000", "1", 59999))  # previous bar is no longer live
+
+        await self.live.publish()
+        await self.live.publish()  # nothing changed since
+
+        self.channel_layer.group_send.assert_awaited_once()
+        group, message = self.channel_layer.group_send.call_args.args
+        self.assertEqual(group, "live.BTCUSDT")
+        self.assertEqual((message["type"], message["symbol"]), ("send_live_update", "BTCUSDT"))
+        self.assertEqual(message["time"], 60003)  # trade time of the last trade, for latency stats
+        self.assertEqual(self.live.latency.count, 1)
+        self.assertIn("live_latency_p99_ms", self.live.stats())
+        data = json.loads(message["frame"])
+        self.assertEqual((data["start_time"], data["time"], data["trade_count"]), (60000, 60003, 3))
+        self.assertEqual(Decimal(data["open_price"]), Decimal("45000"))
+        self.assertEqual(Decimal(data["close_price"]), Decimal("45200"))
+        self.assertEqual((Decimal(data["high_price"]), Decimal(data["low_price"])), (Decimal("45200"), Decimal("44900")))
+        self.assertEqual(Decimal(data["volume"]), Decimal("2"))
+
+        self.live.merge("BTCUSDT", 120000, self.summary("46000", "1", 120001))  # next bar starts over
+        await self.live.publish()
+        data = json.loads(self.channel_layer.group_send.call_args.args[1]["frame"])
+        self.assertEqual((data["start_time"], data["trade_count"]), (120000, 1))
+
+    async def test_writer_merges_written_batches(self):
+        from api.codecs import BinanceTrade
+        from api.redis_writer import RedisTradeWriter
+
+        mock_pipeline = MagicMock()
+        mock_pipeline.__len__.side_effect = [0, 1]
+        mock_pipeline.execute = AsyncMock(return_value=[1, -1, 1])  # the second bucket is already closed
+        mock_redis_instance = MagicMock()
+        mock_redis_instance.pipeline.return_value.__aenter__.return_value = mock_pipeline
+        mock_redis_instance.register_script.return_value = AsyncMock()
+
+        writer = RedisTradeWriter(client=mock_redis_instance, store_raw=False, bar_source="bars", live=self.live)
+        trades = [BinanceTrade(symbol="BTCUSDT", price="45000", quantity="1", trade_time=120001),
+                  BinanceTrade(symbol="BTCUSDT", price="44000", quantity="1", trade_time=59999)]
+        await writer.flush({"btcusdt": trades}, 2)
+
+        self.assertEqual(list(self.live.bars), ["btcusdt"])
+        self.assertEqual(self.live.bars["btcusdt"][0], 120000)
+        self.assertEqual(self.live.bars["btcusdt"][6], 1)  # the late trade is not in the live bar
+        self.assertEqual(writer.stats.late, 1)
+
+
+class OutboxTest(TestCase):  # Tests for the bounded outbound queues of WebSocket connections.
+
+    def setUp(self):
+        self.sent = []
+
+    async def send(self, frame):
+        self.sent.append(frame)
+
+    async def test_conflate_policy(self):
+        from api.outbox import Outbox
+
+        outbox = Outbox(self.send, size=2, policy="conflate", max_lag=60)
+        outbox.put("reply")
+        outbox.put("btc 1", ("bar", "BTCUSDT", "1m"))
+        outbox.put("btc 2", ("bar", "BTCUSDT", "1m"))  # replaces the pending bar, keeps its place
+        self.assertEqual([frame for frame, _ in outbox.frames.values()], ["reply", "btc 2"])
+
+        self.assertTrue(outbox.put("eth 1", ("bar", "ETHUSDT", "1m")))  # full: the oldest frame is dropped
+        self.assertEqual([frame for frame, _ in outbox.frames.values()], ["btc 2", "eth 1"])
+        self.assertIsNotNone(outbox.behind_since)
+
+        task = asyncio.create_task(outbox.run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        self.assertEqual(self.sent, ["btc 2", "eth 1"])
+        self.assertIsNone(outbox.behind_since)  # caught up
+
+    async def test_drop_policy_and_lagging(self):
+        from api.outbox import Outbox, stats
+
+        outbox = Outbox(self.send, size=1, policy="drop", max_lag=5)
+        dropped = stats.dropped
+        outbox.put("btc 1", ("bar", "BTCUSDT", "1m"))
+        outbox.put("btc 2", ("bar", "BTCUSDT", "1m"))  # nothing is replaced with the drop policy
+        self.assertEqual([frame for frame, _ in outbox.frames.values()], ["btc 1"])
+        self.assertEqual(stats.dropped, dropped + 1)
+
+        with patch('api.outbox.time.monotonic', return_value=outbox.behind_since + 5):
+            self.assertFalse(outbox.put("btc 3"))  # full for max_lag seconds
+        self.assertEqual(stats.as_dict()["max_queue_depth"], 1)
+
+        with self.assertRaises(ValueError):
+            Outbox(self.send, policy="block")
+
+        outbox = Outbox(self.send, size=3, policy="drop", max_lag=5)
+        outbox.put("btc 1", ("bar", "BTCUSDT", "1m"))
+        outbox.put("btc 2", ("bar", "BTCUSDT", "1m"))  # queued after the pending one, not instead of it
+        self.assertEqual([frame for frame, _ in outbox.frames.values()], ["btc 1", "btc 2"])
+
+    async def test_lagging_client_is_evicted_without_new_frames(self):
+        from api.outbox import Outbox, stats
+
+        blocked = asyncio.Event()
+
+        async def stuck_send(frame):
+            self.sent.append(frame)
+            await blocked.wait()  # the client stopped reading
+
+        on_lagging = AsyncMock()
+        outbox = Outbox(stuck_send, size=2, policy="conflate", max_lag=0.05, on_lagging=on_lagging)
+        for frame in ("a", "b", "c"):
+            outbox.put(frame)
+        self.assertIsNotNone(outbox.behind_since)
+
+        task = asyncio.create_task(outbox.run())
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.sent, ["b"])
+        self.assertIsNone(outbox.behind_since)  # below capacity while the send is still blocked
+        outbox.put("d")
+        outbox.put("e")  # full again, nothing is put after it
+        await asyncio.sleep(0.1)
+        on_lagging.assert_awaited_once()
+
+        task.cancel()
+        self.assertIn(outbox, stats.outboxes)
+        outbox.close()
+        self.assertNotIn(outbox, stats.outboxes)
+
+    async def test_daphne_send_buffer(self):  # Daphne's send never waits, the transport buffer grows instead
+        from functools import partial
+        from daphne.server import Server
+        from daphne.ws_protocol import WebSocketFactory
+        from twisted.internet.abstract import FileDescriptor
+        from api.outbox import Outbox, server_buffer
+
+        server = Server(application=None, endpoints=["tcp:port=0"])
+        protocol = WebSocketFactory(server, server=None).buildProtocol(("127.0.0.1", 50000))
+        transport = FileDescriptor(reactor=MagicMock())  # nothing is ever written to the socket: the client does not read
+        transport.connected = True
+        transport.getPeer = transport.getHost = MagicMock()
+        protocol.makeConnection(transport)
+        protocol.state, protocol.websocket_version, protocol.client_addr = protocol.STATE_OPEN, 13, ["127.0.0.1", 50000]
+        server.connections = {protocol: {}}
+        send = partial(server.handle_reply, protocol)  # what Daphne passes to the application
+
+        async def send_text(frame):
+            await send({"type": "websocket.send", "text": frame})
+
+        on_lagging = AsyncMock()
+        buffered = server_buffer(send)
+        outbox = Outbox(send_text, size=2, policy="conflate", max_lag=0.1, on_lagging=on_lagging, buffered=buffered,
+                        max_buffered=1000)
+        task = asyncio.create_task(outbox.run())
+        for i in range(10):
+            outbox.put("x" * 600, ("bar", f"SYM{i}", "1m"))
+            await asyncio.sleep(0.02)
+        await asyncio.sleep(0.2)
+        task.cancel()
+
+        self.assertEqual(buffered(), 2 * 604)  # two frames with their headers, then the buffer was over max_buffered
+        self.assertEqual(len(outbox.frames), 2)  # the rest waited in the queue and was dropped
+        on_lagging.assert_awaited_once()
+        outbox.close()
+        self.assertIsNone(server_buffer(self.send))  # servers whose send waits need no buffer check
+
+    async def test_send_latency(self):
+        import time
+        from api.outbox import Outbox, stats
+
+        outbox = Outbox(self.send, size=10, policy="conflate", max_lag=60)
+        sent = stats.latency.count
+        outbox.put("live btc", ("live", "BTCUSDT"), event_time=time.time() * 1000 - 40)  # trade 40 ms ago
+        outbox.put("reply")  # frames without a trade time are not measured
+
+        task = asyncio.create_task(outbox.run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        self.assertEqual(stats.latency.count, sent + 1)
+        self.assertGreaterEqual(stats.latency.max_ms, 40)
+
+    def test_redis_clients_follow_the_event_loop(self):  # a client is bound to the loop it first connected in
+        from api.latest import LatestBars
+        from api.outbox import WebSocketStats
+
+        writer, latest = WebSocketStats(), LatestBars()
+        with patch('redis.asyncio.Redis') as redis_class:
+            client = redis_class.return_value
+            client.pipeline.return_value.__aenter__.return_value = MagicMock(execute=AsyncMock())
+            client.hget = AsyncMock(return_value="frame")
+            for _ in range(2):  # e.g. the loops of two tests, or of two async_to_sync calls
+                asyncio.run(writer.write(force=True))
+                self.assertEqual(asyncio.run(latest.get("BTCUSDT")), "frame")
+                latest.frames.clear()
+
+        self.assertEqual(redis_class.call_count, 4)  # a client per loop for each of them
+
+    def test_latency_histogram(self):
+        from api.latency import LatencyHistogram
+
+        histogram = LatencyHistogram(buckets=(10, 100))
+        for ms in (-3, 5, 50, 60, 1000):  # clock offsets can make it negative
+            histogram.record(ms)
+
+        fields = histogram.as_dict("lat")
+        self.assertEqual((fields["lat_le_10"], fields["lat_le_100"], fields["lat_count"]), (2, 4, 5))
+        self.assertEqual((fields["lat_p50_ms"], fields["lat_p99_ms"], fields["lat_max_ms"]), (100, "inf", 1000))
+        self.assertEqual(LatencyHistogram().as_dict("lat")["lat_p50_ms"], 0)
+
+
+class PartitionsTest(TestCase):  # Tests for PostgreSQL partition maintenance.
+
+    def test_plan_partitions(self):
+        from datetime import timezone as dt_timezone
+        from api.partitions import plan_partitions
+
+        now = datetime(2025, 12, 20, 15, 0, tzinfo=dt_timezone.utc)
+        existing = ["api_trade_p202509", "api_trade_p202510", "api_trade_p202511", "api_trade_p202512", "api_trade_old"]
+
+        create, drop = plan_partitions("api_trade", existing, now, "month", ahead=2, retention_days=40)
+
+        self.assertEqual([(name, start.month, end.year) for name, start, end in create],
+                         [("api_trade_p202601", 1, 2026), ("api_trade_p202602", 2, 2026)])
+        self.assertEqual(drop, ["api_trade_p202509", "api_trade_p202510"])  # November is not entirely past
+
+        create, drop = plan_partitions("api_trade", existing, now, "day", ahead=12)  # switched to daily partitions
+        self.assertEqual([name for name, _, _ in create], ["api_trade_p20260101"])  # December is a month partition
+        self.assertEqual(drop, [])
+
+        with self.assertRaises(ValueError):
+            plan_partitions("api_trade", [], now, "week")
+
+    def test_create_partition_moves_default_rows(self):
+        from datetime import timezone as dt_timezone
+        from api.partitions import create_partition
+
+        start, end = datetime(2024, 1, 1, tzinfo=dt_timezone.utc), datetime(2024, 2, 1, tzinfo=dt_timezone.utc)
+        with patch('api.partitions.connection') as connection:
+            connection.ops.quote_name = lambda name: f'"{name}"'
+            cursor = connection.cursor.return_value.__enter__.return_value
+            cursor.fetchone.side_effect = [(None, '"api_tickeraggregate_default"'), (1,)]  # rows of January wait there
+
+            create_partition("api_tickeraggregate", "api_tickeraggregate_p202401", start, end)
+
+        statements = [call.args[0] for call in cursor.execute.call_args_list[2:]]
+        self.assertEqual([" ".join(sql.split()[:3]) for sql in statements], [
+            'CREATE TABLE "api_tickeraggregate_p202401"',  # not attached yet, so its rows can be inserted
+            'INSERT INTO "api_tickeraggregate_p202401"',
+            'DELETE FROM "api_tickeraggregate_default"',
+            'ALTER TABLE "api_tickeraggregate"',
+        ])
+        self.assertIn('WHERE "start_time" >= %s AND "start_time" < %s', statements[1])
+        self.assertIn('ATTACH PARTITION "api_tickeraggregate_p202401"', statements[3])
+
+    def test_drop_partition(self):  # a plain DROP: CONCURRENTLY is refused next to the DEFAULT partition
+        from api.partitions import drop_partition
+
+        with patch('api.partitions.connection') as connection:
+            connection.ops.quote_name = lambda name: f'"{name}"'
+            cursor = connection.cursor.return_value.__enter__.return_value
+
+            drop_partition("api_trade", "api_trade_p202401")
+
+        self.assertEqual([call.args[0] for call in cursor.execute.call_args_list], ['DROP TABLE "api_trade_p202401"'])
+
+    def test_manage_partitions_is_scheduled(self):
+        from django_celery_beat.models import PeriodicTask
+
+        task = PeriodicTask.objects.get(name="manage_partitions")  # registered by migration 0010
+        self.assertEqual(task.task, "TradeWS.tasks.manage_partitions")
+        self.assertEqual((task.crontab.hour, task.crontab.minute), ("3", "0"))  # daily
+
+    def test_not_partitioned(self):  # SQLite and not yet migrated databases are left alone
+        from io import StringIO
+        from django.core.management import call_command
+
+        output = StringIO()
+        call_command("partitions", "--dry-run", stdout=output)
+        self.assertIn("not partitioned", output.getvalue())
+
+
+class PersistTradesTest(TestCase):  # Tests for raw trade persistence.
+
+    def setUp(self):
+        from api.codecs import BinanceTrade, encode_trade_record
+
+        self.trades = [
+            BinanceTrade("BTCUSDT", "45000.12", "0.5", 1741608000000, 101, False),
+            BinanceTrade("BTCUSDT", "45001.00", "0.25", 1741608000500, 102, True),
+        ]
+        self.records = [encode_trade_record(trade, "binary") for trade in self.trades]
+
+    def test_persist_and_deduplicate(self):
+        from api.persist import TradePersister
+        from api.streams import decode_entry, stream_entry
+
+        fields = {key.encode(): value.encode() if isinstance(value, str) else value
+                  for key, value in stream_entry("btcusdt", self.trades).items()}
+        entries = [("1-0", *decode_entry(fields))]
+        consumer = MagicMock()
+        consumer.read.side_effect = [entries, [], entries, []]  # replayed, e.g. after a crash before XACK
+
+        persister = TradePersister(consumer=consumer, batch_size=1000)
+        self.assertEqual(persister.persist_once(), 2)
+        self.assertEqual(persister.persist_once(), 2)
+
+        self.assertEqual(persister.written, 2)
+        trades = list(Trade.objects.order_by('trade_id'))
+        self.assertEqual([trade.trade_id for trade in trades], [101, 102])
+        self.assertEqual((trades[0].price, trades[0].quantity, trades[0].is_buyer_maker),
+                         (Decimal('45000.12'), Decimal('0.5'), False))
+        self.assertEqual(int(trades[1].trade_time.timestamp() * 1000), 1741608000500)
+        consumer.ack.assert_called_with(["1-0"])  # acknowledged after the commit
+        self.assertEqual(consumer.read.call_args_list[1].kwargs, {"block": False})  # only the first read waits
+
+    def test_aggregated_entries_are_skipped(self):
+        from api.persist import TradePersister
+        from api.streams import stream_entry
+
+        def entry(entry_id, trades, aggregated=False):  # as read by a client that does not decode
+            fields = stream_entry("btcusdt", trades, aggregated)
+            return entry_id, {key.encode(): value.encode() if isinstance(value, str) else value
+                              for key, value in fields.items()}
+
+        client = MagicMock()
+        client.xautoclaim.return_value = [b"0-0", [], []]
+        client.xreadgroup.return_value = [[b"stream:trades", [
+            entry(b"1-0", self.trades[:1], aggregated=True),  # backfilled aggregate trade
+            entry(b"2-0", self.trades[1:]),
+        ]]]
+        with patch('api.streams.redis.Redis', return_value=client):
+            persister = TradePersister(batch_size=1)
+
+        self.assertEqual(persister.persist_once(), 1)
+
+        self.assertEqual(list(Trade.objects.values_list('trade_id', flat=True)), [102])
+        client.xack.assert_any_call("stream:trades", "persist", b"1-0")  # acknowledged without being stored
+        client.xack.assert_called_with("stream:trades", "persist", b"2-0")
+
+    def test_copy_rows(self):
+        from api.codecs import decode_trade_records
+        from api.persist import copy_rows
+
+        rows = copy_rows([("btcusdt", decode_trade_records(self.records))]).getvalue().splitlines()
+        self.assertEqual(rows, [
+            "BTCUSDT\t101\t4500012000000\t50000000\t1741608000000\tf",
+            "BTCUSDT\t102\t4500100000000\t25000000\t1741608000500\tt",
+        ])
+
+    async def test_writer_adds_trades_to_stream(self):
+        from api.redis_writer import RedisTradeWriter
+
+        mock_pipeline = MagicMock()
+        mock_pipeline.execute = AsyncMock(return_value=["1-0", 1, 1])
+        mock_redis_instance = MagicMock()
+        mock_redis_instance.pipeline.return_value.__aenter__.return_value = mock_pipeline
+        mock_redis_instance.register_script.return_value = AsyncMock()
+
+        writer = RedisTradeWriter(client=mock_redis_instance, store_raw=False, bar_source="bars", persist=True)
+        await writer.flush({"btcusdt": self.trades}, 2)
+
+        (key, fields), kwargs = mock_pipeline.xadd.call_args
+        self.assertEqual(key, "stream:trades")
+        self.assertEqual(fields, {"symbol": "btcusdt", "trades": b"".join(self.records)})  # in the same MULTI as the bar
+        self.assertEqual(kwargs, {"minid": ANY, "approximate": True})
+        self.assertAlmostEqual(kwargs["minid"], time.time() * 1000 - 3600 * 1000, delta=60000)  # trimmed by age
+
+
+class TradeStreamTest(TestCase):  # Tests for the Redis trade stream and its consumer groups.
+
+    def setUp(self):
+        from api.codecs import BinanceTrade
+        from api.streams import stream_entry
+
+        self.trades = [
+            BinanceTrade("BTCUSDT", "45000", "1", 120001, 1, False),
+            BinanceTrade("BTCUSDT", "45100", "2", 120003, 2, True),
+            BinanceTrade("BTCUSDT", "44900", "1", 60002, 3, False),
+        ]
+        self.fields = {key.encode(): value.encode() if isinstance(value, str) else value
+                       for key, value in stream_entry("BTCUSDT", self.trades).items()}
+        self.redis = MagicMock()
+
+    def test_consumer_claims_pending_entries_first(self):
+        from api.streams import StreamConsumer
+
+        self.redis.xautoclaim.return_value = [b"0-0", [(b"1-0", self.fields)], []]
+        self.redis.xreadgroup.return_value = [[b"stream:trades", [(b"2-0", self.fields), (b"3-0", None)]]]
+        consumer = StreamConsumer("bars", client=self.redis, consumer="test", claim_idle_ms=60000)
+
+        (entry_id, symbol, trades), = consumer.read()
+        self.assertEqual((entry_id, symbol), (b"1-0", "btcusdt"))  # left pending by a dead consumer
+        self.assertEqual(trades["trade_id"].tolist(), [1, 2, 3])
+        self.redis.xgroup_create.assert_called_once_with("stream:trades", "bars", id="0", mkstream=True)
+        self.redis.xreadgroup.assert_not_called()
+
+        self.assertEqual([entry[0] for entry in consumer.read()], [b"2-0"])  # trimmed entries are skipped
+        self.redis.xack.assert_called_once_with("stream:trades", "bars", b"3-0")  # and acknowledged
+        self.redis.xautoclaim.assert_called_once()  # the pending list is checked again after claim_idle_ms
+        self.redis.xreadgroup.assert_called_once_with("bars", "test", {"stream:trades": ">"}, count=100, block=1000)
+
+        consumer.ack([b"2-0"])
+        self.redis.xack.assert_called_with("stream:trades", "bars", b"2-0")
+        self.assertEqual(consumer.stats(), {"read": 3, "claimed": 1, "acked": 2})
+
+    def test_group_stats(self):
+        from api.streams import StreamConsumer
+
+        self.redis.xinfo_groups.return_value = [
+            {"name": b"persist", "pending": 9, "lag": 90, "entries-read": 10},
+            {"name": b"bars", "pending": 2, "lag": 40, "entries-read": 60},
+        ]
+        consumer = StreamConsumer("bars", client=self.redis, consumer="test")
+        pipe = self.redis.pipeline.return_value.__enter__.return_value
+
+        consumer.write_stats(trades=5)
+
+        pipe.hset.assert_called_once_with("stats:stream:bars:test", mapping={
+            "read": 0, "claimed": 0, "acked": 0, "group_pending": 2, "group_lag": 40, "trades": 5,
+        })
+        self.redis.xinfo_groups.return_value[1]["lag"] = None  # not known after a trim
+        self.assertEqual(consumer.group_stats(), {"group_pending": 2, "group_lag": -1})
+
+    def test_existing_group(self):
+        from redis.exceptions import ResponseError
+        from api.streams import StreamConsumer
+
+        self.redis.xgroup_create.side_effect = ResponseError("BUSYGROUP Consumer Group name already exists")
+        StreamConsumer("persist", client=self.redis).ensure_group()
+
+        self.redis.xgroup_create.side_effect = ResponseError("WRONGTYPE")
+        with self.assertRaises(ResponseError):
+            StreamConsumer("persist", client=self.redis).ensure_group()
+
+    def test_aggregator_merges_and_acks_in_one_script(self):
+        from api.streams import StreamAggregator, decode_entry
+
+        consumer = MagicMock(stream="stream:trades", group="bars", consumer="test", acked=0)
+        consumer.read.return_value = [(b"1-0", *decode_entry(self.fields))]
+        ack_and_merge = consumer.redis.register_script.return_value
+        ack_and_merge.return_value = [1, [-1, 0]]  # the first bucket is already closed
+
+        aggregator = StreamAggregator(consumer)
+        self.assertEqual(aggregator.aggregate_once(), 3)
+
+        ack_and_merge.assert_called_once()
+        keys, args = ack_and_merge.call_args.kwargs["keys"], ack_and_merge.call_args.kwargs["args"]
+        self.assertEqual(keys, [
+            "stream:trades", "bar:v2:btcusdt:60000", "bars:btcusdt", "bars:btcusdt:closed",
+            "bar:v2:btcusdt:120000", "bars:btcusdt", "bars:btcusdt:closed",
+        ])
+        self.assertEqual(args[:4], ["bars", "test", 1, b"1-0"])  # acknowledged only while "test" owns the entry
+        scale = 10 ** 8
+        self.assertEqual(args[16:], [
+            120000, 45000 * scale, 45100 * scale, 45000 * scale, 45100 * scale, 3 * scale, 135200 * scale,
+            1 * scale, 90100 * scale, 2, 120001, 120003,
+        ])  # same arguments as the listener's summarize_trades
+        self.assertEqual((aggregator.trades, aggregator.late, consumer.acked), (3, 1, 1))
+
+    def test_aggregator_leaves_claimed_entries(self):
+        from api.streams import StreamAggregator, decode_entry, stream_entry
+
+        other = {key.encode(): value.encode() if isinstance(value, str) else value
+                 for key, value in stream_entry("ETHUSDT", self.trades[:1]).items()}
+        consumer = MagicMock(stream="stream:trades", group="bars", consumer="test", acked=0)
+        consumer.read.return_value = [(b"1-0", *decode_entry(self.fields)), (b"2-0", *decode_entry(other))]
+        ack_and_merge = consumer.redis.register_script.return_value
+        ack_and_merge.side_effect = [[0, [b"1-0"]], [1, [0]]]  # another consumer claimed 1-0 while this one stalled
+
+        aggregator = StreamAggregator(consumer)
+        self.assertEqual(aggregator.aggregate_once(), 1)
+
+        retry = ack_and_merge.call_args_list[1].kwargs
+        self.assertEqual(retry["args"][:4], ["bars", "test", 1, b"2-0"])
+        self.assertEqual(retry["keys"][1], "bar:v2:ethusdt:120000")
+        self.assertEqual((aggregator.trades, aggregator.lost, consumer.acked), (1, 1, 1))
+
+    async def test_writer_leaves_bars_to_the_stream(self):
+        from api.live import LiveBars
+        from api.redis_writer import RedisTradeWriter
+
+        mock_pipeline = MagicMock()
+        mock_pipeline.execute = AsyncMock(return_value=["1-0", 1])
+        mock_redis_instance = MagicMock()
+        mock_redis_instance.pipeline.return_value.__aenter__.return_value = mock_pipeline
+        mock_merge_bar = AsyncMock()
+        mock_redis_instance.register_script.return_value = mock_merge_bar
+        live = LiveBars(channel_layer=MagicMock(), publish_hz=10)
+
+        writer = RedisTradeWriter(client=mock_redis_instance, store_raw=False, bar_source="stream", live=live)
+        await writer.flush({"btcusdt": self.trades}, 3)
+
+        mock_pipeline.xadd.assert_called_once()
+        mock_merge_bar.assert_not_awaited()
+        self.assertEqual(live.bars["btcusdt"][0], 120000)  # live bars are still kept by the listener
+        self.assertEqual(writer.stats.written, 3)
+        self.assertEqual(writer.last_entry_id, "1-0")  # waited for by the gap filler
+
+    async def test_writer_wait_flushed(self):
+        from api.redis_writer import RedisTradeWriter
+
+        writer = RedisTradeWriter(client=MagicMock(), store_raw=False, bar_source="stream")
+        await writer.wait_flushed()  # nothing put yet
+        await writer.put("btcusdt", self.trades[0])
+        waiting = asyncio.ensure_future(writer.wait_flushed())
+        await asyncio.sleep(0)
+        self.assertFalse(waiting.done())
+
+        writer._flushed(1)  # written, or dropped after a Redis error
+        await asyncio.wait_for(waiting, 1)
+
+    async def test_group_processed(self):
+        from api.streams import group_processed
+
+        client = MagicMock()
+        client.xinfo_groups = AsyncMock(return_value=[
+            {"name": b"persist", "last-delivered-id": b"0-0"},
+            {"name": b"bars", "last-delivered-id": b"1700000000000-2"},
+        ])
+        client.xpending_range = AsyncMock(return_value=[])
+
+        self.assertTrue(await group_processed(client, "bars", "1700000000000-2"))
+        client.xpending_range.assert_awaited_once_with("stream:trades", "bars", min="-", max="1700000000000-2", count=1)
+        self.assertFalse(await group_processed(client, "bars", "1700000000000-10"))  # not read yet
+        self.assertFalse(await group_processed(client, "other", "1-0"))
+
+        client.xpending_range.return_value = [{"message_id": b"1700000000000-1"}]  # read, not merged yet
+        self.assertFalse(await group_processed(client, "bars", "1700000000000-2"))
+
+
+class MockBinanceHandler(BaseHTTPRequestHandler):  # aggTrades of a local mock Binance server
+    aggs = []
+    responses = []  # queued error statuses, served before the data
+    requests = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: int(values[0]) if values[0].isdigit() else values[0] for key, values in parse_qs(url.query).items()}
+        self.requests.append((url.path, params))
+        if self.responses:
+            self.send_response(self.responses.pop(0))
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+
+        if "fromId" in params:
+            aggs = [agg for agg in self.aggs if agg["a"] >= params["fromId"]]
+        else:
+            aggs = [agg for agg in self.aggs if params["startTime"] <= agg["T"] <= params["endTime"]]
+        body = json.dumps(aggs[:params["limit"]]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class BackfillTest(TestCase):  # Tests for backfilling trades missed while the listener was disconnected.
+
+    def setUp(self):
+        self.now = int(time.time() * 1000)
+        MockBinanceHandler.aggs = []
+        MockBinanceHandler.responses = []
+        MockBinanceHandler.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MockBinanceHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def agg(self, agg_id, first, last, price="45000.00", quantity="0.5"):
+        return {"a": agg_id, "p": price, "q": quantity, "f": first, "l": last, "T": self.now + first, "m": False, "M": True}
+
+    def test_missed_trades_pages_and_retries(self):
+        from api.backfill import missed_trades
+
+        MockBinanceHandler.aggs = [self.agg(i, i, i) for i in range(1, 2501)]
+        MockBinanceHandler.responses = [429]  # rate limited once
+
+        missed = missed_trades("btcusdt", 10, self.now + 10, base_url=self.base_url)
+
+        self.assertEqual([trade.trade_id for trade, _ in missed], list(range(11, 2501)))
+        self.assertEqual((missed[0][0].symbol, missed[0][0].price, missed[0][0].trade_time),
+                         ("BTCUSDT", "45000.00", self.now + 11))
+        self.assertEqual([path for path, _ in MockBinanceHandler.requests], ["/api/v3/aggTrades"] * 4)
+        first, retried, *pages = [params for _, params in MockBinanceHandler.requests]
+        self.assertEqual(first, retried)
+        self.assertEqual((first["symbol"], first["startTime"], first["limit"]), ("BTCUSDT", self.now + 10, 1000))
+        self.assertEqual([page["fromId"] for page in pages], [1010, 2010])
+
+    def test_missed_trades_errors(self):
+        from api.backfill import BackfillError, missed_trades
+
+        MockBinanceHandler.responses = [400]
+        with self.assertRaises(BackfillError):  # not retried
+            missed_trades("btcusdt", 10, self.now, base_url=self.base_url)
+        self.assertEqual(len(MockBinanceHandler.requests), 1)
+
+    async def test_gap_is_backfilled_before_live_trades(self):
+        from api.backfill import BACKFILL_STATS_KEY, GapFiller
+        from api.codecs import BinanceTrade
+
+        MockBinanceHandler.aggs = [
+            self.agg(100, 1, 1),  # seen before the gap
+            self.agg(101, 2, 4, quantity="1.5"),  # partly seen, fills 2 and 3 arrived before the gap
+            self.agg(102, 5, 5), self.agg(103, 6, 6), self.agg(104, 7, 9), self.agg(105, 10, 10), self.agg(106, 11, 12),
+        ]
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        writer = MagicMock()
+        writer.put = AsyncMock()
+        writer.redis.pipeline.return_value.__aenter__.return_value = pipe
+        writer.wait_flushed = AsyncMock(side_effect=lambda: pipe.delete.assert_not_called())  # hold kept until written
+        gaps = GapFiller(writer, base_url=self.base_url)
+
+        def trade(trade_id, trade_time=None):
+            return BinanceTrade("BTCUSDT", "45000.00", "0.5", trade_time or self.now + trade_id, trade_id, False)
+
+        for trade_id in (1, 2, 3):
+            await gaps.put("btcusdt", trade(trade_id, self.now + 2 if trade_id > 1 else None))  # 2, 3 of one order
+        await gaps.hold(["btcusdt", "ethusdt"])  # no trades of ethusdt yet, nothing to backfill
+        bucket = (self.now + 2) - (self.now + 2) % 60000
+        pipe.set.assert_called_once_with("bars:btcusdt:hold", bucket - 60000, ex=ANY, nx=True)
+
+        gaps.recover(["btcusdt", "ethusdt"])
+        for trade_id in (9, 10, 11, 13):
+            await gaps.put("btcusdt", trade(trade_id))  # live trades wait for the backfill
+        self.assertEqual(len(gaps.tasks), 1)
+        await asyncio.gather(*gaps.tasks)
+
+        written = [(call.args[1].trade_id, call.kwargs["aggregated"]) for call in writer.put.call_args_list]
+        self.assertEqual(written, [  # in order, nothing twice, backfilled ones flagged so they are not persisted
+            (1, False), (2, False), (3, False), (4, True), (5, True), (6, True), (7, True), (10, True), (11, True),
+            (13, False),
+        ])
+        self.assertEqual(writer.put.call_args_list[3].args[1].quantity, "0.5")  # without the fills seen
+        writer.wait_flushed.assert_awaited_once()
+        self.assertEqual(gaps.last["btcusdt"][0], 13)
+        self.assertEqual(gaps.waiting, {})
+        pipe.delete.assert_called_once_with("bars:btcusdt:hold")
+        pipe.hincrby.assert_any_call(BACKFILL_STATS_KEY, "backfilled", 6)
+        pipe.hincrby.assert_any_call(BACKFILL_STATS_KEY, "duplicates", 3)
+
+        await gaps.put("btcusdt", trade(14))  # resumed
+        self.assertEqual(writer.put.call_args.args[1].trade_id, 14)
+
+    async def test_failed_backfill_releases_live_trades(self):
+        from api.backfill import GapFiller
+        from api.codecs import BinanceTrade
+
+        MockBinanceHandler.responses = [400]
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        writer = MagicMock()
+        writer.put = AsyncMock()
+        writer.redis.pipeline.return_value.__aenter__.return_value = pipe
+        writer.wait_flushed = AsyncMock()
+        log = MagicMock()
+        gaps = GapFiller(writer, base_url=self.base_url, log=log)
+
+        await gaps.put("btcusdt", BinanceTrade("BTCUSDT", "45000.00", "0.5", self.now, 1, False))
+        gaps.recover(["btcusdt"])
+        await gaps.put("btcusdt", BinanceTrade("BTCUSDT", "45000.00", "0.5", self.now + 5, 5, False))
+        await asyncio.gather(*gaps.tasks)
+
+        self.assertEqual([call.args[1].trade_id for call in writer.put.call_args_list], [1, 5])
+        log.assert_called_once()
+
+    def test_backoff(self):
+        from api.backfill import Backoff
+
+        backoff = Backoff(base=1, cap=8)
+        for attempt in range(6):
+            self.assertTrue(0 <= backoff.next_delay() <= min(8, 2 ** attempt))
+        backoff.reset()
+        self.assertLessEqual(backoff.next_delay(), 1)
+
+
+class ReplayTest(TestCase):  # Tests for rebuilding bars from Binance trade archives.
+
+    def setUp(self):
+        import tempfile
+        import zipfile
+        from datetime import timezone as dt_timezone
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.day = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        start = int(self.day.timestamp() * 1000)
+        rows = [  # id, price, qty, quote qty, time, buyer is maker, best match
+            (1, "45000.00000000", "0.50000000", start + 1000, "True"),
+            (2, "45100.00000000", "0.25000000", start + 2000, "False"),
+            (3, "44900.00000000", "1.00000000", start + 59999, "True"),
+            (4, "45200.00000000", "2.00000000", start + 60000, "False"),
+            (5, "45300.00000000", "1.00000000", start + 360000, "False"),
+        ]
+        csv = "id,price,qty,quote_qty,time,is_buyer_maker,is_best_match\n" + "".join(
+            f"{trade_id},{price},{quantity},0,{trade_time * 1000},{maker},True\n"  # microseconds, as since 2025
+            for trade_id, price, quantity, trade_time, maker in rows
+        )
+        with zipfile.ZipFile(f"{self.directory.name}/BTCUSDT-trades-2024-01-01.zip", "w") as archive:
+            archive.writestr("BTCUSDT-trades-2024-01-01.csv", csv)
+
+        start += 86400 * 1000
+        with open(f"{self.directory.name}/ETHUSDT-aggTrades-2024-01-02.csv", "w") as archive:
+            # agg id, price, qty, first trade id, last trade id, time, buyer is maker, best match
+            archive.write(f"1,2500.5,4,10,12,{start + 5},false,true\n2,2501.5,1,13,13,{start + 6},true,true\n")
+        open(f"{self.directory.name}/README.txt", "w").close()  # not an archive
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay_creates_partitions(self):  # old days have no partition yet, their bars would go to DEFAULT
+        from api.partitions import ensure_partitions
+        from api.replay import find_archives, replay_archives
+
+        with patch('api.partitions.is_partitioned', return_value=True), \
+                patch('api.partitions.existing_partitions', return_value=["api_tickeraggregate_p20231231"]), \
+                patch('api.partitions.create_partition') as create_partition:
+            replay_archives(find_archives([self.directory.name]), workers=1)
+            self.assertEqual([call.args for call in create_partition.call_args_list], [  # both days are in January
+                ("api_tickeraggregate", "api_tickeraggregate_p202401", self.day, self.day + timedelta(days=31)),
+            ])
+
+            create_partition.reset_mock()
+            ensure_partitions(TickerAggregate, [self.day - timedelta(hours=1), self.day + timedelta(hours=1)], "day")
+            self.assertEqual([call.args[1] for call in create_partition.call_args_list], [
+                "api_tickeraggregate_p20240101",  # December 31 exists
+            ])
+        self.assertEqual(TickerAggregate.objects.filter(symbol="ETHUSDT", interval="1m").count(), 1)
+
+    def test_replay_trades(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        TickerAggregate.objects.create(  # replaced
+            symbol="BTCUSDT", interval="1m", start_time=self.day, end_time=self.day + timedelta(minutes=1),
+            open_price=1, close_price=1, high_price=1, low_price=1, volume=1, trade_count=1,
+        )
+        output = StringIO()
+        for _ in range(2):  # replaying again replaces the bars
+            call_command("replay_trades", self.directory.name, "--workers", "1", "--chunk-rows", "2", stdout=output)
+        self.assertIn("Replayed 2 days of 2 symbols", output.getvalue())
+
+        bars = TickerAggregate.objects.filter(symbol="BTCUSDT", interval="1m").order_by("start_time")
+        self.assertEqual([bar.start_time for bar in bars],
+                         [self.day, self.day + timedelta(minutes=1), self.day + timedelta(minutes=6)])
+        first = bars[0]  # spans two chunks of the file
+        self.assertEqual((first.open_price, first.high_price, first.low_price, first.close_price),
+                         (Decimal("45000"), Decimal("45100"), Decimal("44900"), Decimal("44900")))
+        self.assertEqual((first.volume, first.buy_volume, first.trade_count), (Decimal("1.75"), Decimal("0.25"), 3))
+        self.assertEqual(first.vwap, Decimal("44957.1428571429"))
+
+        rollup = TickerAggregate.objects.get(symbol="BTCUSDT", interval="5m", start_time=self.day)
+        self.assertEqual((rollup.start_time, rollup.end_time), (self.day, self.day + timedelta(minutes=5)))
+        self.assertEqual((rollup.open_price, rollup.close_price, rollup.high_price), (
+            Decimal("45000"), Decimal("45200"), Decimal("45200"),
+        ))
+        self.assertEqual((rollup.volume, rollup.trade_count), (Decimal("3.75"), 4))
+        self.assertEqual(TickerAggregate.objects.get(symbol="BTCUSDT", interval="1d").trade_count, 5)
+
+        eth = TickerAggregate.objects.get(symbol="ETHUSDT", interval="1m")
+        self.assertEqual((eth.open_price, eth.close_price, eth.volume, eth.buy_volume, eth.trade_count),
+                         (Decimal("2500.5"), Decimal("2501.5"), Decimal("5"), Decimal("4"), 4))  # every fill counted
+
+    def test_chunks_do_not_change_bars(self):
+        from api.replay import aggregate_archive, find_archives
+
+        path, = find_archives([self.directory.name], {"btcusdt"})
+        intervals = {"1m": 60, "5m": 300}
+        _, _, whole = aggregate_archive(path, intervals, chunk_rows=100)
+        for chunk_rows in (1, 2, 3):
+            _, _, chunked = aggregate_archive(path, intervals, chunk_rows=chunk_rows)
+            for label in intervals:
+                for field, values in whole[label].items():
+                    self.assertEqual(chunked[label][field].tolist(), values.tolist(), (chunk_rows, label, field))
+
+    def test_large_values_stay_exact(self):
+        import numpy as np
+        from api.replay import scale_column
+
+        lines = ["1,123456789.12345678,0.1\n", "2,45000.12345678,0.1\n"]
+        values = np.array([123456789.12345678, 45000.12345678])
+        self.assertEqual(scale_column(values, lines, 1).tolist(), [12345678912345678, 4500012345678])
+
+    def test_values_near_the_float_limit_stay_exact(self):
+        import numpy as np
+        from api.replay import FLOAT_EXACT_LIMIT, scale_column, to_scaled
+
+        texts = [  # the float products of the first two round to a neighbouring value
+            "36039774.60538071", "44999999.99999999",
+            f"{FLOAT_EXACT_LIMIT - 1}.99999999", f"{FLOAT_EXACT_LIMIT}.00000001", "11258998.12345678", "0.00000001",
+        ]
+        lines = [f"{trade_id},{text},0.1\n" for trade_id, text in enumerate(texts)]
+        values = np.array([float(text) for text in texts])
+        self.assertEqual(scale_column(values, lines, 1).tolist(), [to_scaled(text) for text in texts])
+
+
+class WebSocketServerTest(TransactionTestCase):  # Tests for WebSocket server.
+
+    def setUp(self):
+        from api.latest import latest_bars
+        latest_bars.frames.clear()  # frames broadcast by other tests
+
+        self.test_symbol = "BTCUSDT"
+        self.ticker = TickerAggregate.objects.create(
+            symbol=self.test_symbol,
+            start_time=timezone.now() - timedelta(minutes=5),
+            end_time=timezone.now(),
+            open_price=Decimal('44100.00'),
+            close_price=Decimal('44300.00'),
+            high_price=Decimal('44400.00'),
+            low_price=Decimal('44050.00'),
+            volume=Decimal('3.2')
+        )
 
         self.application = URLRouter(websocket_urlpatterns)
 
@@ -279,20 +1662,27 @@ class WebSocketServerTest(TransactionTestCase):  # Tests for WebSocket server.
         response = await communicator.receive_json_from()
 
         self.assertEqual(response["symbol"], self.test_symbol)
-        self.assertEqual(response["open_price"], str(self.ticker.open_price))
-        self.assertEqual(response["close_price"], str(self.ticker.close_price))
-        self.assertEqual(response["high_price"], str(self.ticker.high_price))
-        self.assertEqual(response["low_price"], str(self.ticker.low_price))
-        self.assertEqual(response["volume"], str(self.ticker.volume))
+        self.assertEqual(Decimal(response["open_price"]), self.ticker.open_price)
+        self.assertEqual(Decimal(response["close_price"]), self.ticker.close_price)
+        self.assertEqual(Decimal(response["high_price"]), self.ticker.high_price)
+        self.assertEqual(Decimal(response["low_price"]), self.ticker.low_price)
+        self.assertEqual(Decimal(response["volume"]), self.ticker.volume)
 
         await communicator.disconnect()
 
     async def test_broadcast_updates(self):
+        from api.broadcast import bar_frames, send_bars
+
         communicator1 = WebsocketCommunicator(self.application, "/ws/trade/")
         communicator2 = WebsocketCommunicator(self.application, "/ws/trade/")
+        communicator3 = WebsocketCommunicator(self.application, "/ws/trade/")
 
-        await communicator1.connect()
-        await communicator2.connect()
+        for communicator, symbols in [(communicator1, [self.test_symbol]), (communicator2, ["*"]),
+                                      (communicator3, ["ETHUSDT"])]:
+            await communicator.connect()
+            await communicator.send_json_to({"action": "subscribe", "symbols": symbols})
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply["action"], "subscribed")
 
         @database_sync_to_async
         def create_new_ticker():
@@ -311,18 +1701,7 @@ class WebSocketServerTest(TransactionTestCase):  # Tests for WebSocket server.
         new_ticker = await create_new_ticker()
 
         channel_layer = get_channel_layer()
-        data = {
-            "symbol": new_ticker.symbol,
-            "open_price": str(new_ticker.open_price),
-            "close_price": str(new_ticker.close_price),
-            "high_price": str(new_ticker.high_price),
-            "low_price": str(new_ticker.low_price),
-            "volume": str(new_ticker.volume),
-        }
-
-        await channel_layer.group_send(
-            "trades", {"type": "send_trade_update", "data": data}
-        )
+        await send_bars(channel_layer, bar_frames([new_ticker]))
 
         response1 = await communicator1.receive_json_from()
         response2 = await communicator2.receive_json_from()
@@ -335,5 +1714,124 @@ class WebSocketServerTest(TransactionTestCase):  # Tests for WebSocket server.
             self.assertEqual(response["low_price"], str(new_ticker.low_price))
             self.assertEqual(response["volume"], str(new_ticker.volume))
 
-        await communicator1.disconnect()
-        await communicator2.disconnect()
+        self.assertTrue(await communicator1.receive_nothing())  # only what was subscribed to
+        self.assertTrue(await communicator3.receive_nothing())
+
+        await communicator1.send_json_to({"action": "unsubscribe", "symbols": [self.test_symbol]})
+        self.assertEqual((await communicator1.receive_json_from())["action"], "unsubscribed")
+        await send_bars(channel_layer, bar_frames([new_ticker]))
+        self.assertTrue(await communicator1.receive_nothing())
+
+        for communicator in [communicator1, communicator2, communicator3]:
+            await communicator.disconnect()
+
+    async def test_subscribe_errors(self):
+        communicator = WebsocketCommunicator(self.application, "/ws/trade/")
+        await communicator.connect()
+
+        for message in [
+            {"action": "subscribe", "symbols": ["BTCUSDT"], "interval": "7x"},
+            {"action": "subscribe", "symbols": ["BTC/USDT"]},
+            {"action": "subscribe", "symbols": "BTCUSDT"},
+            {"action": "subscribe", "symbols": ["*"], "live": True},
+            {"action": "subscribe", "symbols": ["BTCUSDT"], "live": True, "max_hz": 0},
+            {"action": "dance"},
+            ["BTCUSDT"],
+            "BTCUSDT",
+        ]:
+            await communicator.send_json_to(message)
+            self.assertIn("error", await communicator.receive_json_from())
+
+        await communicator.disconnect()
+
+    async def test_live_updates_are_conflated(self):
+        from api.live import live_group
+
+        communicator = WebsocketCommunicator(self.application, "/ws/trade/")
+        await communicator.connect()
+        await communicator.send_json_to({"action": "subscribe", "symbols": [self.test_symbol], "live": True,
+                                         "max_hz": 5})
+        reply = await communicator.receive_json_from()
+        self.assertEqual((reply["action"], reply["live"], reply["max_hz"]), ("subscribed", True, 5))
+
+        channel_layer = get_channel_layer()
+        for price in range(100):  # a burst faster than the client rate
+            await channel_layer.group_send(live_group(self.test_symbol), {
+                "type": "send_live_update", "symbol": self.test_symbol, "frame": json.dumps({"close_price": str(price)}),
+            })
+
+        frames = [await communicator.receive_json_from(timeout=1)]
+        while not await communicator.receive_nothing(timeout=0.3):
+            frames.append(await communicator.receive_json_from())
+
+        self.assertLessEqual(len(frames), 2)  # the first update and the latest one
+        self.assertEqual(frames[-1]["close_price"], "99")
+
+        await communicator.send_json_to({"action": "unsubscribe", "symbols": [self.test_symbol], "live": True})
+        self.assertEqual((await communicator.receive_json_from())["action"], "unsubscribed")
+        await channel_layer.group_send(live_group(self.test_symbol), {
+            "type": "send_live_update", "symbol": self.test_symbol, "frame": json.dumps({"close_price": "100"}),
+        })
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.disconnect()
+
+    async def test_live_rate_is_per_symbol(self):
+        from api.live import live_group
+
+        communicator = WebsocketCommunicator(self.application, "/ws/trade/")
+        await communicator.connect()
+        await communicator.send_json_to({"action": "subscribe", "symbols": ["BTCUSDT"], "live": True, "max_hz": 1})
+        self.assertEqual((await communicator.receive_json_from())["max_hz"], 1)
+        await communicator.send_json_to({"action": "subscribe", "symbols": ["ETHUSDT"], "live": True, "max_hz": 100})
+        self.assertEqual((await communicator.receive_json_from())["max_hz"], 10)  # LIVE_MAX_HZ at most
+
+        channel_layer = get_channel_layer()
+        for price in range(3):
+            for symbol in ("BTCUSDT", "ETHUSDT"):
+                await channel_layer.group_send(live_group(symbol), {
+                    "type": "send_live_update", "symbol": symbol, "frame": json.dumps({"s": symbol, "p": price}),
+                })
+                await asyncio.sleep(0.15)
+
+        frames = []
+        while not await communicator.receive_nothing(timeout=0.3):
+            frames.append(await communicator.receive_json_from())
+        eth = [frame["p"] for frame in frames if frame["s"] == "ETHUSDT"]
+        btc = [frame["p"] for frame in frames if frame["s"] == "BTCUSDT"]
+        self.assertEqual(eth, [0, 1, 2])  # the faster subscription of ETHUSDT is not slowed down by BTCUSDT
+        self.assertEqual(btc[0], 0)
+        self.assertLessEqual(len(btc), 2)
+        await communicator.disconnect()
+
+    async def test_live_disabled(self):
+        with patch('api.consumers.LIVE_MAX_HZ', 0):
+            communicator = WebsocketCommunicator(self.application, "/ws/trade/")
+            await communicator.connect()
+            await communicator.send_json_to({"action": "subscribe", "symbols": ["BTCUSDT"], "live": True})
+            self.assertEqual((await communicator.receive_json_from())["error"], "Live updates are disabled")
+            await communicator.send_json_to({"action": "subscribe", "symbols": ["BTCUSDT"]})  # closed bars still work
+            self.assertEqual((await communicator.receive_json_from())["action"], "subscribed")
+            await communicator.disconnect()
+
+    async def test_slow_consumer_is_closed(self):
+        from api.broadcast import bar_frames, send_bars
+        from api.outbox import stats
+
+        with patch('api.consumers.WS_SEND_QUEUE_SIZE', 2), patch('api.consumers.WS_SLOW_CONSUMER_SECONDS', 0), \
+                patch('api.consumers.server_buffer', return_value=lambda: 10 ** 9):  # the client reads nothing
+            communicator = WebsocketCommunicator(self.application, "/ws/trade/")
+            await communicator.connect()
+            await communicator.send_json_to({"action": "subscribe", "symbols": ["*"]})
+            self.assertTrue(await communicator.receive_nothing())  # the reply is stuck in the queue
+            evictions = stats.evictions
+
+            ticker = await database_sync_to_async(TickerAggregate.objects.get)(pk=self.ticker.pk)
+            await send_bars(get_channel_layer(), bar_frames([ticker]))  # the reply and the bar fill the queue
+            await send_bars(get_channel_layer(), bar_frames([ticker]))  # replaces the pending bar
+            await send_bars(get_channel_layer(), bar_frames([ticker.__class__(symbol="ETHUSDT", interval="1m")]))
+
+            output = await communicator.receive_output()
+            self.assertEqual(output, {"type": "websocket.close", "code": 4008})
+            self.assertEqual(stats.evictions, evictions + 1)
+            await communicator.disconnect()
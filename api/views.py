@@ -1,15 +1,87 @@
+from datetime import datetime, timezone
+
+from django.http import HttpResponse, HttpResponseNotModified
 from django.shortcuts import render
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
 from rest_framework import viewsets
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.exceptions import ValidationError
 
+from api.cache import history_cache, ALL_SYMBOLS
 from api.models import TickerAggregate
-from api.serializers import TickerAggregateSerializer
+from api.pagination import KeysetPagination
+from api.renderers import HISTORY_RENDERERS
+from api.rollups import BASE_INTERVAL, INTERVALS
+from api.serializers import TickerAggregateSerializer, HistoryRows, HISTORY_FIELDS
 
 
 class TickerHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = TickerAggregate.objects.all()
     serializer_class = TickerAggregateSerializer
-    pagination_class = LimitOffsetPagination
+    pagination_class = KeysetPagination
+    renderer_classes = HISTORY_RENDERERS
+
+    def list(self, request, *args, **kwargs):
+        output_format = request.accepted_renderer.format
+        if not history_cache.ttl or output_format == 'api':  # the browsable API page is per user
+            return self.list_page()
+
+        params = {**request.query_params.dict(), 'symbol': request.query_params.get('symbol', '').upper()}
+        symbol = params['symbol'] or ALL_SYMBOLS
+        digest = history_cache.digest(params, output_format)
+        cached = history_cache.lookup(symbol, digest)
+        if cached is None:  # Redis is unavailable
+            return self.list_page()
+
+        generation, entry = cached
+        etag = f'"{generation}-{digest[:16]}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        elif entry:
+            response = HttpResponse(entry['body'], content_type=entry['content_type'].decode())
+            if 'link' in entry:
+                response['Link'] = entry['link'].decode()
+        else:
+            response = self.list_page()
+            response.add_post_render_callback(lambda rendered: history_cache.store(symbol, generation, digest, rendered))
+        response['ETag'] = etag
+        return response
+
+    def list_page(self):  # value tuples instead of model instances and the serializer
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*HISTORY_FIELDS, named=True)
+        return self.get_paginated_response(HistoryRows(self.paginate_queryset(queryset)))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        params = self.request.query_params
+        interval = params.get('interval', BASE_INTERVAL)  # one resolution per list, BAR_INTERVAL bars by default
+        if interval not in INTERVALS:
+            raise ValidationError({'interval': f"Must be one of: {', '.join(INTERVALS)}"})
+        queryset = queryset.filter(interval=interval)
+
+        if params.get('symbol'):
+            queryset = queryset.filter(symbol=params['symbol'].upper())
+        if params.get('start'):  # bars starting in [start, end)
+            queryset = queryset.filter(start_time__gte=parse_time(params['start'], 'start'))
+        if params.get('end'):
+            queryset = queryset.filter(start_time__lt=parse_time(params['end'], 'end'))
+        return queryset
+
+
+def parse_time(value, name):  # ISO 8601 or epoch milliseconds
+    try:
+        if value.isdigit():
+            parsed = datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc)
+        else:
+            parsed = parse_datetime(value.replace(' ', '+'))  # unescaped "+00:00" arrives as " 00:00"
+    except (ValueError, OverflowError, OSError):  # also epochs out of the datetime range
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: "Expected an ISO 8601 datetime or epoch milliseconds"})
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
 
 
 def websocket_test(request):
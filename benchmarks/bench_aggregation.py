@@ -0,0 +1,67 @@
+"""
+Time to aggregate one bar of N trades: the old Python path of aggregate_trades
+(float() and datetime.fromtimestamp per trade, min/max/sum over lists) against
+api.aggregation on a trade array, with and without decoding binary Redis records first.
+
+    python -m benchmarks.bench_aggregation [trade counts...]
+"""
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from api.aggregation import aggregate
+from api.codecs import RECORD, RECORD_DTYPE, RECORD_VERSION, decode_trade_records
+from api.fixedpoint import SCALE
+
+INTERVAL_MS = 60_000
+
+
+def make_trades(count):
+    rng = np.random.default_rng(42)
+    trades = np.empty(count, dtype=RECORD_DTYPE)
+    trades["version"] = RECORD_VERSION
+    trades["trade_id"] = np.arange(count)
+    trades["price"] = (82_000 + rng.normal(0, 50, count).cumsum() / 100) * SCALE // 1
+    trades["quantity"] = rng.integers(1, 10 ** 7, count)
+    trades["trade_time"] = np.sort(rng.integers(0, INTERVAL_MS, count))
+    trades["is_buyer_maker"] = rng.random(count) < 0.5
+    return trades
+
+
+def python_path(trade_data):
+    prices = [float(trade["price"]) for trade in trade_data]
+    quantities = [float(trade["quantity"]) for trade in trade_data]
+    trade_times = [datetime.fromtimestamp(int(trade["trade_time"]) / 1000) for trade in trade_data]
+    return min(trade_times), max(trade_times), prices[0], prices[-1], max(prices), min(prices), sum(quantities)
+
+
+def timed(func, *args, repeats=3):  # best of `repeats` runs
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f"{'trades':>10} {'python ms':>10} {'engine ms':>10} {'decode+engine ms':>17} {'speedup':>8}")
+    for count in counts:
+        trades = make_trades(count)
+        trade_data = [
+            {"price": f"{price / SCALE:.8f}", "quantity": f"{quantity / SCALE:.8f}", "trade_time": str(trade_time)}
+            for price, quantity, trade_time in zip(trades["price"], trades["quantity"], trades["trade_time"])
+        ]
+        records = [RECORD.pack(*trade) for trade in trades.tolist()]
+
+        python_ms = timed(python_path, trade_data)
+        engine_ms = timed(aggregate, trades, INTERVAL_MS)
+        decode_ms = timed(lambda: aggregate(decode_trade_records(records), INTERVAL_MS))
+        print(f"{count:>10} {python_ms:>10.1f} {engine_ms:>10.2f} {decode_ms:>17.2f} {python_ms / engine_ms:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
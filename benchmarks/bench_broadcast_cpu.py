@@ -0,0 +1,91 @@
+"""
+CPU per bar update delivered to N WebSocket clients: the old messages with the bar as a dict, which every
+consumer encodes with dumps(), against messages with the frame encoded once by api.broadcast.
+The clients are spread over server processes. The Redis channel layer serializes (msgpack) a group message once
+per process and deserializes it once in that process. Every consumer of the process then runs its handler.
+Socket writes are not included.
+
+    python -m benchmarks.bench_broadcast_cpu [clients...] [--processes=4]
+
+No Redis server is needed: the channel layer serializer is used directly.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeWS.settings')
+django.setup()
+
+from channels_redis.core import RedisChannelLayer  # noqa: E402
+
+from api.broadcast import bar_group  # noqa: E402
+from api.codecs import BACKEND, dumps  # noqa: E402
+from api.consumers import TradeConsumer  # noqa: E402
+from api.latest import latest_bars  # noqa: E402
+from api.rollups import BASE_INTERVAL  # noqa: E402
+
+REPEATS = 20
+BAR = {"symbol": "BTCUSDT", "open_price": "45000.12345678", "close_price": "45100.2", "high_price": "45200.3",
+       "low_price": "44900.4", "volume": "12.345", "interval": BASE_INTERVAL}
+
+
+class OldConsumer(TradeConsumer):  # the handler before frames were encoded by the sender
+    async def send_trade_update(self, event):
+        latest_bars.set(event["data"]["symbol"], dumps(event["data"]))
+        await self.send(text_data=dumps(event["data"]))
+
+
+def make_consumers(consumer_class, count):
+    consumers = []
+    for _ in range(count):
+        consumer = consumer_class()
+        consumer.sent = 0
+
+        async def send(text_data, consumer=consumer):
+            consumer.sent += len(text_data)
+        consumer.send = send
+        consumers.append(consumer)
+    return consumers
+
+
+async def deliver(layer, message, consumers, processes):  # CPU seconds of one update, sent bytes
+    per_process = [consumers[i::processes] for i in range(processes)]
+    started = time.process_time()
+    for process_consumers in per_process:
+        event = layer.deserialize(layer.serialize({**message, "__asgi_channel__": [f"{bar_group('BTCUSDT', '1m')}!"]}))
+        for consumer in process_consumers:
+            await consumer.send_trade_update(event)
+    return time.process_time() - started
+
+
+def measure(clients, processes):
+    layer = RedisChannelLayer()
+    old_message = {"type": "send_trade_update", "tick": 1, "data": BAR}
+    new_message = {"type": "send_trade_update", "tick": 1, "symbol": BAR["symbol"], "interval": BASE_INTERVAL,
+                   "frame": dumps(BAR)}
+
+    results = {}
+    for name, consumer_class, message in [("dict", OldConsumer, old_message), ("frame", TradeConsumer, new_message)]:
+        consumers = make_consumers(consumer_class, clients)
+        cpu = min(asyncio.run(deliver(layer, message, consumers, processes)) for _ in range(REPEATS))
+        results[name] = cpu, len(layer.serialize(message))
+    return results
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    processes = next((int(arg.split("=")[1]) for arg in sys.argv[1:] if arg.startswith("--processes=")), 4)
+    print(f"{processes} server processes, {BACKEND} codec, best of {REPEATS}")
+    print(f"{'clients':>8} {'message':<7} {'layer bytes':>11} {'CPU ms/update':>14} {'us/client':>10}")
+    for clients in [int(arg) for arg in args] or [1000, 10000]:
+        results = measure(clients, processes)
+        for name, (cpu, size) in results.items():
+            print(f"{clients:>8} {name:<7} {size:>11} {cpu * 1000:>14.2f} {cpu * 1e6 / clients:>10.2f}")
+        print(f"{'':>8} frames use {results['dict'][0] / results['frame'][0]:.1f}x less CPU")
+
+
+if __name__ == '__main__':
+    main()
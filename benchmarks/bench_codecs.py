@@ -0,0 +1,70 @@
+"""
+Messages per second of api.codecs against the standard json module for every stage
+that encodes or decodes JSON: listener ingest, raw trade records in Redis, broadcast.
+The binary rows compare compact trade records (TRADE_RECORD_FORMAT=binary) with JSON ones,
+bulk decoding is measured on lists of 1000 records as read by aggregate_trades.
+
+    python -m benchmarks.bench_codecs [messages]
+"""
+import json
+import sys
+import time
+
+from api import codecs
+
+MESSAGE = json.dumps({
+    "e": "trade", "E": 1741680000001, "s": "BTCUSDT", "t": 4621519181, "p": "82000.01000000",
+    "q": "0.00012000", "T": 1741680000000, "m": True, "M": True,
+})
+TRADE = codecs.decode_trade(MESSAGE)
+RECORD = codecs.encode_trade_record(TRADE)
+JSON_RECORDS = [codecs.encode_trade_record(TRADE, "json").encode()] * 1000
+BINARY_RECORDS = [codecs.encode_trade_record(TRADE, "binary")] * 1000
+PAYLOAD = {
+    "symbol": "BTCUSDT", "open_price": "82000.0100000000", "close_price": "82010.5000000000",
+    "high_price": "82050.0000000000", "low_price": "81990.1200000000", "volume": "12.3456700000",
+}
+BAR = codecs.BarPayload(**PAYLOAD)
+
+
+def stdlib_ingest():
+    data = json.loads(MESSAGE)
+    if "s" in data and "p" in data:
+        return {"symbol": data["s"].lower(), "price": data["p"], "quantity": data["q"], "trade_time": data["T"]}
+
+
+def stdlib_record():
+    return json.dumps({"symbol": "btcusdt", "price": TRADE.price, "quantity": TRADE.quantity,
+                       "trade_time": TRADE.trade_time})
+
+
+STAGES = [
+    ("ingest: decode Binance message", stdlib_ingest, lambda: codecs.decode_trade(MESSAGE)),
+    ("redis: encode trade record", stdlib_record, lambda: codecs.encode_trade_record(TRADE)),
+    ("aggregation: decode trade record", lambda: json.loads(RECORD), lambda: codecs.loads(RECORD)),
+    ("broadcast: encode bar payload", lambda: json.dumps(PAYLOAD), lambda: codecs.dumps(BAR)),
+    ("binary: encode trade record", stdlib_record, lambda: codecs.encode_trade_record(TRADE, "binary")),
+    ("binary: bulk decode 1000 records", lambda: [json.loads(record) for record in JSON_RECORDS],
+     lambda: codecs.decode_trade_records(BINARY_RECORDS)),
+]
+
+
+def rate(func, messages):
+    started = time.perf_counter()
+    for _ in range(messages):
+        func()
+    return messages / (time.perf_counter() - started)
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"backend: {codecs.BACKEND}, {messages} messages per stage")
+    print(f"{'stage':<36} {'json msg/s':>12} {codecs.BACKEND + ' msg/s':>14} {'speedup':>8}")
+    for name, baseline, fast in STAGES:
+        baseline_rate = rate(baseline, messages)
+        fast_rate = rate(fast, messages)
+        print(f"{name:<36} {baseline_rate:>12,.0f} {fast_rate:>14,.0f} {fast_rate / baseline_rate:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Sustained rows/sec of raw trade persistence: ORM bulk_create of Trade objects against the persist_trades path
+(binary records decoded with NumPy, COPY FROM STDIN into a temporary table, INSERT ... ON CONFLICT DO NOTHING).
+Each batch is committed separately, like persist_trades does. The COPY path is replayed once more
+to show the cost of deduplicating trades that are already stored.
+
+    python -m benchmarks.bench_copy_trades [total trades] [batch size]
+
+Uses the database from the usual .env settings (COPY needs PostgreSQL), rows are deleted afterwards.
+"""
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeWS.settings')
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+
+from api.codecs import BinanceTrade, decode_trade_records, encode_trade_record  # noqa: E402
+from api.models import Trade  # noqa: E402
+from api.persist import copy_rows, copy_trades  # noqa: E402
+
+SYMBOL = "BENCH"
+
+
+def make_records(count):
+    start = int(time.time() * 1000) - count
+    return [
+        encode_trade_record(BinanceTrade(SYMBOL, f"{45000 + i % 1000}.12", "0.00150000", start + i, i, i % 2 == 0),
+                            "binary")
+        for i in range(count)
+    ]
+
+
+def orm(records):
+    trades = decode_trade_records(records)
+    Trade.objects.bulk_create([
+        Trade(symbol=SYMBOL, trade_id=int(trade["trade_id"]), price=Decimal(int(trade["price"])).scaleb(-8),
+              quantity=Decimal(int(trade["quantity"])).scaleb(-8), is_buyer_maker=bool(trade["is_buyer_maker"]),
+              trade_time=datetime.fromtimestamp(int(trade["trade_time"]) / 1000, tz=timezone.utc))
+        for trade in trades
+    ], batch_size=5000)
+
+
+def copy(records):
+    copy_trades([(SYMBOL, decode_trade_records(records))])
+
+
+def run(write, records, batch_size):
+    started = time.perf_counter()
+    for i in range(0, len(records), batch_size):
+        with transaction.atomic():
+            write(records[i:i + batch_size])
+    return len(records) / (time.perf_counter() - started)
+
+
+def main():
+    total, batch_size = [int(arg) for arg in sys.argv[1:]] + [200000, 50000][len(sys.argv) - 1:]
+    records = make_records(total)
+    print(f"{total} trades in batches of {batch_size}, {connection.vendor}")
+
+    started = time.perf_counter()
+    copy_rows([(SYMBOL, decode_trade_records(records))])
+    print(f"{'decode + COPY text':<24} {total / (time.perf_counter() - started):>12,.0f} rows/s (no database)")
+
+    methods = [("ORM bulk_create", orm)]
+    if connection.vendor == "postgresql":
+        methods += [("COPY", copy), ("COPY, all duplicates", copy)]
+    try:
+        for name, write in methods:
+            print(f"{name:<24} {run(write, records, batch_size):>12,.0f} rows/s")
+            if name == "ORM bulk_create":
+                Trade.objects.filter(symbol=SYMBOL).delete()
+    finally:
+        Trade.objects.filter(symbol=SYMBOL).delete()
+
+
+if __name__ == '__main__':
+    main()
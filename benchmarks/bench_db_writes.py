@@ -0,0 +1,86 @@
+"""
+Per-tick latency of writing closed bars to the database: one create() per row
+(the old aggregate_trades path) against bulk_create() in a single transaction.
+
+    python -m benchmarks.bench_db_writes [symbol counts...]
+
+Uses the database from the usual .env settings, rows are deleted after every run.
+"""
+import os
+import sys
+import time
+from datetime import timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeWS.settings')
+django.setup()
+
+from django.db import transaction  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from api.models import Trade, TickerAggregate  # noqa: E402
+
+REPEATS = 5
+
+
+def build_rows(symbols_count):
+    now = timezone.now()
+    aggregates = []
+    trades = []
+    for i in range(symbols_count):
+        symbol = f"BENCH{i}"
+        aggregates.append(TickerAggregate(
+            symbol=symbol,
+            start_time=now - timedelta(minutes=1),
+            end_time=now,
+            open_price=45000.1,
+            close_price=45100.2,
+            high_price=45200.3,
+            low_price=44900.4,
+            volume=12.345,
+            vwap=45050.5,
+            trade_count=1000,
+        ))
+        trades.append(Trade(symbol=symbol, price=45050.5, trade_time=now, quantity=12.345))
+    return aggregates, trades
+
+
+def per_row(aggregates, trades):
+    for aggregate, trade in zip(aggregates, trades):
+        aggregate.pk = None
+        aggregate.save()
+        trade.pk = None
+        trade.save()
+
+
+def bulk(aggregates, trades):
+    with transaction.atomic():
+        TickerAggregate.objects.bulk_create(aggregates)
+        Trade.objects.bulk_create(trades)
+
+
+def measure(write, symbols_count):
+    timings = []
+    for _ in range(REPEATS):
+        aggregates, trades = build_rows(symbols_count)
+        started = time.perf_counter()
+        write(aggregates, trades)
+        timings.append((time.perf_counter() - started) * 1000)
+
+        TickerAggregate.objects.filter(symbol__startswith="BENCH").delete()
+        Trade.objects.filter(symbol__startswith="BENCH").delete()
+    return min(timings)
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10, 100, 500, 1000]
+    print(f"{'symbols':>8} {'per-row ms':>12} {'bulk ms':>10} {'speedup':>8}")
+    for symbols_count in counts:
+        per_row_ms = measure(per_row, symbols_count)
+        bulk_ms = measure(bulk, symbols_count)
+        print(f"{symbols_count:>8} {per_row_ms:>12.1f} {bulk_ms:>10.1f} {per_row_ms / bulk_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Fan-out of one tick to WebSocket consumers: the old single "trades" group, where every client gets every symbol,
+against per-symbol groups, where a client only gets the symbols it subscribed to.
+Counts the channel layer messages, frames and bytes delivered and the time the channel layer needs to send and
+deliver them. Frames are encoded once by the sender (see bench_broadcast_cpu for the consumer side).
+The in-memory layer cleans up expired messages on every call, so its timings grow with the number of channels;
+frames and bytes do not depend on the layer.
+
+    python -m benchmarks.bench_fanout [clients] [symbols] [subscriptions per client]
+
+Uses an in-memory channel layer, --settings-layer uses CHANNEL_LAYERS from the settings (Redis).
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeWS.settings')
+django.setup()
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer  # noqa: E402
+
+from api.broadcast import ALL_BARS_GROUP, bar_group, send_bars  # noqa: E402
+from api.codecs import dumps  # noqa: E402
+from api.rollups import BASE_INTERVAL  # noqa: E402
+
+
+def make_frames(symbols_count):  # api.broadcast.bar_frames of a tick
+    return [
+        (f"SYM{i}USDT", BASE_INTERVAL, dumps({
+            "symbol": f"SYM{i}USDT", "open_price": "45000.1", "close_price": "45100.2", "high_price": "45200.3",
+            "low_price": "44900.4", "volume": "12.345", "interval": BASE_INTERVAL,
+        }))
+        for i in range(symbols_count)
+    ]
+
+
+async def run(channel_layer, frames, clients, subscriptions, per_symbol):
+    channels = [await channel_layer.new_channel() for _ in range(clients)]
+    expected = {}  # channel -> messages it will receive
+    for channel in channels:
+        if per_symbol:
+            for symbol, interval, _ in random.sample(frames, subscriptions):
+                await channel_layer.group_add(bar_group(symbol, interval), channel)
+            expected[channel] = subscriptions
+        else:
+            await channel_layer.group_add(ALL_BARS_GROUP, channel)
+            expected[channel] = 1
+
+    started = time.perf_counter()
+    if per_symbol:
+        await send_bars(channel_layer, frames)
+    else:  # the old broadcast: one batch to everybody
+        await channel_layer.group_send(ALL_BARS_GROUP, {
+            "type": "send_trade_batch", "symbols": [symbol for symbol, _, _ in frames],
+            "frames": [frame for _, _, frame in frames],
+        })
+
+    received = []
+    for channel, count in expected.items():
+        for _ in range(count):
+            message = await channel_layer.receive(channel)
+            received.append(message["frames"] if "frames" in message else [message["frame"]])
+    delivered = time.perf_counter()
+
+    size = sum(len(frame) for sent in received for frame in sent)  # what the consumers write to their sockets
+    return len(received), sum(len(sent) for sent in received), size, (delivered - started) * 1000
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    clients, symbols_count, subscriptions = [int(arg) for arg in args] + [1000, 500, 5][len(args):]
+    frames = make_frames(symbols_count)
+
+    def new_layer():
+        if "--settings-layer" in sys.argv:
+            return get_channel_layer()
+        return InMemoryChannelLayer(capacity=subscriptions + 10)
+
+    print(f"{clients} clients, {symbols_count} symbols, {subscriptions} subscriptions per client")
+    print(f"{'groups':<12} {'messages':>10} {'frames':>10} {'MB':>8} {'layer ms':>9}")
+    results = {}
+    for name, per_symbol in [("one group", False), ("per symbol", True)]:
+        results[name] = asyncio.run(run(new_layer(), frames, clients, subscriptions, per_symbol))
+        messages, delivered, size, layer_ms = results[name]
+        print(f"{name:<12} {messages:>10} {delivered:>10} {size / 1e6:>8.2f} {layer_ms:>9.1f}")
+    print(f"frames delivered: {results['one group'][1] / results['per symbol'][1]:.0f}x fewer with per-symbol groups")
+
+
+if __name__ == '__main__':
+    main()
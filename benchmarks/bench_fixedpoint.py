@@ -0,0 +1,88 @@
+"""
+Parsing and summing Binance price/quantity strings (volume and quote volume of a bar)
+with float, Decimal and the fixed-point integers of api.fixedpoint, in pure Python and NumPy.
+Error is measured against the exact Decimal result.
+
+    python -m benchmarks.bench_fixedpoint [trades]
+"""
+import sys
+import time
+from decimal import Decimal
+
+import numpy as np
+
+from api.fixedpoint import SCALE, to_scaled, from_scaled, mul_scaled, mul_scaled_array
+
+
+def make_trades(count):
+    rng = np.random.default_rng(42)
+    prices = 82_000 + rng.normal(0, 50, count).cumsum() / 100
+    quantities = rng.integers(1, 10 ** 7, count) / SCALE
+    return [(f"{price:.8f}", f"{quantity:.8f}") for price, quantity in zip(prices, quantities)]
+
+
+def with_float(trades):
+    volume = quote_volume = 0.0
+    for price, quantity in trades:
+        price, quantity = float(price), float(quantity)
+        volume += quantity
+        quote_volume += price * quantity
+    return Decimal(volume), Decimal(quote_volume)
+
+
+def with_decimal(trades):
+    volume = quote_volume = Decimal(0)
+    for price, quantity in trades:
+        price, quantity = Decimal(price), Decimal(quantity)
+        volume += quantity
+        quote_volume += price * quantity
+    return volume, quote_volume
+
+
+def with_scaled(trades):
+    volume = quote_volume = 0
+    for price, quantity in trades:
+        price, quantity = to_scaled(price), to_scaled(quantity)
+        volume += quantity
+        quote_volume += mul_scaled(price, quantity)
+    return from_scaled(volume), from_scaled(quote_volume)
+
+
+def with_float_array(arrays):
+    prices, quantities = arrays[0] / SCALE, arrays[1] / SCALE
+    return Decimal(quantities.sum()), Decimal((prices * quantities).sum())
+
+
+def with_scaled_array(arrays):
+    prices, quantities = arrays
+    return from_scaled(quantities.sum()), from_scaled(mul_scaled_array(prices, quantities).sum())
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    trades = make_trades(count)
+    arrays = (
+        np.array([to_scaled(price) for price, _ in trades], dtype=np.int64),
+        np.array([to_scaled(quantity) for _, quantity in trades], dtype=np.int64),
+    )
+    exact_volume, exact_quote = with_decimal(trades)
+
+    print(f"{count} trades")
+    print(f"{'method':<18} {'ms':>9} {'volume error':>14} {'quote volume error':>20}")
+    for name, func, data in [
+        ("float", with_float, trades),
+        ("Decimal", with_decimal, trades),
+        ("scaled int", with_scaled, trades),
+        ("numpy float64", with_float_array, arrays),
+        ("numpy scaled int", with_scaled_array, arrays),
+    ]:
+        started = time.perf_counter()
+        volume, quote_volume = func(data)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"{name:<18} {elapsed_ms:>9.1f} {abs(volume - exact_volume):>14.2E} "
+              f"{abs(quote_volume - exact_quote):>20.2E}")
+    print("scaled int quote volume is rounded down to 1E-8 per trade, so its error stays below trades * 1E-8")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Rows/sec of a /api/trades/ page: the ModelSerializer path (model instances, DRF fields, json)
+against the lean path (values_list tuples formatted per column) in every output format.
+Includes the database query, excludes HTTP.
+
+    python -m benchmarks.bench_history [page sizes...]
+
+Uses the database from the usual .env settings, rows are deleted afterwards.
+"""
+import os
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeWS.settings')
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api.models import TickerAggregate  # noqa: E402
+from api.renderers import HISTORY_RENDERERS  # noqa: E402
+from api.serializers import TickerAggregateSerializer, HistoryRows, HISTORY_FIELDS  # noqa: E402
+
+REPEATS = 5
+SYMBOL = "BENCH"
+
+
+def create_rows(count):
+    now = timezone.now()
+    TickerAggregate.objects.bulk_create([
+        TickerAggregate(
+            symbol=SYMBOL,
+            start_time=now - timedelta(minutes=i + 1),
+            end_time=now - timedelta(minutes=i),
+            open_price=Decimal('45000.12345678'),
+            close_price=Decimal('45100.2'),
+            high_price=Decimal('45200.3'),
+            low_price=Decimal('44900.4'),
+            volume=Decimal('12.345'),
+            buy_volume=Decimal('6.1'),
+            vwap=Decimal('45050.5123456789'),
+            trade_count=1000,
+        )
+        for i in range(count)
+    ])
+
+
+def page_queryset(count):
+    return TickerAggregate.objects.filter(symbol=SYMBOL).order_by('-start_time', '-id')[:count]
+
+
+def serializer_page(count):
+    data = {'next': None, 'previous': None, 'results': TickerAggregateSerializer(page_queryset(count), many=True).data}
+    return JSONRenderer().render(data)
+
+
+def lean_page(renderer):
+    def render(count):
+        rows = HistoryRows(list(page_queryset(count).values_list(*HISTORY_FIELDS, named=True)))
+        return renderer().render({'next': None, 'previous': None, 'results': rows})
+    return render
+
+
+def rows_per_second(render, count):
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        render(count)
+        timings.append(time.perf_counter() - started)
+    return count / min(timings)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000]
+    create_rows(max(sizes))
+    paths = [("serializer + json", serializer_page)] + [
+        (f"lean {renderer.format}", lean_page(renderer)) for renderer in HISTORY_RENDERERS if renderer.format != 'api'
+    ]
+    try:
+        print(f"{'rows':>6} {'path':<20} {'rows/sec':>12} {'speedup':>8}")
+        for count in sizes:
+            baseline = None
+            for name, render in paths:
+                speed = rows_per_second(render, count)
+                baseline = baseline or speed
+                print(f"{count:>6} {name:<20} {speed:>12,.0f} {speed / baseline:>7.1f}x")
+    finally:
+        TickerAggregate.objects.filter(symbol=SYMBOL).delete()
+
+
+if __name__ == '__main__':
+    main()
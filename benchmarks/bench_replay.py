@@ -0,0 +1,71 @@
+"""
+Trades/sec of replay_trades: synthetic daily trade archives (zipped CSV, one per day) are aggregated
+by one process and by a pool, then stored (base bars and rollups, one transaction per day).
+
+    python -m benchmarks.bench_replay [days] [trades per day] [workers]
+
+Uses the database from the usual .env settings, the bars of the BENCH symbol are deleted afterwards.
+"""
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime, timedelta, timezone
+
+import django
+import numpy as np
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeWS.settings')
+django.setup()
+
+from api.models import TickerAggregate  # noqa: E402
+from api.replay import aggregate_archive, find_archives, replay_archives, replay_intervals  # noqa: E402
+
+SYMBOL = "BENCH"
+
+
+def make_archives(directory, days, trades_per_day):
+    rng = np.random.default_rng(1)
+    for i in range(days):
+        day = date(2024, 1, 1) + timedelta(days=i)
+        start = int(datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc).timestamp() * 1000)
+        times = np.sort(rng.integers(start, start + 86400 * 1000, trades_per_day))
+        prices = 45000 + np.cumsum(rng.normal(0, 1, trades_per_day))
+        quantities = rng.integers(1, 10 ** 6, trades_per_day) / 10 ** 6
+        makers = np.where(rng.random(trades_per_day) < 0.5, "True", "False")
+        csv = "".join(
+            f"{trade_id},{price:.2f},{quantity:.8f},0,{trade_time},{maker},True\n"
+            for trade_id, price, quantity, trade_time, maker in zip(
+                range(trades_per_day), prices.tolist(), quantities.tolist(), times.tolist(), makers.tolist())
+        )
+        name = f"{SYMBOL}-trades-{day}"
+        with zipfile.ZipFile(f"{directory}/{name}.zip", "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(f"{name}.csv", csv)
+
+
+def main():
+    days, trades_per_day, workers = [int(arg) for arg in sys.argv[1:]] + [8, 1000000, os.cpu_count()][len(sys.argv) - 1:]
+    total = days * trades_per_day
+    with tempfile.TemporaryDirectory() as directory:
+        make_archives(directory, days, trades_per_day)
+        paths = find_archives([directory])
+        print(f"{days} days of {trades_per_day} trades, {workers} workers")
+
+        started = time.perf_counter()
+        aggregate_archive(paths[0], replay_intervals())
+        elapsed = time.perf_counter() - started
+        print(f"{'one file, one process':<28} {trades_per_day / elapsed:>12,.0f} trades/s")
+
+        try:
+            for name, pool_size in (("aggregate + store, 1 worker", 1), (f"aggregate + store, {workers} workers", workers)):
+                started = time.perf_counter()
+                replay_archives(paths, pool_size)
+                elapsed = time.perf_counter() - started
+                print(f"{name:<28} {total / elapsed:>12,.0f} trades/s, {elapsed:.1f}s")
+        finally:
+            TickerAggregate.objects.filter(symbol=SYMBOL).delete()
+
+
+if __name__ == '__main__':
+    main()